@@ -1,6 +1,7 @@
 import os
 import sqlite3
 import sys
+import zlib
 from pathlib import Path
 
 # Define database path
@@ -15,16 +16,101 @@ else:
     # Development mode
     DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'search_index.db')
 
-def get_db_connection():
-    """Create a database connection with row factory."""
-    conn = sqlite3.connect(DB_PATH, timeout=30.0)
+# zlib level for document text stored in the documents table
+CONTENT_COMPRESSION_LEVEL = 6
+
+def compress_text(text) -> bytes:
+    return zlib.compress((text or "").encode('utf-8'), CONTENT_COMPRESSION_LEVEL)
+
+def decompress_text(data) -> str:
+    if data is None:
+        return ""
+    return zlib.decompress(data).decode('utf-8')
+
+def get_db_connection(db_path: str = None):
+    """Create a database connection with row factory (db_path: a shard file, default the main database)."""
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=30.0)
     conn.row_factory = sqlite3.Row
+    # decompress(documents.content) -> text, evaluated only for the rows a query returns
+    conn.create_function("decompress", 1, decompress_text, deterministic=True)
     return conn
 
-def init_db():
-    """Initialize the database tables."""
-    print(f"Initializing database at: {DB_PATH}")
-    conn = get_db_connection()
+def create_documents_table(cursor):
+    """
+    Create the documents table. doc_id is AUTOINCREMENT so the id of a deleted
+    document is never handed out again: the semantic index (services/semantic_index.py)
+    keeps vectors by doc_id and only loads ids above the highest one it has seen.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS documents (
+        doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT NOT NULL,
+        title TEXT,
+        content BLOB,
+        keywords TEXT
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_path ON documents(file_path)")
+
+def create_fts_tables(cursor):
+    """
+    Create the contentless FTS5 tables (search_index, bigram_index and the
+    bigram vocabulary view). They store only the inverted index; the text
+    lives in the documents table (see services/document_store.py).
+    """
+    # Trigram tokenizer is good for substring matching
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            file_path UNINDEXED,
+            title,
+            content,
+            keywords,
+            tokenize = 'trigram',
+            content = ''
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Warning: FTS5 might not be supported or trigram tokenizer missing. Fallback to standard tokenizer. Error: {e}")
+        # Fallback to standard tokenizer if trigram is missing
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            file_path UNINDEXED,
+            title,
+            content,
+            keywords,
+            content = ''
+        )
+        ''')
+
+    # CJK bigram auxiliary index
+    # rowid is kept aligned with search_index; text is pre-split into CJK
+    # bigrams at index time so 1-2 character Chinese terms can MATCH
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS bigram_index USING fts5(
+        file_path UNINDEXED,
+        title,
+        content,
+        keywords,
+        tokenize = 'unicode61',
+        content = ''
+    )
+    ''')
+
+    # Vocabulary view over bigram_index (term, doc, cnt), used for spelling correction
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS bigram_vocab USING fts5vocab(bigram_index, row)
+    ''')
+
+def init_db(db_path: str = None):
+    """Initialize the database tables (of the main database, or of a shard file)."""
+    print(f"Initializing database at: {db_path or DB_PATH}")
+    conn = get_db_connection(db_path)
+    
+    # Free pages can be returned to the file system step by step (see
+    # services/maintenance.py); only takes effect for a new database file,
+    # existing ones switch on their next full VACUUM
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
     
     # Enable WAL mode for better concurrency (Search while Indexing)
     conn.execute("PRAGMA journal_mode=WAL;")
@@ -44,31 +130,100 @@ def init_db():
         file_size INTEGER,
         file_type TEXT,
         indexed_status INTEGER DEFAULT 0, -- 0: Pending, 1: Indexed, 2: Failed
-        error_message TEXT
+        error_message TEXT,
+        doc_id INTEGER -- rowid of the document in search_index
     )
     ''')
-    
-    # 2. FTS5 Search Index table
-    # Trigram tokenizer is good for substring matching
-    try:
-        cursor.execute('''
-        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
-            file_path UNINDEXED,
-            title,
-            content,
-            keywords,
-            tokenize = 'trigram'
-        )
-        ''')
-    except sqlite3.OperationalError as e:
-        print(f"Warning: FTS5 might not be supported or trigram tokenizer missing. Fallback to standard tokenizer. Error: {e}")
-        # Fallback to standard tokenizer if trigram is missing
+    # Databases created before doc_id existed (backfilled by Indexer.upgrade_index)
+    columns = [row['name'] for row in cursor.execute("PRAGMA table_info(files)")]
+    if 'doc_id' not in columns:
+        cursor.execute("ALTER TABLE files ADD COLUMN doc_id INTEGER")
+
+    # Indexes for metadata filters (file type / modified date / size) that
+    # are pushed into search queries
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_type_modified ON files(file_type, last_modified)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_modified ON files(last_modified)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_size ON files(file_size)")
+    # FTS rowid -> file metadata (the FTS tables store no file_path)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_doc_id ON files(doc_id)")
+
+    # 2. Document text, keyed by the search_index rowid. Content is zlib
+    # compressed (compress_text) and only decompressed for rows that need
+    # snippets; the FTS5 tables below keep no copy of the text
+    create_documents_table(cursor)
+
+    # 3. FTS5 search_index (trigram) and CJK bigram auxiliary index.
+    # Databases created before the documents table keep their old tables
+    # until Indexer.upgrade_index migrates them
+    create_fts_tables(cursor)
+
+    # Pinyin auxiliary index (full pinyin + initials of Hanzi runs)
+    # rowid is kept aligned with search_index; keywords stays empty and only
+    # keeps the column layout identical for bm25 weights and field filters
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS pinyin_index USING fts5(
+        file_path UNINDEXED,
+        title,
+        content,
+        keywords,
+        tokenize = 'trigram'
+    )
+    ''')
+
+    # 4. Location markers ([Page:3], [Slide:2], ...) with their character
+    # offsets in the document content, keyed by search_index rowid
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS doc_locations (
+        doc_id INTEGER NOT NULL,
+        offset INTEGER NOT NULL,
+        label TEXT NOT NULL,
+        PRIMARY KEY (doc_id, offset)
+    ) WITHOUT ROWID
+    ''')
+
+    # 5. Near-duplicate detection (see services/near_duplicates.py):
+    # MinHash signature and cluster of each search_index row, plus the LSH
+    # band buckets used to find candidate duplicates
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS doc_minhash (
+        doc_id INTEGER PRIMARY KEY,
+        signature BLOB NOT NULL,
+        cluster_id INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_doc_minhash_cluster ON doc_minhash(cluster_id)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS doc_lsh (
+        band INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        doc_id INTEGER NOT NULL,
+        PRIMARY KEY (band, bucket, doc_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_doc_lsh_doc ON doc_lsh(doc_id)")
+
+    # 6. AI query expansion cache (see services/ai_cache.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ai_cache (
+        key TEXT PRIMARY KEY,
+        query TEXT NOT NULL,
+        model TEXT,
+        base_url TEXT,
+        response TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_cache_created ON ai_cache(created_at)")
+
+    # 7. Shard catalog (main database only, see services/shards.py): roots
+    # whose documents live in their own database file
+    if db_path is None:
         cursor.execute('''
-        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
-            file_path UNINDEXED,
-            title,
-            content,
-            keywords
+        CREATE TABLE IF NOT EXISTS shards (
+            root TEXT PRIMARY KEY,
+            file_name TEXT NOT NULL,
+            attached INTEGER NOT NULL DEFAULT 1,
+            created_at REAL
         )
         ''')
 
@@ -0,0 +1,137 @@
+"""
+AI 查询扩展缓存
+- 扩展结果持久化在 SQLite (ai_cache 表)，键为 (查询, 提示词模板哈希, 模型, base_url)，
+  在 AI_CACHE_TTL 内命中时直接返回，不再请求远程服务
+- 同一个键的并发请求合并为一次上游调用 (其余请求等待同一个任务)；
+  发起请求的客户端断开不会取消其他请求正在等待的调用
+- 空结果 (调用失败或解析失败) 不缓存
+- 读写缓存表是同步的 SQLite I/O (索引器持有写锁时可能等待)，在线程池中执行，不阻塞事件循环
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from ..core.database import get_db_connection
+from .ai_client import AIClient, DEFAULT_EXPAND_PROMPT
+
+logger = logging.getLogger(__name__)
+
+AI_CACHE_TTL = 7 * 24 * 3600
+
+# 缓存条数上限，超出时删除最早的条目
+MAX_AI_CACHE_ENTRIES = 20000
+
+
+def _normalize_query(query: str) -> str:
+    return ' '.join((query or "").split())
+
+
+def expansion_key(query: str, prompt: Optional[str], model: str, base_url: str) -> str:
+    prompt_hash = hashlib.sha256((prompt or DEFAULT_EXPAND_PROMPT).encode('utf-8')).hexdigest()
+    raw = json.dumps([_normalize_query(query), prompt_hash, model, (base_url or "").rstrip('/')], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class AIExpansionCache:
+    def __init__(self, ttl: float = AI_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def get(self, key: str) -> Optional[List[str]]:
+        conn = get_db_connection()
+        try:
+            row = conn.execute(
+                "SELECT response FROM ai_cache WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row['response']) if row else None
+
+    def put(self, key: str, query: str, model: str, base_url: str, terms: List[str]):
+        now = time.time()
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, query, model, base_url, response, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, _normalize_query(query), model, base_url, json.dumps(terms, ensure_ascii=False), now)
+            )
+            conn.execute("DELETE FROM ai_cache WHERE created_at < ?", (now - self.ttl,))
+            conn.execute("""
+                DELETE FROM ai_cache WHERE key IN (
+                    SELECT key FROM ai_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (MAX_AI_CACHE_ENTRIES,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = get_db_connection()
+        try:
+            conn.execute("DELETE FROM ai_cache")
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def expand(self, client: AIClient, query: str, prompt: Optional[str] = None) -> tuple[List[str], bool]:
+        """
+        返回 (扩展词, 是否来自缓存)
+        未命中时同一个键只发起一次上游调用
+        """
+        key = expansion_key(query, prompt, client.model, client.base_url)
+        terms = await asyncio.to_thread(self.get, key)
+        if terms is not None:
+            self.hits += 1
+            return terms, True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(key, client, query, prompt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: 当前请求被取消时，共享的上游调用继续完成
+        return await asyncio.shield(task), False
+
+    async def _fetch(self, key: str, client: AIClient, query: str, prompt: Optional[str]) -> List[str]:
+        terms = await client.expand_query(query, prompt)
+        if terms:
+            try:
+                await asyncio.to_thread(self.put, key, query, client.model, client.base_url, terms)
+            except Exception as e:
+                logger.error(f"Failed to cache AI expansion: {e}")
+        return terms
+
+    def stats(self) -> dict:
+        conn = get_db_connection()
+        try:
+            entries = conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+        finally:
+            conn.close()
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._inflight),
+        }
+
+
+_ai_cache: Optional[AIExpansionCache] = None
+
+
+def get_ai_cache() -> AIExpansionCache:
+    global _ai_cache
+    if _ai_cache is None:
+        _ai_cache = AIExpansionCache()
+    return _ai_cache
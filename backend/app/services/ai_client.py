@@ -1,98 +1,344 @@
 import httpx
+import asyncio
 import logging
+import random
 import json
+import time
 import re
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Optional
+
+try:
+    import h2  # noqa: F401  (httpx 的 HTTP/2 支持需要 h2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# 进程共享的连接池 (保持长连接，省去每次请求的 DNS/TCP/TLS 握手)
+AI_MAX_CONNECTIONS = 20
+AI_MAX_KEEPALIVE_CONNECTIONS = 10
+AI_KEEPALIVE_EXPIRY = 60.0
+AI_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+# 每个服务商同时进行的请求数上限
+AI_MAX_CONCURRENT_PER_PROVIDER = 4
+
+# 429 / 5xx / 网络错误的重试: 指数退避 + 全抖动，Retry-After 优先
+AI_MAX_RETRIES = 3
+AI_BACKOFF_BASE = 0.5
+AI_BACKOFF_MAX = 8.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# 熔断: 连续失败 BREAKER_FAILURE_THRESHOLD 次后，BREAKER_RESET_TIMEOUT 秒内直接拒绝，
+# 之后放行一次试探请求，成功则恢复
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0
+
+# 查询扩展的默认提示词 ({{query}} 为搜索词占位符)
+DEFAULT_EXPAND_PROMPT = """你是一个专业的文档搜索助手。请为以下搜索关键词生成 3-5 个最相关的扩展词，帮助用户找到更多相关文档。
+
+搜索词：{{query}}
+
+扩展规则：
+1. 优先生成该词在**专业领域**中的同义词（如医学、统计、法律、金融等）
+2. 包含该词的**中英文对应词**
+3. 包含该词的**常见缩写或全称**
+4. 不要生成过于宽泛或偏离原意的词
+5. 不要包含原始搜索词本身
+
+示例：
+- "样本" → ["sample", "样本量", "sample size", "受试者", "n值"]
+- "随机" → ["randomization", "随机化", "random", "随机分配", "RCT"]
+- "盲法" → ["blinding", "双盲", "单盲", "double-blind", "设盲"]
+
+请只返回 JSON 数组格式，如 ["词1", "词2", "词3"]，不要其他解释。"""
+
+class CircuitOpenError(Exception):
+    """服务商熔断中，请求未发出"""
+
+
+class CircuitBreaker:
+    """单个服务商 (base_url) 的熔断器: closed -> open -> half-open -> closed"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_request(self) -> bool:
+        """放行或拒绝一次请求；返回 True 表示这是半开状态下的试探请求 (结束后须调用 end_trial)"""
+        state = self.state
+        if state == 'open' or (state == 'half-open' and self.trial_in_flight):
+            raise CircuitOpenError(
+                f"AI 服务连续失败，已暂停请求 (约 {self.reset_timeout:.0f} 秒后重试)"
+            )
+        if state == 'half-open':
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def end_trial(self):
+        """试探请求结束: 被取消或因其它异常中断时没有记录结果，释放试探名额，下一个请求重新试探"""
+        self.trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # 试探失败或达到阈值: (重新) 打开
+            self.opened_at = time.monotonic()
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+_breakers: Dict[str, CircuitBreaker] = {}
+_provider_slots: Dict[str, asyncio.Semaphore] = {}
+_max_concurrent_per_provider = AI_MAX_CONCURRENT_PER_PROVIDER
+
+
+def start_http_client(max_connections: int = AI_MAX_CONNECTIONS,
+                      max_keepalive_connections: int = AI_MAX_KEEPALIVE_CONNECTIONS,
+                      keepalive_expiry: float = AI_KEEPALIVE_EXPIRY,
+                      max_concurrent_per_provider: int = AI_MAX_CONCURRENT_PER_PROVIDER,
+                      timeout: httpx.Timeout = AI_TIMEOUT) -> httpx.AsyncClient:
+    """创建进程共享的 AsyncClient (在 FastAPI lifespan 中调用)；h2 已安装时启用 HTTP/2"""
+    global _http_client, _max_concurrent_per_provider
+    _max_concurrent_per_provider = max_concurrent_per_provider
+    _provider_slots.clear()
+    _http_client = httpx.AsyncClient(
+        timeout=timeout,
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+    )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """共享的 AsyncClient (未在 lifespan 中创建时按默认配置懒加载)"""
+    if _http_client is None or _http_client.is_closed:
+        start_http_client(max_concurrent_per_provider=_max_concurrent_per_provider)
+    return _http_client
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        breaker = _breakers[provider] = CircuitBreaker()
+    return breaker
+
+
+def _provider_slot(provider: str) -> asyncio.Semaphore:
+    slot = _provider_slots.get(provider)
+    if slot is None:
+        slot = _provider_slots[provider] = asyncio.Semaphore(_max_concurrent_per_provider)
+    return slot
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """第 attempt 次重试前的等待秒数: Retry-After (秒数或 HTTP 日期)，否则全抖动指数退避"""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), AI_BACKOFF_MAX)
+        except ValueError:
+            try:
+                return min(max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0), AI_BACKOFF_MAX)
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(AI_BACKOFF_MAX, AI_BACKOFF_BASE * (2 ** attempt)))
+
+
+def http_client_stats() -> dict:
+    return {
+        'started': _http_client is not None and not _http_client.is_closed,
+        'http2': HTTP2_AVAILABLE,
+        'breakers': {provider: {'state': b.state, 'failures': b.failures} for provider, b in _breakers.items()},
+    }
+
+
 class AIClient:
     def __init__(self, base_url: str, api_key: str, model: str = "gpt-3.5-turbo"):
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
         self.model = model
 
-    async def _call_api(self, messages: list, temperature: float = 0.3, max_tokens: int = 200) -> str:
-        """统一的 API 调用方法"""
+    async def _post_with_retries(self, url: str, payload: dict, headers: dict, stream: bool = False) -> httpx.Response:
+        """
+        经共享连接池发送请求: 429/5xx/网络错误退避重试，连续失败时熔断
+        stream=True 时只读取响应头，调用方负责 aclose()；重试只发生在收到响应头之前
+        """
+        breaker = get_breaker(self.base_url)
+        client = get_http_client()
+        for attempt in range(AI_MAX_RETRIES + 1):
+            trial = breaker.before_request()
+            response = None
+            try:
+                request = client.build_request("POST", url, json=payload, headers=headers)
+                response = await client.send(request, stream=stream)
+                if stream and response.status_code != 200:
+                    await response.aread()
+                    await response.aclose()
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                if attempt >= AI_MAX_RETRIES:
+                    raise Exception(f"无法连接 AI 服务: {e}") from e
+                logger.warning(f"AI request failed ({e!r}), retrying ({attempt + 1}/{AI_MAX_RETRIES})")
+            else:
+                if response.status_code == 200:
+                    breaker.record_success()
+                    return response
+                if response.status_code not in RETRYABLE_STATUS:
+                    # 其它 4xx 是请求或配置问题，服务本身可用
+                    breaker.record_success()
+                    logger.error(f"AI API Error: {response.text}")
+                    raise Exception(f"API 返回错误 {response.status_code}: {response.text[:200]}")
+                breaker.record_failure()
+                if attempt >= AI_MAX_RETRIES:
+                    logger.error(f"AI API Error: {response.text}")
+                    raise Exception(f"API 返回错误 {response.status_code}: {response.text[:200]}")
+                logger.warning(f"AI API returned {response.status_code}, retrying ({attempt + 1}/{AI_MAX_RETRIES})")
+            finally:
+                if trial:
+                    breaker.end_trial()
+            await asyncio.sleep(_retry_delay(attempt, response))
+
+    def _request(self, messages: list, temperature: float, max_tokens: int, stream: bool = False) -> tuple:
         if not self.base_url or not self.api_key:
             raise ValueError("AI Configuration (Base URL or API Key) is missing.")
-        
+
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
+
         payload = {
             "model": self.model,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens
         }
+        if stream:
+            payload["stream"] = True
 
-        url = f"{self.base_url}/chat/completions"
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            
-            if response.status_code != 200:
-                logger.error(f"AI API Error: {response.text}")
-                raise Exception(f"API 返回错误 {response.status_code}: {response.text[:200]}")
-            
-            data = response.json()
-            
-            # 尝试多种响应格式
-            # 标准 OpenAI 格式
-            if 'choices' in data and len(data['choices']) > 0:
-                choice = data['choices'][0]
-                if 'message' in choice:
-                    return choice['message'].get('content', '')
-                elif 'text' in choice:
-                    return choice['text']
-            
-            # 一些 API 直接返回 content
-            if 'content' in data:
-                return data['content']
-            
-            # 一些 API 返回 result
-            if 'result' in data:
-                return data['result']
-            
-            # 一些 API 返回 data.content
-            if 'data' in data:
-                if isinstance(data['data'], str):
-                    return data['data']
-                elif isinstance(data['data'], dict) and 'content' in data['data']:
-                    return data['data']['content']
-            
-            # 如果都没有，记录完整响应并抛出错误
-            logger.error(f"Unexpected API response format: {data}")
-            raise Exception(f"API 响应格式不兼容。响应: {str(data)[:300]}")
+        return f"{self.base_url}/chat/completions", payload, headers
 
-    async def expand_query(self, query: str, custom_prompt: str = None) -> list[str]:
-        """
-        使用 AI 扩展搜索查询，生成相关词和同义词
-        """
-        # 使用自定义 prompt 或默认 prompt
-        if custom_prompt:
-            # 替换 {{query}} 占位符
-            prompt = custom_prompt.replace("{{query}}", query)
-        else:
-            prompt = f"""你是一个专业的文档搜索助手。请为以下搜索关键词生成 3-5 个最相关的扩展词，帮助用户找到更多相关文档。
+    @staticmethod
+    def _parse_completion(data: dict) -> str:
+        # 尝试多种响应格式
+        # 标准 OpenAI 格式
+        if 'choices' in data and len(data['choices']) > 0:
+            choice = data['choices'][0]
+            if 'message' in choice:
+                return choice['message'].get('content', '')
+            elif 'text' in choice:
+                return choice['text']
 
-搜索词：{query}
+        # 一些 API 直接返回 content
+        if 'content' in data:
+            return data['content']
 
-扩展规则：
-1. 优先生成该词在**专业领域**中的同义词（如医学、统计、法律、金融等）
-2. 包含该词的**中英文对应词**
-3. 包含该词的**常见缩写或全称**
-4. 不要生成过于宽泛或偏离原意的词
-5. 不要包含原始搜索词本身
+        # 一些 API 返回 result
+        if 'result' in data:
+            return data['result']
 
-示例：
-- "样本" → ["sample", "样本量", "sample size", "受试者", "n值"]
-- "随机" → ["randomization", "随机化", "random", "随机分配", "RCT"]
-- "盲法" → ["blinding", "双盲", "单盲", "double-blind", "设盲"]
+        # 一些 API 返回 data.content
+        if 'data' in data:
+            if isinstance(data['data'], str):
+                return data['data']
+            elif isinstance(data['data'], dict) and 'content' in data['data']:
+                return data['data']['content']
 
-请只返回 JSON 数组格式，如 ["词1", "词2", "词3"]，不要其他解释。"""
+        # 如果都没有，记录完整响应并抛出错误
+        logger.error(f"Unexpected API response format: {data}")
+        raise Exception(f"API 响应格式不兼容。响应: {str(data)[:300]}")
+
+    @staticmethod
+    def _parse_stream_chunk(data: dict) -> str:
+        """OpenAI 兼容的流式分片: choices[0].delta.content (部分服务商用 text / message.content)"""
+        choices = data.get('choices') or []
+        if not choices:
+            return ''
+        choice = choices[0]
+        delta = choice.get('delta') or choice.get('message') or {}
+        return delta.get('content') or choice.get('text') or ''
+
+    async def _call_api(self, messages: list, temperature: float = 0.3, max_tokens: int = 200) -> str:
+        """统一的 API 调用方法"""
+        url, payload, headers = self._request(messages, temperature, max_tokens)
+        async with _provider_slot(self.base_url):
+            response = await self._post_with_retries(url, payload, headers)
+        return self._parse_completion(response.json())
+
+    async def _stream_api(self, messages: list, temperature: float = 0.3, max_tokens: int = 200) -> AsyncIterator[str]:
+        """
+        流式调用 (stream: true)，按到达顺序产出文本片段
+        服务商忽略 stream 参数、直接返回完整 JSON 时，整段作为一个片段产出
+        """
+        url, payload, headers = self._request(messages, temperature, max_tokens, stream=True)
+        # 整个流期间占用服务商的并发名额
+        async with _provider_slot(self.base_url):
+            response = await self._post_with_retries(url, payload, headers, stream=True)
+            try:
+                if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+                    await response.aread()
+                    text = self._parse_completion(response.json())
+                    if text:
+                        yield text
+                    return
+                async for line in response.aiter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    if not data:
+                        continue
+                    try:
+                        chunk = json.loads(data)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping malformed stream chunk: {data[:200]}")
+                        continue
+                    if chunk.get('error'):
+                        raise Exception(f"AI 服务返回错误: {str(chunk['error'])[:200]}")
+                    text = self._parse_stream_chunk(chunk)
+                    if text:
+                        yield text
+            finally:
+                await response.aclose()
+
+    async def expand_query(self, query: str, custom_prompt: str = None) -> list[str]:
+        """
+        使用 AI 扩展搜索查询，生成相关词和同义词
+        """
+        # 使用自定义 prompt 或默认 prompt，替换 {{query}} 占位符
+        prompt = (custom_prompt or DEFAULT_EXPAND_PROMPT).replace("{{query}}", query)
 
         try:
             messages = [
@@ -135,6 +381,14 @@ class AIClient:
         except Exception as e:
             return {"success": False, "message": str(e)}
 
+    @staticmethod
+    def _explain_messages(code_snippet: str, context: str) -> list:
+        prompt = f"请简要解释以下 {context} 代码的功能和逻辑：\n\n```\n{code_snippet}\n```"
+        return [
+            {"role": "system", "content": "You are a helpful coding assistant. Explain the code clearly in Chinese."},
+            {"role": "user", "content": prompt}
+        ]
+
     async def explain_code(self, code_snippet: str, context: str = "") -> str:
         """
         Send code snippet to AI API for explanation.
@@ -142,15 +396,15 @@ class AIClient:
         if not self.base_url or not self.api_key:
             return "Error: AI Configuration (Base URL or API Key) is missing."
 
-        prompt = f"请简要解释以下 {context} 代码的功能和逻辑：\n\n```\n{code_snippet}\n```"
-        
         try:
-            messages = [
-                {"role": "system", "content": "You are a helpful coding assistant. Explain the code clearly in Chinese."},
-                {"role": "user", "content": prompt}
-            ]
-            return await self._call_api(messages, max_tokens=500)
+            return await self._call_api(self._explain_messages(code_snippet, context), max_tokens=500)
         except Exception as e:
             logger.error(f"AI Request Failed: {e}")
             return f"Error: Request failed - {str(e)}"
 
+    async def explain_code_stream(self, code_snippet: str, context: str = "") -> AsyncIterator[str]:
+        """
+        流式解释代码，文本片段边生成边产出；失败时抛出异常 (由调用方转为错误帧)
+        """
+        async for text in self._stream_api(self._explain_messages(code_snippet, context), max_tokens=500):
+            yield text
@@ -0,0 +1,245 @@
+"""
+搜索框自动补全
+- 文件名 (含文件名中每个词/汉字位置开始的后缀以及拼音) 和 keywords 中的代码符号
+  存放在内存中的有序键数组里，前缀查询用二分查找定位区间
+- 高频词直接使用拼写纠错词表 (vocabulary.py) 中已排好序的词
+- 索引器在写入/删除文档时增量更新；批量删除后在后台整体重新加载，加载期间继续使用旧索引
+"""
+
+import re
+import heapq
+import threading
+import time
+import logging
+from bisect import bisect_left, insort
+from itertools import islice
+from typing import Dict, List, Optional
+
+from ..core.database import get_db_connection
+from .shards import attached_databases
+from .pinyin_index import to_pinyin_text
+from .vocabulary import get_vocabulary
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUGGESTION_LIMIT = 8
+
+# 文件名中的分词边界
+TITLE_SPLIT_PATTERN = re.compile(r'[\s_\-.,()\[\]{}【】（）]+')
+CJK_PATTERN = re.compile(r'[\u4e00-\u9fff]')
+
+# 同样命中时的类型优先级
+KIND_PRIORITY = {'filename': 2, 'symbol': 1, 'term': 0}
+KIND_SOURCES = {'filename': '文件名', 'symbol': '代码符号', 'term': '索引词'}
+
+# 词表中的词至少出现在这么多文档中才作为补全
+MIN_TERM_DOC_FREQ = 2
+
+# 短前缀 (或 "fenxi" 这类许多文件名共有的键) 可能命中大量条目，
+# 每次最多检查这么多条，保证每次按键都在几毫秒内返回
+MAX_SCAN_ENTRIES = 1000
+
+
+def _title_keys(title: str) -> List[str]:
+    """文件名的补全键: 全名、每个词开头的后缀、每个汉字开头的后缀、拼音全拼/首字母"""
+    lowered = title.lower()
+    keys = {lowered}
+    for m in TITLE_SPLIT_PATTERN.finditer(lowered):
+        if m.end() < len(lowered):
+            keys.add(lowered[m.end():])
+    for m in CJK_PATTERN.finditer(lowered):
+        keys.add(lowered[m.start():])
+    keys.update(to_pinyin_text(title).split())
+    return list(keys)
+
+
+class AutocompleteIndex:
+    """前缀键 -> {显示文本: (类型, 计数)}，键保存在有序数组中"""
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._entries: Dict[str, Dict[str, list]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _add(self, key: str, text: str, kind: str, keep_sorted: bool = True):
+        entries = self._entries.get(key)
+        if entries is None:
+            entries = self._entries[key] = {}
+            if keep_sorted:
+                insort(self._keys, key)
+        entry = entries.get(text)
+        if entry is None:
+            entries[text] = [kind, 1]
+        else:
+            entry[1] += 1
+
+    def _remove(self, key: str, text: str):
+        entries = self._entries.get(key)
+        if not entries or text not in entries:
+            return
+        entries[text][1] -= 1
+        if entries[text][1] <= 0:
+            del entries[text]
+        if not entries:
+            del self._entries[key]
+            idx = bisect_left(self._keys, key)
+            if idx < len(self._keys) and self._keys[idx] == key:
+                del self._keys[idx]
+
+    @staticmethod
+    def _document_items(title: str, keywords: str):
+        items = []
+        if title:
+            items.extend((key, title, 'filename') for key in _title_keys(title))
+        for symbol in set((keywords or "").split()):
+            items.append((symbol.lower(), symbol, 'symbol'))
+        return items
+
+    def add_document(self, title: str, keywords: str):
+        with self._lock:
+            for key, text, kind in self._document_items(title, keywords):
+                self._add(key, text, kind)
+
+    def remove_document(self, title: str, keywords: str):
+        with self._lock:
+            for key, text, _ in self._document_items(title, keywords):
+                self._remove(key, text)
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_SUGGESTION_LIMIT) -> List[dict]:
+        """
+        返回以 prefix 开头的补全，按 (从开头匹配, 计数, 类型, 长度) 排序
+        [{'text', 'type', 'source', 'count'}, ...]
+        """
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        candidates = {}
+        with self._lock:
+            scanned = 0
+            for idx in range(bisect_left(self._keys, prefix), len(self._keys)):
+                key = self._keys[idx]
+                if not key.startswith(prefix) or scanned >= MAX_SCAN_ENTRIES:
+                    break
+                for text, (kind, count) in islice(self._entries[key].items(), MAX_SCAN_ENTRIES - scanned):
+                    scanned += 1
+                    from_start = text.lower().startswith(prefix)
+                    current = candidates.get(text)
+                    if current is None or (from_start, count) > (current[1], current[2]):
+                        candidates[text] = (kind, from_start, count)
+
+        vocabulary = get_vocabulary()
+        terms = vocabulary.sorted_terms
+        start = bisect_left(terms, prefix)
+        for idx in range(start, min(start + MAX_SCAN_ENTRIES, len(terms))):
+            term = terms[idx]
+            if not term.startswith(prefix):
+                break
+            doc_freq = vocabulary.doc_freq[term]
+            if doc_freq >= MIN_TERM_DOC_FREQ and term not in candidates:
+                candidates[term] = ('term', True, doc_freq)
+
+        best = heapq.nlargest(
+            limit, candidates.items(),
+            key=lambda item: (item[1][1], item[1][2], KIND_PRIORITY[item[1][0]], -len(item[0]))
+        )
+        return [
+            {'text': text, 'type': kind, 'source': KIND_SOURCES[kind], 'count': count}
+            for text, (kind, _, count) in best
+        ]
+
+    @classmethod
+    def load(cls, connections) -> "AutocompleteIndex":
+        """从各库 (主库和分片) 的 documents 表加载"""
+        index = cls()
+        # 批量加载时先收集键，最后统一排序一次
+        for conn in connections:
+            for row in conn.execute("SELECT title, keywords FROM documents"):
+                for key, text, kind in cls._document_items(row['title'], row['keywords']):
+                    index._add(key, text, kind, keep_sorted=False)
+        index._keys = sorted(index._entries)
+        return index
+
+
+_autocomplete: Optional[AutocompleteIndex] = None
+_autocomplete_lock = threading.Lock()
+_first_load_lock = threading.Lock()
+# 批量删除后索引已过期 / 后台重新加载正在进行
+_stale = False
+_reloading = False
+
+
+def _load_autocomplete() -> Optional[AutocompleteIndex]:
+    """从数据库加载新的补全索引；失败时返回 None"""
+    start = time.perf_counter()
+    connections = [get_db_connection(db_path) for db_path in attached_databases()]
+    try:
+        index = AutocompleteIndex.load(connections)
+    except Exception as e:
+        logger.error(f"Failed to load autocomplete index: {e}")
+        return None
+    finally:
+        for conn in connections:
+            conn.close()
+    logger.info(f"Loaded autocomplete index: {len(index)} keys in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return index
+
+
+def get_autocomplete() -> AutocompleteIndex:
+    """返回补全索引；批量删除后在后台重新加载，期间返回旧索引"""
+    global _autocomplete
+    index = _autocomplete
+    if index is not None:
+        return index
+    with _first_load_lock:
+        if _autocomplete is None:
+            # 第一次加载没有旧索引可用，在当前线程加载 (启动时已在后台预加载)
+            index = _load_autocomplete()
+            if index is None:
+                return AutocompleteIndex()
+            with _autocomplete_lock:
+                _autocomplete = index
+        return _autocomplete
+
+
+def loaded_autocomplete() -> Optional[AutocompleteIndex]:
+    """已加载的补全索引 (未加载时返回 None，供索引器增量更新)"""
+    global _stale
+    with _autocomplete_lock:
+        # 重新加载期间的增量更新只作用于旧索引，新索引加载完成后需要再加载一次
+        if _reloading:
+            _stale = True
+        return _autocomplete
+
+
+def _reload():
+    global _autocomplete, _stale, _reloading
+    try:
+        while True:
+            with _autocomplete_lock:
+                _stale = False
+            index = _load_autocomplete()
+            with _autocomplete_lock:
+                if index is not None:
+                    _autocomplete = index
+                # 加载期间索引又有变化时再加载一次
+                if not _stale:
+                    return
+    finally:
+        with _autocomplete_lock:
+            _reloading = False
+
+
+def invalidate_autocomplete():
+    """批量删除/清空索引后调用: 在后台重新加载 (连续多次调用合并为一次加载)"""
+    global _stale, _reloading
+    with _autocomplete_lock:
+        if _autocomplete is None:
+            return
+        _stale = True
+        if _reloading:
+            return
+        _reloading = True
+    threading.Thread(target=_reload, name='autocomplete-reload', daemon=True).start()
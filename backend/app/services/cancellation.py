@@ -0,0 +1,129 @@
+"""
+搜索取消与时间预算
+- CancellationToken: 单次搜索的取消标记和截止时间；通过 SQLite progress handler
+  和 interrupt() 中止正在执行的语句
+- SearchRegistry: 按 request_id 取消搜索；同一 group 中新的搜索会取代 (取消) 旧的搜索
+"""
+
+import threading
+import time
+from typing import Optional
+
+# SQLite 每执行多少条虚拟机指令检查一次取消标记
+PROGRESS_HANDLER_STEPS = 1000
+
+# 未指定时的默认时间预算 (毫秒)
+DEFAULT_SEARCH_TIMEOUT_MS = 30000
+
+
+class SearchCancelled(Exception):
+    """搜索被取消或超出时间预算"""
+
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(f"Search {reason}")
+        self.reason = reason
+
+
+class CancellationToken:
+    def __init__(self, timeout_ms: Optional[int] = None, request_id: Optional[str] = None, group: Optional[str] = None):
+        self.request_id = request_id
+        self.group = group
+        self.deadline = time.monotonic() + timeout_ms / 1000 if timeout_ms else None
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._connections = set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            # 可能在 progress handler 中调用，这里只做标记，由 handler 返回值中止语句
+            self._mark("timed out")
+            return True
+        return False
+
+    def _mark(self, reason: str) -> bool:
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            return True
+
+    def cancel(self, reason: str = "cancelled"):
+        """标记取消并中断所有关联连接上正在执行的语句"""
+        if not self._mark(reason):
+            return
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.interrupt()
+            except Exception:
+                pass
+
+    def check(self):
+        """已取消时抛出 SearchCancelled"""
+        if self.cancelled:
+            raise SearchCancelled(self.reason)
+
+    def attach(self, conn):
+        """关联数据库连接：progress handler 在取消或超时后让 SQLite 中止当前语句"""
+        with self._lock:
+            self._connections.add(conn)
+        conn.set_progress_handler(lambda: 1 if self.cancelled else 0, PROGRESS_HANDLER_STEPS)
+
+    def detach(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+        try:
+            conn.set_progress_handler(None, 0)
+        except Exception:
+            pass
+
+
+class SearchRegistry:
+    """正在执行的搜索登记表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_group = {}
+
+    def register(self, request_id: Optional[str] = None, group: Optional[str] = None,
+                 timeout_ms: Optional[int] = DEFAULT_SEARCH_TIMEOUT_MS) -> CancellationToken:
+        token = CancellationToken(timeout_ms, request_id, group)
+        superseded = None
+        with self._lock:
+            if group:
+                superseded = self._by_group.get(group)
+                self._by_group[group] = token
+            if request_id:
+                self._by_id[request_id] = token
+        if superseded is not None:
+            superseded.cancel("superseded")
+        return token
+
+    def cancel(self, request_id: str) -> bool:
+        with self._lock:
+            token = self._by_id.get(request_id)
+        if token is None:
+            return False
+        token.cancel()
+        return True
+
+    def release(self, token: CancellationToken):
+        with self._lock:
+            if token.request_id and self._by_id.get(token.request_id) is token:
+                del self._by_id[token.request_id]
+            if token.group and self._by_group.get(token.group) is token:
+                del self._by_group[token.group]
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._by_id)
+
+
+search_registry = SearchRegistry()
@@ -0,0 +1,70 @@
+"""
+CJK 二元分词 (bigram) 辅助索引
+trigram 分词器无法 MATCH 少于 3 个字符的词，这里在索引时把中文连续片段
+切分为重叠的二元词 (bigram)，片段末尾再补一个单字 (unigram)，
+写入 unicode61 分词的辅助 FTS5 表，使 1-2 个汉字的查询也能走索引。
+
+例: "样本量计算" -> "样本 本量 量计 计算 算"
+"""
+
+import re
+
+CJK_RUN_PATTERN = re.compile(r'[\u4e00-\u9fff]+')
+# unicode61 会把下划线等符号视为分隔符，这里按相同规则切分非中文部分
+WORD_PATTERN = re.compile(r'[^\W_]+')
+
+
+def _run_to_bigrams(run: str) -> list[str]:
+    """中文片段 -> 重叠二元词 + 末尾单字"""
+    tokens = [run[i:i + 2] for i in range(len(run) - 1)]
+    tokens.append(run[-1])
+    return tokens
+
+
+def to_bigram_text(text: str) -> str:
+    """
+    将原始文本转换为辅助索引使用的文本
+    中文片段替换为二元词序列，非中文部分保持原样交给 unicode61 分词
+    """
+    if not text:
+        return ""
+    return CJK_RUN_PATTERN.sub(lambda m: f" {' '.join(_run_to_bigrams(m.group()))} ", text)
+
+
+def bigram_match_expr(term: str) -> str:
+    """
+    为单个查询词生成辅助索引的 FTS5 MATCH 表达式
+    - 单个汉字: 前缀查询 "c"* (匹配以该字开头的二元词或片段末尾单字)
+    - 两个及以上汉字: 二元词短语 "ab bc ..."
+    - 非中文单词: 前缀查询 "word"*
+    各部分之间为 AND 关系
+    """
+    parts = []
+    pos = 0
+    for m in CJK_RUN_PATTERN.finditer(term):
+        parts.extend(f'"{w}"*' for w in WORD_PATTERN.findall(term[pos:m.start()]))
+        run = m.group()
+        if len(run) == 1:
+            parts.append(f'"{run}"*')
+        else:
+            bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+            parts.append(f'"{" ".join(bigrams)}"')
+        pos = m.end()
+    parts.extend(f'"{w}"*' for w in WORD_PATTERN.findall(term[pos:]))
+    return " AND ".join(parts)
+
+
+def bigram_phrase(term: str) -> str:
+    """
+    生成单个 FTS5 短语 (用于引号短语和 NEAR)
+    中文片段展开为二元词，单字片段保留单字，非中文单词保持不变
+    """
+    tokens = []
+    pos = 0
+    for m in CJK_RUN_PATTERN.finditer(term):
+        tokens.extend(WORD_PATTERN.findall(term[pos:m.start()]))
+        run = m.group()
+        tokens.extend([run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)])
+        pos = m.end()
+    tokens.extend(WORD_PATTERN.findall(term[pos:]))
+    return f'"{" ".join(tokens)}"' if tokens else ""
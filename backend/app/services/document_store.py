@@ -0,0 +1,147 @@
+"""
+文档原文存储
+- search_index (trigram) 和 bigram_index 以 contentless 方式建立 (content='')，只保存倒排索引，
+  不再各自保存一份原文
+- 原文保存在 documents 表 (doc_id 即两个 FTS 表的 rowid)，正文按文档用 zlib 压缩；
+  只有需要生成摘要、正则验证等真正读取正文的命中文档才解压 (SQL 函数 decompress)
+- contentless 表删除行时必须提供写入时的原值 (FTS5 'delete' 命令)，
+  这里从 documents 表取回原文重新生成；因此 to_bigram_text 的输出变化时需要重建索引
+- pinyin_index 默认只含标题，仍保存自己的内容，可直接按 rowid 删除
+- doc_id 为 AUTOINCREMENT，删除的文档 id 不会再分配给新文档 (语义索引按 doc_id 保存向量)
+"""
+
+import os
+import logging
+from typing import Iterable, List
+
+from ..core.database import compress_text, decompress_text, create_fts_tables, create_documents_table
+from .cjk_bigram import to_bigram_text
+
+logger = logging.getLogger(__name__)
+
+# 迁移旧数据库时每批写入的文档数
+MIGRATION_BATCH_SIZE = 500
+
+
+def insert_document(cursor, file_path: str, title: str, content: str, keywords: str) -> int:
+    """写入原文和 trigram 索引，返回 doc_id (bigram / 拼音行由索引器按同一 rowid 写入)"""
+    cursor.execute(
+        "INSERT INTO documents (file_path, title, content, keywords) VALUES (?, ?, ?, ?)",
+        (file_path, title, compress_text(content), keywords)
+    )
+    doc_id = cursor.lastrowid
+    cursor.execute("""
+        INSERT INTO search_index (rowid, file_path, title, content, keywords)
+        VALUES (?, ?, ?, ?, ?)
+    """, (doc_id, file_path, title, content, keywords))
+    return doc_id
+
+
+def insert_bigrams(cursor, doc_id: int, file_path: str, title: str, content: str, keywords: str):
+    """写入 CJK bigram 行 (rowid 与 search_index 相同)"""
+    cursor.execute("""
+        INSERT INTO bigram_index (rowid, file_path, title, content, keywords)
+        VALUES (?, ?, ?, ?, ?)
+    """, (doc_id, file_path, to_bigram_text(title), to_bigram_text(content), to_bigram_text(keywords)))
+
+
+def remove_documents(cursor, doc_ids: Iterable[int]):
+    """从 search_index、bigram_index 和 documents 中删除文档 (派生表由调用方清理)"""
+    for doc_id in doc_ids:
+        row = cursor.execute(
+            "SELECT file_path, title, content, keywords FROM documents WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        if row is None:
+            continue
+        file_path, title, keywords = row[0], row[1], row[3]
+        content = decompress_text(row[2])
+        cursor.execute("""
+            INSERT INTO search_index (search_index, rowid, file_path, title, content, keywords)
+            VALUES ('delete', ?, ?, ?, ?, ?)
+        """, (doc_id, file_path, title, content, keywords))
+        if cursor.execute("SELECT 1 FROM bigram_index WHERE rowid = ?", (doc_id,)).fetchone():
+            cursor.execute("""
+                INSERT INTO bigram_index (bigram_index, rowid, file_path, title, content, keywords)
+                VALUES ('delete', ?, ?, ?, ?, ?)
+            """, (doc_id, file_path, to_bigram_text(title), to_bigram_text(content), to_bigram_text(keywords)))
+        cursor.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+
+def documents_under(cursor, path: str) -> List[int]:
+    """文件 path 或目录 path 下的文档 doc_id (按路径分隔符划分，/a/study1 不包含 /a/study10)"""
+    return [row[0] for row in cursor.execute(
+        "SELECT doc_id FROM documents WHERE file_path = ? OR file_path LIKE ?", under_params(path)
+    )]
+
+
+def under_params(path: str) -> tuple:
+    """WHERE file_path = ? OR file_path LIKE ? 的参数: path 本身或其下的路径"""
+    return path, path.rstrip(os.sep) + os.sep + '%'
+
+
+def clear_documents(cursor):
+    cursor.execute("INSERT INTO search_index (search_index) VALUES ('delete-all')")
+    cursor.execute("INSERT INTO bigram_index (bigram_index) VALUES ('delete-all')")
+    cursor.execute("DELETE FROM documents")
+
+
+def is_contentless(cursor) -> bool:
+    row = cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'search_index'").fetchone()
+    return row is not None and "content = ''" in row[0]
+
+
+def migrate_to_contentless(cursor) -> int:
+    """
+    把旧数据库 (FTS5 表各自保存原文) 迁移为 documents 表 + contentless FTS5 表
+    rowid 保持不变，doc_locations / doc_minhash / files.doc_id 等派生数据无需重建
+    返回迁移的文档数；调用方提交后应 VACUUM 以回收空间
+    """
+    cursor.execute("ALTER TABLE search_index RENAME TO search_index_old")
+    cursor.execute("DROP TABLE IF EXISTS bigram_vocab")
+    cursor.execute("DROP TABLE IF EXISTS bigram_index")
+    create_fts_tables(cursor)
+
+    connection = cursor.connection
+    reader = connection.execute("SELECT rowid, file_path, title, content, keywords FROM search_index_old")
+    count = 0
+    while True:
+        rows = reader.fetchmany(MIGRATION_BATCH_SIZE)
+        if not rows:
+            break
+        for doc_id, file_path, title, content, keywords in rows:
+            cursor.execute(
+                "INSERT INTO documents (doc_id, file_path, title, content, keywords) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, file_path, title, compress_text(content), keywords)
+            )
+            cursor.execute("""
+                INSERT INTO search_index (rowid, file_path, title, content, keywords)
+                VALUES (?, ?, ?, ?, ?)
+            """, (doc_id, file_path, title, content, keywords))
+            insert_bigrams(cursor, doc_id, file_path, title, content, keywords)
+        count += len(rows)
+    cursor.execute("DROP TABLE search_index_old")
+    logger.info(f"Moved {count} documents to compressed storage with contentless FTS tables.")
+    return count
+
+
+def has_autoincrement(cursor) -> bool:
+    row = cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'documents'").fetchone()
+    return row is not None and 'AUTOINCREMENT' in row[0].upper()
+
+
+def migrate_to_autoincrement(cursor) -> int:
+    """
+    把旧数据库的 documents 表 (doc_id 可能复用已删除的最大 id) 改为 AUTOINCREMENT
+    doc_id 保持不变，FTS 表和派生数据无需重建；返回迁移的文档数
+    """
+    cursor.execute("DROP INDEX IF EXISTS idx_documents_path")
+    cursor.execute("ALTER TABLE documents RENAME TO documents_old")
+    create_documents_table(cursor)
+    cursor.execute("""
+        INSERT INTO documents (doc_id, file_path, title, content, keywords)
+        SELECT doc_id, file_path, title, content, keywords FROM documents_old
+    """)
+    count = cursor.rowcount
+    cursor.execute("DROP TABLE documents_old")
+    logger.info(f"Moved {count} documents to a table that never reuses document ids.")
+    return count
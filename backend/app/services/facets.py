@@ -0,0 +1,82 @@
+"""
+搜索结果分面统计与分面过滤
+- 分面: 文件类型 (files.file_type)、所属根目录 (搜索范围或顶层目录)、修改年份
+- 统计在一条 SQL 中完成: 匹配集合 JOIN files 后按 (类型, 根目录, 年份) 分组，
+  各维度的计数在内存中由分组结果汇总 (分片的分组结果合并后一起汇总)
+- 计数采用多选分面的惯例: 某一维度的计数只应用其它维度的已选条件，
+  因此同一维度内可以继续多选
+- 已选的分面作为过滤条件下推到检索 SQL 中 (见 filters.py)
+"""
+
+import re
+from typing import Dict, List, Optional
+
+from .filters import SearchFilters, YEAR_SQL
+
+FACET_DIMENSIONS = ('file_type', 'root', 'year')
+
+# 每个分面返回的取值数上限
+MAX_FACET_VALUES = 20
+
+# 顶层目录: \\server\share、C:\Projects、/data
+ROOT_PATTERN = re.compile(r'^(?:[\\/]{2}[^\\/]+[\\/][^\\/]+|[A-Za-z]:[\\/][^\\/]+|[\\/][^\\/]+)(?=[\\/])')
+
+
+def path_root(file_path: str, scopes: Optional[List[str]] = None) -> Optional[str]:
+    """
+    文件所属的根目录: 有搜索范围时为包含该文件的 (最长的) 范围路径，
+    否则为顶层目录
+    """
+    if not file_path:
+        return None
+    if scopes:
+        lowered = file_path.lower()
+        for scope in sorted(scopes, key=len, reverse=True):
+            if lowered.startswith(scope.lower()):
+                return scope
+        return None
+    m = ROOT_PATTERN.match(file_path)
+    if m:
+        return m.group(0)
+    return re.split(r'[\\/](?=[^\\/]*$)', file_path)[0] or file_path
+
+
+def empty_facets() -> Dict[str, List[dict]]:
+    return {dimension: [] for dimension in FACET_DIMENSIONS}
+
+
+def facet_groups(conn, match_sql: str, params: list, scopes: Optional[List[str]] = None) -> List[tuple]:
+    """
+    匹配集合按 (类型, 根目录, 年份) 分组的计数 -> [(file_type, root, year, count), ...]
+    match_sql: 返回匹配文档 doc_id 的查询 (含搜索范围和非分面的过滤条件，不含已选分面)
+    """
+    conn.create_function('path_root', 1, lambda p: path_root(p, scopes), deterministic=True)
+    return [tuple(row) for row in conn.execute(f"""
+        SELECT f.file_type AS file_type, path_root(f.file_path) AS root,
+               {YEAR_SQL.format(column='f.last_modified')} AS year, COUNT(*) AS count
+        FROM ({match_sql}) m
+        JOIN files f ON f.doc_id = m.doc_id
+        GROUP BY 1, 2, 3
+    """, tuple(params))]
+
+
+def summarize_facets(groups: List[tuple], filters: Optional[SearchFilters] = None) -> Dict[str, List[dict]]:
+    """
+    分组计数 (可来自多个库，见 facet_groups) -> 各维度的计数
+    返回: {'file_type': [{'value', 'count'}, ...], 'root': [...], 'year': [...]}
+    """
+    filters = filters or SearchFilters()
+    facets = {}
+    for index, dimension in enumerate(FACET_DIMENSIONS):
+        counts = {}
+        for group in groups:
+            value = group[index]
+            if value is None or not filters.accepts(dimension, group[0], group[1], group[2]):
+                continue
+            counts[value] = counts.get(value, 0) + group[3]
+        if dimension == 'year':
+            ordered = sorted(counts.items(), key=lambda item: -item[0])
+        else:
+            ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        facets[dimension] = [{'value': value, 'count': count} for value, count in ordered[:MAX_FACET_VALUES]]
+    return facets
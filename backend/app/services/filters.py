@@ -0,0 +1,138 @@
+"""
+元数据过滤 (文件类型、修改时间、文件大小、所属目录)
+- 过滤条件编译为 files 表上可走索引的谓词 (file_type / last_modified / file_size)，
+  以非相关子查询的形式下推到 FTS 检索 SQL 中: 子查询只执行一次，得到 files.doc_id
+  (即 search_index 的 rowid) 集合，匹配行按整数 rowid 判断，且只对通过过滤的行计算得分
+- 修改年份转换为 last_modified 的时间区间，同样可以使用索引
+- 所属目录同样在 files 表上判断 (FTS 表是 contentless 的，不保存 file_path)
+"""
+
+import time
+from datetime import datetime
+from typing import List, Optional, Union
+
+# 年份按本地时间计算，与文件管理器中显示的修改时间一致
+YEAR_SQL = "CAST(strftime('%Y', {column}, 'unixepoch', 'localtime') AS INTEGER)"
+
+
+class FilterError(ValueError):
+    """过滤参数无效"""
+
+
+def parse_timestamp(value: Union[str, float, int, None]) -> Optional[float]:
+    """
+    修改时间参数: Unix 时间戳或 ISO 日期 ("2025-01-01" / "2025-01-01T08:00")，
+    不带时区的日期按本地时间解释
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise FilterError(f"Invalid date: {value!r} (expected YYYY-MM-DD or a Unix timestamp)")
+
+
+def year_range(year: int) -> tuple[float, float]:
+    """本地时间 year 年的 [开始, 结束) 时间戳"""
+    start = time.mktime((year, 1, 1, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((year + 1, 1, 1, 0, 0, 0, 0, 0, -1))
+    return start, end
+
+
+class SearchFilters:
+    """
+    搜索过滤条件 (同一维度内为 OR，不同维度之间为 AND)
+    modified_after / modified_before: 时间戳或 ISO 日期，区间为 [after, before)
+    min_size / max_size: 字节数，闭区间
+    """
+
+    def __init__(self, file_types: Optional[List[str]] = None, folders: Optional[List[str]] = None,
+                 years: Optional[List[int]] = None, modified_after=None, modified_before=None,
+                 min_size: Optional[int] = None, max_size: Optional[int] = None):
+        self.file_types = sorted({t.lower().lstrip('.') for t in file_types or [] if t})
+        self.folders = [f for f in folders or [] if f]
+        self.years = sorted({int(y) for y in years or []})
+        self.modified_after = parse_timestamp(modified_after)
+        self.modified_before = parse_timestamp(modified_before)
+        self.min_size = min_size
+        self.max_size = max_size
+        if (self.modified_after is not None and self.modified_before is not None
+                and self.modified_after > self.modified_before):
+            raise FilterError("modified_after is later than modified_before")
+        if min_size is not None and max_size is not None and min_size > max_size:
+            raise FilterError("min_size is larger than max_size")
+
+    def has_metadata(self) -> bool:
+        """是否有需要查询 files 表的条件"""
+        return bool(self.file_types or self.years or self.modified_after is not None
+                    or self.modified_before is not None or self.min_size is not None
+                    or self.max_size is not None)
+
+    def __bool__(self):
+        return bool(self.folders) or self.has_metadata()
+
+    def __repr__(self):
+        return (f"SearchFilters(file_types={self.file_types}, folders={self.folders}, years={self.years}, "
+                f"modified=[{self.modified_after}, {self.modified_before}), size=[{self.min_size}, {self.max_size}])")
+
+    def metadata_sql(self) -> tuple[str, list]:
+        """files 表上的过滤谓词 (file_type / last_modified / file_size 均有索引)"""
+        conditions = []
+        params = []
+        if self.file_types:
+            conditions.append(f"file_type IN ({','.join('?' * len(self.file_types))})")
+            params.extend(self.file_types)
+        if self.modified_after is not None:
+            conditions.append("last_modified >= ?")
+            params.append(self.modified_after)
+        if self.modified_before is not None:
+            conditions.append("last_modified < ?")
+            params.append(self.modified_before)
+        if self.years:
+            ranges = [year_range(year) for year in self.years]
+            conditions.append("(" + " OR ".join("(last_modified >= ? AND last_modified < ?)" for _ in ranges) + ")")
+            for start, end in ranges:
+                params.extend((start, end))
+        if self.min_size is not None:
+            conditions.append("file_size >= ?")
+            params.append(self.min_size)
+        if self.max_size is not None:
+            conditions.append("file_size <= ?")
+            params.append(self.max_size)
+        return " AND ".join(conditions), params
+
+    def conditions(self) -> tuple[list, list]:
+        """files 表上的全部过滤谓词 (元数据 + 所属目录)，由调用方以 AND 连接"""
+        conditions = []
+        params = []
+        if self.has_metadata():
+            metadata_sql, metadata_params = self.metadata_sql()
+            conditions.append(metadata_sql)
+            params.extend(metadata_params)
+        if self.folders:
+            conditions.append("(" + " OR ".join("LOWER(file_path) LIKE ?" for _ in self.folders) + ")")
+            params.extend(f"{folder.lower()}%" for folder in self.folders)
+        return conditions, params
+
+    def accepts(self, dimension: str, file_type, root, year) -> bool:
+        """分面分组 (file_type, root, year) 是否满足除 dimension 之外的已选分面"""
+        if dimension != 'file_type' and self.file_types and file_type not in self.file_types:
+            return False
+        if dimension != 'root' and self.folders and root not in self.folders:
+            return False
+        if dimension != 'year' and self.years and year not in self.years:
+            return False
+        return True
+
+    def without_facets(self) -> "SearchFilters":
+        """只保留非分面条件 (时间区间、大小)，分面计数在此基础上统计"""
+        filters = SearchFilters(min_size=self.min_size, max_size=self.max_size)
+        filters.modified_after = self.modified_after
+        filters.modified_before = self.modified_before
+        return filters
@@ -1,36 +1,24 @@
 """
 模糊搜索引擎模块 (Ported from V2.1)
-支持拼音搜索、容错搜索和智能匹配
+支持容错搜索和同义词扩展 (内置少量同义词 + 用户的离线领域词库，见 thesaurus.py)
+拼音搜索由索引时生成的 pinyin_index 完成 (见 pinyin_index.py)
 """
 
 import re
 from typing import List, Dict, Tuple, Any, Optional
 
-try:
-    import pypinyin
-    PYPINYIN_AVAILABLE = True
-except ImportError:
-    PYPINYIN_AVAILABLE = False
-    print("警告: pypinyin库未安装，拼音搜索功能将不可用")
+from .vocabulary import get_vocabulary
+from .thesaurus import get_thesaurus, thesaurus_generation
+from .memo import LRUMemo
+
+# 查询扩展结果缓存，key 含词表版本，索引变化后旧结果自然失效
+_expansion_memo = LRUMemo('query_expansion', 2048)
 
 class FuzzySearchEngine:
-    """模糊搜索引擎，支持拼音搜索、容错搜索和智能匹配"""
+    """模糊搜索引擎，支持容错搜索和同义词扩展"""
     
     def __init__(self):
-        self.common_errors = {
-            # 常见的拼写错误映射
-            'excel': ['execl', 'exel', 'exle'],
-            'word': ['wrod', 'wrold', 'worrd'],
-            'powerpoint': ['ppt', 'pptx', 'powerpiont'],
-            'document': ['doc', 'docx', 'documnet'],
-            'presentation': ['pres', 'presen', 'presn'],
-            'spreadsheet': ['spread', 'spredsheet', 'sprd'],
-            '文档': ['文件', '档案', '文本'],
-            '表格': ['表单', '工作表', '电子表格'],
-            '幻灯片': ['演示文稿', '演示', 'PPT'],
-        }
-        
-        # 同义词映射
+        # 内置同义词映射 (领域词库见 thesaurus.py)
         self.synonyms = {
             'excel': ['表格', '工作表', 'xls', 'xlsx', '电子表格'],
             'word': ['文档', 'doc', 'docx', '文本'],
@@ -42,63 +30,35 @@ class FuzzySearchEngine:
             '幻灯片': ['powerpoint', 'ppt', 'pptx', '演示文稿'],
         }
     
-    def text_to_pinyin(self, text: str) -> str:
-        """将中文文本转换为拼音"""
-        if not PYPINYIN_AVAILABLE:
-            return text
-        
-        try:
-            # 转换为拼音，不带声调
-            pinyin_list = pypinyin.lazy_pinyin(text, style=pypinyin.NORMAL)
-            return ''.join(pinyin_list)
-        except Exception as e:
-            print(f"拼音转换错误: {str(e)}")
-            return text
-    
-    def get_pinyin_variations(self, text: str) -> List[str]:
-        """获取文本的拼音变体"""
-        if not PYPINYIN_AVAILABLE:
-            return [text]
-        
-        variations = [text]
-        
-        # 如果文本包含中文字符，添加拼音变体
-        if re.search(r'[\u4e00-\u9fff]', text):
-            pinyin = self.text_to_pinyin(text)
-            if pinyin != text:
-                variations.append(pinyin)
-                
-                # 添加首字母缩写
-                initials = ''.join([p[0] if p else '' for p in pypinyin.lazy_pinyin(text, style=pypinyin.NORMAL)])
-                if initials:
-                    variations.append(initials)
-        
-        return variations
-    
     def expand_query(self, query: str) -> List[str]:
-        """扩展查询词：包括同义词、拼音变体等"""
+        """扩展查询词：包括纠错、同义词 (按加入顺序返回，纠错词在前)"""
         query = query.lower().strip()
-        expanded_terms = {query}
+        vocabulary = get_vocabulary()
+        return list(_expansion_memo.get_or_compute(
+            (query, vocabulary.generation, thesaurus_generation()), lambda: self._expand_terms(query, vocabulary)
+        ))
+    
+    def _expand_terms(self, query: str, vocabulary) -> tuple:
+        # dict 保持插入顺序，纠错结果的频率排序不会被打乱
+        expanded_terms = {query: None}
         
-        # 1. 常见错误纠正
-        for correct, errors in self.common_errors.items():
-            if query in errors:
-                expanded_terms.add(correct)
+        # 1. 拼写纠错 (基于索引词表，按编辑距离和文档频率排序)
+        expanded_terms.update(dict.fromkeys(vocabulary.corrections(query)))
         
         # 2. 同义词扩展
         # 先检查原始查询
         if query in self.synonyms:
-            expanded_terms.update(self.synonyms[query])
+            expanded_terms.update(dict.fromkeys(self.synonyms[query]))
         
         # 再检查纠正后的词
         current_terms = list(expanded_terms)
         for term in current_terms:
             if term in self.synonyms:
-                expanded_terms.update(self.synonyms[term])
-                
-        # 3. 拼音扩展 (仅当查询包含中文时)
-        if re.search(r'[\u4e00-\u9fff]', query):
-            variations = self.get_pinyin_variations(query)
-            expanded_terms.update(variations)
-            
-        return list(expanded_terms)
+                expanded_terms.update(dict.fromkeys(self.synonyms[term]))
+
+        # 3. 领域词库 (同义词、缩写)
+        thesaurus = get_thesaurus()
+        for term in current_terms:
+            expanded_terms.update(dict.fromkeys(t.lower() for t in thesaurus.expand(term)))
+
+        return tuple(expanded_terms)
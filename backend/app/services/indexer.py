@@ -3,27 +3,62 @@ import time
 import logging
 from ..core.database import get_db_connection
 from .parser_factory import ParserFactory
+from . import document_store
+from .pinyin_index import to_pinyin_text, PYPINYIN_AVAILABLE, PINYIN_INDEX_CONTENT
+from .snippets import extract_locations
+from . import near_duplicates
+from .vocabulary import invalidate_vocabulary
+from .autocomplete import loaded_autocomplete, invalidate_autocomplete
+from .path_index import loaded_path_index, invalidate_path_index
+from .semantic_index import loaded_semantic_index, invalidate_semantic_index, maybe_rebuild_semantic_index
+from .maintenance import note_activity
+from . import shards
+from .shards import ShardDetached
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Version of the derived index data (bigram rows, location offsets, files.doc_id,
+# MinHash signatures, compressed document storage) stored in PRAGMA user_version;
+# bump when older databases need a backfill
+INDEX_DATA_VERSION = 4
+
 class Indexer:
-    def __init__(self):
-        pass
+    def __init__(self, db_path: str = None):
+        # db_path: write every document into this shard file (used while building
+        # a shard); by default each file goes to the database of its shard, or the
+        # main database (see shards.py)
+        self.db_path = db_path
+
+    def _database_for(self, path: str):
+        """Database file for path (None: main database); raises ShardDetached."""
+        if self.db_path is not None:
+            return self.db_path
+        return shards.database_for(path)
 
     def clear_all(self):
-        """Clear all indexed data."""
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("DELETE FROM search_index")
-            cursor.execute("DELETE FROM files")
-            conn.commit()
-            logger.info("Index cleared.")
-        except Exception as e:
-            logger.error(f"Failed to clear index: {e}")
-        finally:
-            conn.close()
+        """Clear all indexed data (main database and attached shards)."""
+        databases = [self.db_path] if self.db_path is not None else shards.attached_databases()
+        for db_path in databases:
+            conn = get_db_connection(db_path)
+            cursor = conn.cursor()
+            try:
+                document_store.clear_documents(cursor)
+                cursor.execute("DELETE FROM pinyin_index")
+                cursor.execute("DELETE FROM doc_locations")
+                cursor.execute("DELETE FROM doc_minhash")
+                cursor.execute("DELETE FROM doc_lsh")
+                cursor.execute("DELETE FROM files")
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Failed to clear index: {e}")
+            finally:
+                conn.close()
+        invalidate_vocabulary()
+        invalidate_autocomplete()
+        invalidate_path_index()
+        invalidate_semantic_index()
+        logger.info("Index cleared.")
 
     def index_path(self, path: str):
         """
@@ -34,23 +69,29 @@ class Indexer:
             logger.error(f"Path not found: {path}")
             return
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        if os.path.isfile(path):
-            logger.info(f"Indexing single file: {path}")
-            try:
-                if self._needs_indexing(cursor, path):
-                    self._index_file(cursor, path)
-                    conn.commit()
-            except Exception as e:
-                logger.error(f"Failed to index {path}: {e}")
-                self._mark_failed(cursor, path, str(e))
-                conn.commit() # Ensure error status is saved
-        else:
+        if not os.path.isfile(path):
             self.index_folder(path)
-        
-        conn.close()
+            return
+
+        logger.info(f"Indexing single file: {path}")
+        try:
+            db_path = self._database_for(path)
+        except ShardDetached as e:
+            logger.warning(f"Skipping {path}: {e}")
+            return
+        conn = get_db_connection(db_path)
+        cursor = conn.cursor()
+        try:
+            if self._needs_indexing(cursor, path):
+                self._index_file(cursor, path, db_path)
+                conn.commit()
+                invalidate_vocabulary()
+        except Exception as e:
+            logger.error(f"Failed to index {path}: {e}")
+            self._mark_failed(cursor, path, str(e))
+            conn.commit() # Ensure error status is saved
+        finally:
+            conn.close()
 
     def index_folder(self, folder_path: str):
         """
@@ -64,27 +105,47 @@ class Indexer:
 
         logger.info(f"Starting index for: {folder_path}")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
+        # One connection per database the files are routed to (the folder may
+        # contain shard roots)
+        connections = {}
         count = 0
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                
-                # 1. Check if file needs indexing (modified time)
-                if self._needs_indexing(cursor, file_path):
+        main_count = 0
+        try:
+            for root, _, files in os.walk(folder_path):
+                for file in files:
+                    file_path = os.path.join(root, file)
                     try:
-                        self._index_file(cursor, file_path)
-                        count += 1
-                        if count % 10 == 0:
-                            conn.commit() # Commit every 10 files
-                    except Exception as e:
-                        logger.error(f"Failed to index {file_path}: {e}")
-                        self._mark_failed(cursor, file_path, str(e))
-        
-        conn.commit()
-        conn.close()
+                        db_path = self._database_for(file_path)
+                    except ShardDetached:
+                        continue
+                    if db_path not in connections:
+                        connections[db_path] = get_db_connection(db_path)
+                    conn = connections[db_path]
+                    cursor = conn.cursor()
+                    
+                    # 1. Check if file needs indexing (modified time)
+                    if self._needs_indexing(cursor, file_path):
+                        try:
+                            self._index_file(cursor, file_path, db_path)
+                            count += 1
+                            if db_path is None:
+                                main_count += 1
+                            if count % 10 == 0:
+                                for conn in connections.values():
+                                    conn.commit() # Commit every 10 files
+                        except Exception as e:
+                            logger.error(f"Failed to index {file_path}: {e}")
+                            self._mark_failed(cursor, file_path, str(e))
+            
+            for conn in connections.values():
+                conn.commit()
+        finally:
+            for conn in connections.values():
+                conn.close()
+        if count:
+            invalidate_vocabulary()
+        if main_count:
+            maybe_rebuild_semantic_index()
         logger.info(f"Indexing complete. Indexed {count} files.")
 
     def _needs_indexing(self, cursor, file_path: str) -> bool:
@@ -109,13 +170,14 @@ class Indexer:
             # New file
             return True
 
-    def _index_file(self, cursor, file_path: str):
-        """Parse file and update database."""
+    def _index_file(self, cursor, file_path: str, db_path: str = None):
+        """Parse file and update database (db_path: the shard the cursor belongs to)."""
         parser = ParserFactory.get_parser(file_path)
         if not parser:
             return # Unsupported type
 
         logger.info(f"Indexing: {file_path}")
+        note_activity()
         
         # 1. Parse content
         content, keywords = parser.parse(file_path)
@@ -140,19 +202,234 @@ class Indexer:
             """, (stat.st_mtime, stat.st_size, file_type, file_path))
             
             # Update FTS index (Delete then Insert is safer for FTS)
-            cursor.execute("DELETE FROM search_index WHERE file_path = ?", (file_path,))
+            self._remove_document(cursor, file_path, db_path)
         else:
             # Insert new
             cursor.execute("""
                 INSERT INTO files (file_path, last_modified, file_size, file_type, indexed_status)
                 VALUES (?, ?, ?, ?, 1)
             """, (file_path, stat.st_mtime, stat.st_size, file_type))
+            self._add_to_path_index(file_path)
             
-        # 3. Insert into FTS index
+        # 3. Insert into FTS index (text goes to the compressed documents table)
+        doc_id = document_store.insert_document(cursor, file_path, file_name, content, keywords)
+        cursor.execute("UPDATE files SET doc_id = ? WHERE file_path = ?", (doc_id, file_path))
+        # A shard being built is not searched yet; the caches reload after the switch
+        autocomplete = loaded_autocomplete() if self.db_path is None else None
+        if autocomplete is not None:
+            autocomplete.add_document(file_name, keywords)
+        # The semantic index covers the main database only (doc_ids are per database)
+        semantic_index = loaded_semantic_index() if db_path is None else None
+        if semantic_index is not None:
+            semantic_index.add_document(doc_id, file_name, content)
+        document_store.insert_bigrams(cursor, doc_id, file_path, file_name, content, keywords)
+        self._insert_pinyin(cursor, doc_id, file_path, file_name, content)
+        self._insert_locations(cursor, doc_id, content)
+        near_duplicates.add_document(cursor, doc_id, content)
+
+    def _remove_document(self, cursor, file_path: str, db_path: str = None):
+        """Delete a document from search_index and its derived rows."""
+        cursor.execute("SELECT doc_id AS rowid, title, keywords FROM documents WHERE file_path = ?", (file_path,))
+        rows = cursor.fetchall()
+        autocomplete = loaded_autocomplete() if self.db_path is None else None
+        if autocomplete is not None:
+            for row in rows:
+                autocomplete.remove_document(row['title'], row['keywords'])
+        semantic_index = loaded_semantic_index() if db_path is None else None
+        if semantic_index is not None:
+            for row in rows:
+                semantic_index.remove_document(row['rowid'])
+        doc_ids = [(row['rowid'],) for row in rows]
+        cursor.executemany("DELETE FROM doc_locations WHERE doc_id = ?", doc_ids)
+        near_duplicates.remove_documents(cursor, [row['rowid'] for row in rows])
+        cursor.executemany("DELETE FROM pinyin_index WHERE rowid = ?", doc_ids)
+        document_store.remove_documents(cursor, [row['rowid'] for row in rows])
+
+    def _add_to_path_index(self, file_path: str):
+        if self.db_path is not None:
+            return
+        path_index = loaded_path_index()
+        if path_index is not None:
+            path_index.add(file_path)
+
+    def _insert_pinyin(self, cursor, rowid: int, file_path: str, title: str, content: str):
+        """Insert the pinyin row (title, and content when enabled), sharing the rowid of search_index."""
+        if not PYPINYIN_AVAILABLE:
+            return
         cursor.execute("""
-            INSERT INTO search_index (file_path, title, content, keywords)
-            VALUES (?, ?, ?, ?)
-        """, (file_path, file_name, content, keywords))
+            INSERT INTO pinyin_index (rowid, file_path, title, content, keywords)
+            VALUES (?, ?, ?, ?, '')
+        """, (rowid, file_path, to_pinyin_text(title), to_pinyin_text(content) if PINYIN_INDEX_CONTENT else ""))
+
+    def _insert_locations(self, cursor, doc_id: int, content: str):
+        """Store location marker offsets used to place snippets."""
+        cursor.executemany(
+            "INSERT OR REPLACE INTO doc_locations (doc_id, offset, label) VALUES (?, ?, ?)",
+            [(doc_id, offset, label) for offset, label in extract_locations(content)]
+        )
+
+    def upgrade_index(self):
+        """Build derived rows for documents indexed by an older version (main database and attached shards)."""
+        for db_path in shards.attached_databases():
+            self._upgrade_database(db_path)
+
+    def _upgrade_database(self, db_path: str = None):
+        conn = get_db_connection(db_path)
+        cursor = conn.cursor()
+        try:
+            # Text stored inside the FTS5 tables by older versions moves to the
+            # compressed documents table (rowids are kept)
+            migrated = False
+            if not document_store.is_contentless(cursor):
+                document_store.migrate_to_contentless(cursor)
+                migrated = True
+            # doc_id 曾会复用已删除的最大 id，磁盘上的语义索引可能把旧向量对应到新文档
+            reused_ids = False
+            if not document_store.has_autoincrement(cursor):
+                document_store.migrate_to_autoincrement(cursor)
+                reused_ids = True
+
+            # Bigram rows missing for documents indexed before bigram_index existed
+            cursor.execute("""
+                SELECT doc_id AS rowid, file_path, title, decompress(content) AS content, keywords FROM documents
+                WHERE doc_id NOT IN (SELECT rowid FROM bigram_index)
+            """)
+            rows = cursor.fetchall()
+            for row in rows:
+                document_store.insert_bigrams(cursor, row['rowid'], row['file_path'], row['title'], row['content'], row['keywords'])
+            if rows:
+                logger.info(f"Backfilled bigram index for {len(rows)} files.")
+
+            if PYPINYIN_AVAILABLE:
+                cursor.execute("""
+                    SELECT doc_id AS rowid, file_path, title, decompress(content) AS content FROM documents
+                    WHERE doc_id NOT IN (SELECT rowid FROM pinyin_index)
+                """)
+                rows = cursor.fetchall()
+                for row in rows:
+                    self._insert_pinyin(cursor, row['rowid'], row['file_path'], row['title'], row['content'])
+                if rows:
+                    logger.info(f"Backfilled pinyin index for {len(rows)} files.")
+
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                cursor.execute("DELETE FROM doc_locations")
+                cursor.execute("SELECT doc_id AS rowid, decompress(content) AS content FROM documents")
+                for row in cursor.fetchall():
+                    self._insert_locations(cursor, row['rowid'], row['content'])
+                logger.info("Backfilled snippet location offsets.")
+            if version < 2:
+                cursor.execute("SELECT doc_id AS rowid, file_path FROM documents")
+                cursor.executemany(
+                    "UPDATE files SET doc_id = ? WHERE file_path = ?",
+                    [(row['rowid'], row['file_path']) for row in cursor.fetchall()]
+                )
+                logger.info("Backfilled document ids of indexed files.")
+            if version < 3:
+                cursor.execute("DELETE FROM doc_minhash")
+                cursor.execute("DELETE FROM doc_lsh")
+                cursor.execute("SELECT doc_id AS rowid, decompress(content) AS content FROM documents")
+                for row in cursor.fetchall():
+                    near_duplicates.add_document(cursor, row['rowid'], row['content'])
+                logger.info("Backfilled near-duplicate signatures.")
+
+            cursor.execute(f"PRAGMA user_version = {INDEX_DATA_VERSION}")
+            conn.commit()
+            if reused_ids and db_path is None:
+                invalidate_semantic_index()
+            if migrated:
+                # 回收旧表中原文占用的空间，同时改为 incremental vacuum
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+        except Exception as e:
+            logger.error(f"Failed to upgrade index: {e}")
+        finally:
+            conn.close()
+
+    def remove_path(self, path: str) -> int:
+        """
+        Remove the indexed files under path and return how many were removed.
+        Shards rooted at or below path are dropped as a whole (their files are deleted).
+        """
+        path = os.path.normpath(os.path.abspath(path))
+        count = 0
+        for shard in shards.get_shards():
+            if shards.is_under(shard.root, path):
+                if shard.attached and os.path.exists(shard.db_path):
+                    count += self._file_count(shard.db_path)
+                shards.drop_shard(shard.root)
+        try:
+            count += self._remove_under(self._database_for(path), path)
+        except ShardDetached as e:
+            logger.warning(f"Not removing {path}: {e}")
+        invalidate_vocabulary()
+        invalidate_autocomplete()
+        path_index = loaded_path_index()
+        if path_index is not None:
+            path_index.remove(path)
+            path_index.remove_prefix(path.rstrip(os.sep) + os.sep)
+        return count
+
+    def _file_count(self, db_path: str = None) -> int:
+        conn = get_db_connection(db_path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _remove_under(self, db_path: str, path: str) -> int:
+        """Delete the file path, or the documents under the folder path, from one database."""
+        conn = get_db_connection(db_path)
+        cursor = conn.cursor()
+        try:
+            where = "file_path = ? OR file_path LIKE ?"
+            params = document_store.under_params(path)
+            count = cursor.execute(f"SELECT COUNT(*) FROM files WHERE {where}", params).fetchone()[0]
+            cursor.execute(f"DELETE FROM files WHERE {where}", params)
+            
+            doc_ids = document_store.documents_under(cursor, path)
+            semantic_index = loaded_semantic_index() if db_path is None else None
+            if semantic_index is not None:
+                for doc_id in doc_ids:
+                    semantic_index.remove_document(doc_id)
+            
+            # search_index / bigram_index 的原文在 documents 表中
+            params = [(doc_id,) for doc_id in doc_ids]
+            for table in ("doc_locations", "doc_lsh", "doc_minhash"):
+                cursor.executemany(f"DELETE FROM {table} WHERE doc_id = ?", params)
+            cursor.executemany("DELETE FROM pinyin_index WHERE rowid = ?", params)
+            document_store.remove_documents(cursor, doc_ids)
+            conn.commit()
+            return count
+        finally:
+            conn.close()
+
+    def build_shard(self, root: str):
+        """
+        Index root into a new shard file, then switch the shard catalog to it
+        (see shards.py). Searches keep reading the previous data (the old shard
+        file, or the main database) until the switch; documents of root left in
+        the main database are removed afterwards.
+        """
+        root = shards.normalize_root(root)
+        db_path = shards.new_shard_file(root)
+        conn = get_db_connection(db_path)
+        conn.execute(f"PRAGMA user_version = {INDEX_DATA_VERSION}")
+        conn.commit()
+        conn.close()
+        start = time.perf_counter()
+        try:
+            Indexer(db_path).index_folder(root)
+        except Exception:
+            shards.remove_shard_file(db_path)
+            raise
+        shards.swap_shard(root, db_path)
+        moved = self._remove_under(None, root)
+        invalidate_vocabulary()
+        invalidate_autocomplete()
+        invalidate_path_index()
+        logger.info(f"Built shard for {root} in {time.perf_counter() - start:.1f}s "
+                    f"({moved} files moved out of the main database)")
 
     def _mark_failed(self, cursor, file_path: str, error_msg: str):
         """Mark file as failed in database."""
@@ -174,3 +451,4 @@ class Indexer:
                 INSERT INTO files (file_path, last_modified, file_size, indexed_status, error_message)
                 VALUES (?, ?, ?, 2, ?)
             """, (file_path, lm, sz, error_msg))
+             self._add_to_path_index(file_path)
@@ -0,0 +1,329 @@
+"""
+索引维护
+- 长期增量更新后 FTS5 段数增多，删除留下的墓碑要到段合并时才清除；删除索引后空闲页留在
+  数据库文件中，文件不会缩小。两者都会让查询逐渐变慢
+- 后台线程每 CHECK_INTERVAL 秒检查一次，只在空闲时 (IDLE_SECONDS 内没有请求、没有正在执行的
+  搜索和索引) 执行；每轮最多 MAINTENANCE_TIME_BUDGET 秒，期间有新请求时在当前步骤完成后停止，
+  剩余的工作留到下一轮:
+  1. FTS5 'merge': 段数超过 MAX_SEGMENTS 的表分步合并为一个段 (每步 MERGE_PAGES 页并提交，
+     不长时间占用写锁)
+  2. 还没有统计信息或 files 行数与统计时相差一倍以上时 ANALYZE，否则每 OPTIMIZE_INTERVAL
+     执行一次 PRAGMA optimize (由 SQLite 判断哪些表需要重新统计)
+  3. incremental vacuum: 空闲页超过 VACUUM_MIN_FREE_MB 时分步归还给文件系统，并截断 WAL 文件
+- 手动触发 (POST /index/maintenance) 不检查空闲和阈值；full=True 时不限时间，各 FTS 表执行
+  'optimize'，未启用 incremental vacuum 的旧数据库执行一次完整 VACUUM 并改为增量回收
+- 主库和各个已挂载的分片依次维护，共用同一轮的时间预算
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, List, Optional
+
+from ..core import database
+from .cancellation import search_registry
+from .shards import attached_databases
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLES = ('search_index', 'bigram_index', 'pinyin_index')
+
+# 后台检查间隔和判定空闲的时长 (秒)
+CHECK_INTERVAL = 60
+IDLE_SECONDS = 120
+
+# 自动维护每轮的时间预算 (秒)
+MAINTENANCE_TIME_BUDGET = 5.0
+
+# FTS5 自动合并 (automerge) 后每层仍会留下几个段，超过该数量才合并
+MAX_SEGMENTS = 8
+# 每步 'merge' 写入的页数，一步约 20ms
+MERGE_PAGES = 256
+
+OPTIMIZE_INTERVAL = 6 * 3600
+# files 行数变为统计时的 1/2 以下或 2 倍以上时重新 ANALYZE
+STATS_DRIFT_FACTOR = 2
+# ANALYZE 每个索引最多抽样的行数，限制大库上的统计耗时
+ANALYSIS_LIMIT = 1000
+
+VACUUM_MIN_FREE_MB = 8
+# 每步 incremental vacuum 释放的页数
+VACUUM_PAGES = 2048
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+_last_activity = time.monotonic()
+
+
+def note_activity():
+    """记录一次搜索 / 索引活动 (维护任务避开这些时段)"""
+    global _last_activity
+    _last_activity = time.monotonic()
+
+
+def idle_seconds() -> float:
+    return time.monotonic() - _last_activity
+
+
+def is_idle() -> bool:
+    return search_registry.active_count() == 0 and idle_seconds() >= IDLE_SECONDS
+
+
+def segment_count(conn, table: str) -> int:
+    """FTS5 表当前的段数 (%_idx 影子表中每个段至少一行)"""
+    return conn.execute(f"SELECT COUNT(DISTINCT segid) FROM {table}_idx").fetchone()[0]
+
+
+def _stats_stale(conn) -> bool:
+    """files 表的行数与上次 ANALYZE 时的估计值相差 STATS_DRIFT_FACTOR 倍以上"""
+    # stat 列以行数开头 ('2581 1')
+    analyzed_rows = conn.execute(
+        "SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = 'files'"
+    ).fetchone()[0] or 0
+    rows = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+    return max(rows, 1) > max(analyzed_rows, 1) * STATS_DRIFT_FACTOR or \
+        max(analyzed_rows, 1) > max(rows, 1) * STATS_DRIFT_FACTOR
+
+
+def index_health(conn, db_path: Optional[str] = None) -> dict:
+    """conn 与 db_path 指向同一个库 (None 为主库)"""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    wal_path = (db_path or database.DB_PATH) + '-wal'
+    analyzed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None
+    return {
+        'segments': {table: segment_count(conn, table) for table in FTS_TABLES},
+        'size_mb': round(page_count * page_size / 1024 / 1024, 2),
+        'free_mb': round(free_pages * page_size / 1024 / 1024, 2),
+        'wal_mb': round(os.path.getsize(wal_path) / 1024 / 1024, 2) if os.path.exists(wal_path) else 0,
+        'auto_vacuum': AUTO_VACUUM_MODES.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 'none'),
+        'analyzed': analyzed,
+        'stats_stale': not analyzed or _stats_stale(conn),
+    }
+
+
+class IndexMaintenance:
+    """维护任务的调度和执行 (同一时间只执行一轮)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # 各库 (None 为主库) 上次 analyze 的时间
+        self._last_optimize = {}
+        self.runs = 0
+        self.last_result: Optional[dict] = None
+
+    def _optimize_due(self, db_path: Optional[str]) -> bool:
+        last = self._last_optimize.get(db_path)
+        return last is None or time.monotonic() - last >= OPTIMIZE_INTERVAL
+
+    def pending(self, health: dict, force: bool = False, db_path: Optional[str] = None) -> List[str]:
+        """需要在该库上执行的维护步骤"""
+        steps = []
+        max_segments = 1 if force else MAX_SEGMENTS
+        if any(count > max_segments for count in health['segments'].values()):
+            steps.append('merge')
+        if force or health['stats_stale'] or self._optimize_due(db_path):
+            steps.append('analyze')
+        if health['auto_vacuum'] == 'incremental' and health['free_mb'] > (0 if force else VACUUM_MIN_FREE_MB):
+            steps.append('vacuum')
+        return steps
+
+    def _merge(self, conn, table: str, should_stop: Callable[[], bool]) -> bool:
+        """分步合并 table 的所有段，返回是否已合并完"""
+        while not should_stop():
+            before = conn.total_changes
+            # N 为负数时不论层级合并所有段 (可分步执行的 'optimize')
+            conn.execute(f"INSERT INTO {table} ({table}, rank) VALUES ('merge', ?)", (-MERGE_PAGES,))
+            conn.commit()
+            # total_changes 增加不到 2 表示已没有可合并的段
+            if conn.total_changes - before < 2:
+                return True
+        return False
+
+    def _vacuum(self, conn, should_stop: Callable[[], bool]) -> bool:
+        """分步释放空闲页，返回是否已全部释放"""
+        while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            if should_stop():
+                return False
+            # incremental_vacuum 每执行一步释放一页，execute 只执行第一步，executescript 执行到底
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+        return True
+
+    def _run_database(self, db_path: Optional[str], force: bool, full: bool,
+                      should_stop: Callable[[], bool], steps: list) -> tuple:
+        """维护一个库 (None 为主库)，执行的步骤追加到 steps，返回维护前后的 index_health"""
+        conn = database.get_db_connection(db_path)
+        try:
+            before = index_health(conn, db_path)
+            pending = self.pending(before, force, db_path)
+            count = len(steps)
+            name = os.path.basename(db_path) if db_path else 'main'
+
+            if 'merge' in pending:
+                max_segments = 1 if force else MAX_SEGMENTS
+                for table, segments in before['segments'].items():
+                    if segments <= max_segments or should_stop():
+                        continue
+                    step_start = time.perf_counter()
+                    if full:
+                        conn.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+                        conn.commit()
+                        done = True
+                    else:
+                        done = self._merge(conn, table, should_stop)
+                    steps.append({
+                        'step': 'optimize' if full else 'merge', 'database': name, 'table': table, 'done': done,
+                        'segments': [segments, segment_count(conn, table)],
+                        'ms': round((time.perf_counter() - step_start) * 1000),
+                    })
+
+            if 'analyze' in pending and not should_stop():
+                step_start = time.perf_counter()
+                # SQLite 3.46 之前 PRAGMA optimize 只分析本连接查询过的表，在新连接上基本不起作用，
+                # 所以统计信息过期 (或手动触发) 时直接 ANALYZE
+                statement = "ANALYZE" if force or before['stats_stale'] else "PRAGMA optimize"
+                conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+                conn.execute(statement)
+                conn.commit()
+                self._last_optimize[db_path] = time.monotonic()
+                steps.append({'step': 'analyze', 'database': name, 'statement': statement, 'done': True,
+                              'ms': round((time.perf_counter() - step_start) * 1000)})
+
+            if full and before['auto_vacuum'] != 'incremental':
+                step_start = time.perf_counter()
+                # auto_vacuum 模式只有 VACUUM 重建文件时才会改变
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+                steps.append({'step': 'vacuum_full', 'database': name, 'done': True,
+                              'ms': round((time.perf_counter() - step_start) * 1000)})
+            elif 'vacuum' in pending and not should_stop():
+                step_start = time.perf_counter()
+                done = self._vacuum(conn, should_stop)
+                steps.append({'step': 'vacuum', 'database': name, 'done': done,
+                              'ms': round((time.perf_counter() - step_start) * 1000)})
+
+            if len(steps) > count:
+                # 把 WAL 中的页写回数据库并截断 WAL 文件 (有读事务时只能部分完成)
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            after = index_health(conn, db_path)
+        finally:
+            conn.close()
+        return before, after
+
+    def run(self, force: bool = False, full: bool = False) -> Optional[dict]:
+        """
+        执行一轮维护 (主库和各个已挂载的分片)，返回执行的步骤；已有维护在进行时返回 None
+        force: 手动触发，不检查阈值，期间有请求也不停止
+        full: 不限时间，'optimize' 代替分步合并，必要时完整 VACUUM
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        started_at = time.time()
+        started = time.monotonic()
+        deadline = None if full else started + MAINTENANCE_TIME_BUDGET
+
+        interrupted = False
+
+        def should_stop() -> bool:
+            nonlocal interrupted
+            interrupted = (self._stop.is_set()
+                           or (deadline is not None and time.monotonic() >= deadline)
+                           or (not force and _last_activity > started))
+            return interrupted
+
+        steps = []
+        size_before = size_after = free_before = free_after = 0
+        try:
+            for db_path in attached_databases():
+                if steps and should_stop():
+                    break
+                before, after = self._run_database(db_path, force, full, should_stop, steps)
+                size_before += before['size_mb']
+                size_after += after['size_mb']
+                free_before += before['free_mb']
+                free_after += after['free_mb']
+        finally:
+            self._lock.release()
+
+        result = {
+            'started_at': started_at,
+            'elapsed_ms': round((time.monotonic() - started) * 1000),
+            'steps': steps,
+            'complete': not interrupted,
+            'size_mb': [round(size_before, 2), round(size_after, 2)],
+            'free_mb': [round(free_before, 2), round(free_after, 2)],
+        }
+        if steps:
+            self.runs += 1
+            self.last_result = result
+            logger.info(f"Index maintenance: {[step['step'] for step in steps]} in {result['elapsed_ms']}ms, "
+                        f"size {result['size_mb'][0]} -> {result['size_mb'][1]} MB")
+        return result
+
+    def _pending_any(self) -> bool:
+        for db_path in attached_databases():
+            conn = database.get_db_connection(db_path)
+            try:
+                if self.pending(index_health(conn, db_path), db_path=db_path):
+                    return True
+            finally:
+                conn.close()
+        return False
+
+    def _loop(self):
+        while not self._stop.wait(CHECK_INTERVAL):
+            if not is_idle():
+                continue
+            try:
+                if self._pending_any():
+                    self.run()
+            except Exception as e:
+                logger.error(f"Index maintenance failed: {e}")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='index-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程 (正在执行的维护在当前这一步完成后停止)"""
+        self._stop.set()
+
+    def status(self) -> dict:
+        conn = database.get_db_connection()
+        try:
+            health = index_health(conn)
+        finally:
+            conn.close()
+        health.update({
+            'pending': self.pending(health),
+            'shards': self._shard_status(),
+            # 旧数据库未启用 incremental vacuum，空闲页要 full=True 的手动维护才能回收
+            'needs_full_vacuum': health['auto_vacuum'] != 'incremental' and health['free_mb'] > VACUUM_MIN_FREE_MB,
+            'running': self._lock.locked(),
+            'idle_seconds': round(idle_seconds()),
+            'runs': self.runs,
+            'last_run': self.last_result,
+        })
+        return health
+
+    def _shard_status(self) -> List[dict]:
+        status = []
+        for db_path in attached_databases()[1:]:
+            conn = database.get_db_connection(db_path)
+            try:
+                health = index_health(conn, db_path)
+            finally:
+                conn.close()
+            health.update({'file': os.path.basename(db_path), 'pending': self.pending(health, db_path=db_path)})
+            status.append(health)
+        return status
+
+
+index_maintenance = IndexMaintenance()
@@ -0,0 +1,60 @@
+"""
+有界 LRU 记忆化缓存
+用于查询扩展、拼音转换、摘要正则等重复计算，命中/未命中计数通过 /debug/stats 暴露
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+
+class LRUMemo:
+    """线程安全的 LRU 缓存，带命中统计"""
+
+    def __init__(self, name: str, maxsize: int = 1024):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def get_or_compute(self, key: Hashable, compute: Callable):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        # 计算在锁外进行；并发未命中时重复计算一次，结果相同
+        value = compute()
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+_registry: Dict[str, LRUMemo] = {}
+
+
+def memo_stats() -> dict:
+    """所有缓存的命中统计 {name: {...}}"""
+    return {name: memo.stats() for name, memo in _registry.items()}
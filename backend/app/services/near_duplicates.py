@@ -0,0 +1,185 @@
+"""
+近重复文档检测与结果折叠 (MinHash + LSH)
+- 索引时把正文切成词级 shingle (连续 SHINGLE_SIZE 个词，中文按单字)，
+  用单排列 MinHash (one permutation hashing: 一次哈希后按桶取最小值，空桶向右借值)
+  得到 NUM_HASHES 个值的签名，只需对每个 shingle 计算一次哈希
+- 签名分为 LSH_BANDS 段，每段的哈希值作为桶写入 doc_lsh；同桶文档再按签名估计的
+  Jaccard 相似度验证，达到 DUPLICATE_THRESHOLD 的文档归入同一簇 (doc_minhash.cluster_id)
+- 簇只在新文档加入时合并；删除文档不会拆分已有的簇
+- 查询时同一簇只返回 (搜索范围内) 最新修改的版本，并附带其它版本数及列表
+"""
+
+import re
+import zlib
+from array import array
+from typing import Dict, List, Optional
+
+# 每个 shingle 包含的词数
+SHINGLE_SIZE = 4
+
+# 签名长度 = 段数 × 每段行数；16 × 4 时两文档进入同一候选桶的相似度阈值约为 (1/16)^(1/4) = 0.5，
+# 相似度 0.7 的文档对被漏掉的概率约 (1 - 0.7^4)^16 ≈ 0.2%
+NUM_HASHES = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_HASHES // LSH_BANDS
+
+# 估计的 Jaccard 相似度达到该值视为同一文档的不同版本
+DUPLICATE_THRESHOLD = 0.7
+
+# 只对正文前 MAX_SHINGLE_CHARS 个字符计算签名，限制超大文件的索引开销
+MAX_SHINGLE_CHARS = 200000
+
+# 每个结果附带的其它版本列表长度上限 (计数不受限制)
+MAX_LISTED_VERSIONS = 20
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+|[一-鿿]')
+
+
+def _shingle_hashes(content: str) -> set:
+    words = WORD_PATTERN.findall((content or "")[:MAX_SHINGLE_CHARS].lower())
+    if not words:
+        return set()
+    if len(words) < SHINGLE_SIZE:
+        return {zlib.crc32(' '.join(words).encode('utf-8'))}
+    return {
+        zlib.crc32(' '.join(words[i:i + SHINGLE_SIZE]).encode('utf-8'))
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash_signature(content: str) -> Optional[array]:
+    """正文 -> NUM_HASHES 个 32 位无符号整数的签名 (没有可用的词时返回 None)"""
+    hashes = _shingle_hashes(content)
+    if not hashes:
+        return None
+    # 32 位哈希: 低 6 位选桶，其余位作为桶内的排序值
+    bins = [None] * NUM_HASHES
+    for h in hashes:
+        b = h % NUM_HASHES
+        value = h // NUM_HASHES
+        if bins[b] is None or value < bins[b]:
+            bins[b] = value
+    # 空桶向右 (循环) 借用最近的非空桶的值，并按距离偏移，避免空桶之间误判相等
+    signature = array('I', [0] * NUM_HASHES)
+    for b in range(NUM_HASHES):
+        if bins[b] is not None:
+            signature[b] = bins[b]
+            continue
+        for distance in range(1, NUM_HASHES):
+            value = bins[(b + distance) % NUM_HASHES]
+            if value is not None:
+                signature[b] = (value + distance * 0x9E3779B1) & 0xFFFFFFFF
+                break
+    return signature
+
+
+def similarity(a: array, b: array) -> float:
+    """签名估计的 Jaccard 相似度"""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_HASHES
+
+
+def band_buckets(signature: array) -> List[int]:
+    """每段签名的桶编号"""
+    return [zlib.crc32(signature[i * LSH_ROWS:(i + 1) * LSH_ROWS].tobytes()) for i in range(LSH_BANDS)]
+
+
+def add_document(cursor, doc_id: int, content: str) -> Optional[int]:
+    """
+    计算签名并写入 LSH 索引，与已有的近重复文档合并为一簇
+    返回文档所属的簇 (没有正文时返回 None)
+    """
+    signature = minhash_signature(content)
+    if signature is None:
+        return None
+    buckets = band_buckets(signature)
+
+    candidates = set()
+    for band, bucket in enumerate(buckets):
+        for row in cursor.execute("SELECT doc_id FROM doc_lsh WHERE band = ? AND bucket = ?", (band, bucket)):
+            candidates.add(row[0])
+    candidates.discard(doc_id)
+
+    clusters = set()
+    for candidate in candidates:
+        row = cursor.execute("SELECT signature, cluster_id FROM doc_minhash WHERE doc_id = ?", (candidate,)).fetchone()
+        if row is not None and similarity(signature, array('I', row[0])) >= DUPLICATE_THRESHOLD:
+            clusters.add(row[1])
+
+    cluster_id = min(clusters) if clusters else doc_id
+    # 新文档可能连接了此前互不相似的两个簇
+    for other in clusters - {cluster_id}:
+        cursor.execute("UPDATE doc_minhash SET cluster_id = ? WHERE cluster_id = ?", (cluster_id, other))
+    cursor.execute(
+        "INSERT OR REPLACE INTO doc_minhash (doc_id, signature, cluster_id) VALUES (?, ?, ?)",
+        (doc_id, signature.tobytes(), cluster_id)
+    )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO doc_lsh (band, bucket, doc_id) VALUES (?, ?, ?)",
+        [(band, bucket, doc_id) for band, bucket in enumerate(buckets)]
+    )
+    return cluster_id
+
+
+def remove_documents(cursor, doc_ids: List[int]):
+    params = [(doc_id,) for doc_id in doc_ids]
+    cursor.executemany("DELETE FROM doc_lsh WHERE doc_id = ?", params)
+    cursor.executemany("DELETE FROM doc_minhash WHERE doc_id = ?", params)
+
+
+class ResultCollapser:
+    """
+    按排序顺序折叠搜索结果: 每个簇只保留第一次出现的位置，
+    该位置展示簇内 (满足搜索范围和过滤条件的) 最新版本
+    scope_sql / scope_params: 以 AND 开头、作用于 m.doc_id 的条件
+    """
+
+    def __init__(self, conn, scope_sql: str = "", scope_params: Optional[list] = None):
+        self.conn = conn
+        self.scope_sql = scope_sql
+        self.scope_params = list(scope_params or [])
+        self.seen_clusters = set()
+        self.seen_docs = set()
+
+    def collapse(self, rowids: List[int]) -> List[tuple]:
+        """
+        rowids (按排序) -> [(rowid, 代表版本 rowid, 其它版本列表, 其它版本数), ...]
+        已经展示过的簇中的文档被跳过
+        """
+        if not rowids:
+            return []
+        placeholders = ','.join('?' * len(rowids))
+        clusters = dict(self.conn.execute(
+            f"SELECT doc_id, cluster_id FROM doc_minhash WHERE doc_id IN ({placeholders})", tuple(rowids)
+        ).fetchall())
+
+        new_clusters = {clusters[r] for r in rowids if r in clusters} - self.seen_clusters
+        members: Dict[int, list] = {}
+        if new_clusters:
+            cluster_placeholders = ','.join('?' * len(new_clusters))
+            for row in self.conn.execute(f"""
+                SELECT m.cluster_id AS cluster_id, m.doc_id AS doc_id, f.file_path AS file_path,
+                       f.last_modified AS last_modified
+                FROM doc_minhash m
+                JOIN files f ON f.doc_id = m.doc_id
+                WHERE m.cluster_id IN ({cluster_placeholders}) {self.scope_sql}
+            """, tuple(new_clusters) + tuple(self.scope_params)):
+                members.setdefault(row[0], []).append((row[1], row[2], row[3] or 0))
+
+        collapsed = []
+        for rowid in rowids:
+            if rowid in self.seen_docs:
+                continue
+            cluster_id = clusters.get(rowid)
+            if cluster_id is None:
+                self.seen_docs.add(rowid)
+                collapsed.append((rowid, rowid, [], 0))
+                continue
+            if cluster_id in self.seen_clusters:
+                continue
+            self.seen_clusters.add(cluster_id)
+            versions = sorted(members.get(cluster_id) or [(rowid, None, 0)], key=lambda m: (-m[2], m[0]))
+            representative = versions[0][0]
+            others = [{'file_path': path, 'last_modified': modified}
+                      for doc_id, path, modified in versions[1:]]
+            collapsed.append((rowid, representative, others[:MAX_LISTED_VERSIONS], len(others)))
+        return collapsed
@@ -0,0 +1,487 @@
+"""
+文件名/路径搜索 (不查正文)
+- files.file_path 全部加载到内存中，文件名、小写完整路径、文件名的拼音首字母形式
+  分别以换行拼接成一个大字符串，配合 array 保存的行起始偏移；
+  查询时用正则在大字符串上做一次 C 层扫描，再二分偏移得到文件编号
+- 支持子串 (多个词同时包含)、通配符 (* ? [...]) 和拼音首字母匹配
+- 启动时在后台线程加载；索引器新增的文件先放在尾部列表中逐条匹配，
+  积累到一定数量 (或删除过多) 后在后台线程重新拼接，完成前继续使用旧快照
+"""
+
+import re
+import heapq
+import threading
+import time
+import logging
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from ..core.database import get_db_connection
+from .shards import attached_databases
+from .cjk_bigram import CJK_RUN_PATTERN
+from .pinyin_index import pinyin_initials
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FILENAME_LIMIT = 100
+
+# 最多收集的匹配数，超过后 total_count 只表示下限
+MAX_FILENAME_MATCHES = 10000
+
+# 出现次数少于该值的字面量直接用于扫描，不再比较其余字面量
+SELECTIVE_NEEDLE_COUNT = 1000
+
+# 尾部未拼接的文件超过该数量时重新拼接
+MAX_PENDING_FILES = 5000
+
+# trigram 倒排表按这么多行分块建立，限制建立时临时数组的内存
+TRIGRAM_BLOCK_LINES = 100000
+# 候选编号每次转换的数量
+CANDIDATE_CHUNK = 4096
+# 候选数不超过该值时不再与其余 trigram 的倒排表求交
+MIN_INTERSECT_CANDIDATES = 64
+
+GLOB_CHARS = re.compile(r'[*?\[]')
+GLOB_CLASS_PATTERN = re.compile(r'\[[^\]]*\]')
+GLOB_LITERAL_PATTERN = re.compile(r'[^*?]+')
+PATH_SEPARATOR_PATTERN = re.compile(r'[\\/]')
+
+
+def _basename(path: str) -> str:
+    """同时按 / 和 \\ 取文件名 (索引中的路径可能来自 Windows)"""
+    return PATH_SEPARATOR_PATTERN.split(path)[-1]
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """通配符 -> 正则 (用于 fullmatch)"""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '*':
+            parts.append('.*')
+        elif c == '?':
+            parts.append('.')
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return ''.join(parts)
+
+
+def _trigram_codes(text: str):
+    """
+    每个位置开始的 trigram 编码 (三个码点各占 21 位) 及其中间字符的位置
+    换行和 \\0 都是行边界；保留以边界开头或结尾的 trigram (行首/行尾锚定的字面量可以利用)，
+    去掉跨越两行的
+    """
+    chars = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    if len(chars) < 3:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    chars = np.where(chars == 0, np.uint32(10), chars)
+    codes = (chars[:-2].astype(np.uint64) << np.uint64(42)) | \
+            (chars[1:-1].astype(np.uint64) << np.uint64(21)) | chars[2:].astype(np.uint64)
+    boundary = chars == 10
+    positions = np.flatnonzero(~boundary[1:-1] & ~(boundary[:-2] & boundary[2:]))
+    return codes[positions], positions + 1
+
+
+class _TrigramPostings:
+    """
+    trigram -> 包含它的行号 (升序)，按 TRIGRAM_BLOCK_LINES 行分块
+    lookup(grams) 返回包含全部 trigram 的行 (可能包含实际不含查询词的行，由调用方验证)
+    """
+
+    def __init__(self, text: str, offsets):
+        self.blocks = []
+        line_count = len(offsets) - 1
+        line_starts = np.frombuffer(offsets, dtype=np.uint64).astype(np.int64)
+        for first in range(0, line_count, TRIGRAM_BLOCK_LINES):
+            last = min(first + TRIGRAM_BLOCK_LINES, line_count)
+            start = line_starts[first]
+            # 块内文本从第一行前的换行开始，行首 trigram 也在块内
+            codes, positions = _trigram_codes(text[start - 1:line_starts[last]])
+            positions += start - 1
+            lines = (np.searchsorted(line_starts[first:last + 1], positions, side='right') - 1 + first).astype(np.uint32)
+            # 按 trigram 排序 (稳定排序，同一 trigram 内行号保持升序)，去掉同一行内重复的 trigram
+            order = np.argsort(codes, kind='stable')
+            codes, lines = codes[order], lines[order]
+            keep = np.ones(len(codes), dtype=bool)
+            keep[1:] = (codes[1:] != codes[:-1]) | (lines[1:] != lines[:-1])
+            codes, lines = codes[keep], lines[keep]
+            heads = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.zeros(0, dtype=np.int64)
+            self.blocks.append((first, codes[heads], np.r_[heads, len(codes)], lines))
+
+    @staticmethod
+    def grams(needle: str) -> Optional[list]:
+        """needle 的 trigram 编码 (开头/结尾的换行表示行首/行尾锚定)；不足 3 个字符时返回 None"""
+        codes = set()
+        for i in range(len(needle) - 2):
+            gram = needle[i:i + 3]
+            if gram[1] == '\n' or (gram[0] == '\n' and gram[2] == '\n'):
+                continue
+            codes.add((ord(gram[0]) << 42) | (ord(gram[1]) << 21) | ord(gram[2]))
+        return list(codes) or None
+
+    def lookup(self, grams: list):
+        found = []
+        for first, block_codes, starts, lines in self.blocks:
+            postings = []
+            for code in grams:
+                i = int(np.searchsorted(block_codes, np.uint64(code)))
+                if i == len(block_codes) or int(block_codes[i]) != code:
+                    postings = None
+                    break
+                postings.append(lines[starts[i]:starts[i + 1]])
+            if not postings:
+                continue
+            postings.sort(key=len)
+            result = postings[0]
+            if len(postings) > 1 and len(result) > MIN_INTERSECT_CANDIDATES:
+                # 块内求交: 在块大小的布尔数组上标记，比二分查找快
+                mask = np.zeros(TRIGRAM_BLOCK_LINES, dtype=bool)
+                for posting in postings[1:]:
+                    # 候选已经很少时不再求交，由调用方逐个验证
+                    if len(result) <= MIN_INTERSECT_CANDIDATES:
+                        break
+                    mask[posting - first] = True
+                    result = result[mask[result - first]]
+                    mask[posting - first] = False
+            found.append(result)
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.uint32)
+
+
+class _Segment:
+    """
+    拼接后的只读快照，行号即文件编号
+    拼接字符串以换行开头和结尾，"\\n前缀" / "后缀\\n" 即可表示行首/行尾锚定的字面量
+    """
+
+    def __init__(self, paths: List[str]):
+        self.count = len(paths)
+        names = [_basename(p).lower() for p in paths]
+        self.names, self.name_offsets = self._join(names)
+        self.paths, self.path_offsets = self._join([p.lower() for p in paths])
+        initial_ids = [i for i, name in enumerate(names) if CJK_RUN_PATTERN.search(name)]
+        self.initials, self.initial_offsets = self._join([pinyin_initials(names[i]) for i in initial_ids])
+        self.initial_ids = array('I', initial_ids)
+        self.initial_lines = {file_id: line for line, file_id in enumerate(initial_ids)}
+        self.grams = None
+        if NUMPY_AVAILABLE:
+            # 倒排表的每一行是文件名，有拼音首字母形式时用 \0 连接在后面 (trigram 不跨越 \0)
+            initials = dict(zip(initial_ids, self.initials[1:-1].split('\n'))) if initial_ids else {}
+            lines = [name + '\0' + initials[i] if i in initials else name for i, name in enumerate(names)]
+            self.grams = _TrigramPostings(*self._join(lines))
+
+    @staticmethod
+    def _join(lines: List[str]):
+        """拼接为单个字符串；offsets[i] 为第 i 行起始位置，最后多一项结尾位置"""
+        offsets = array('Q')
+        position = 1
+        for line in lines:
+            offsets.append(position)
+            position += len(line) + 1
+        offsets.append(position)
+        return '\n' + '\n'.join(lines) + '\n', offsets
+
+    @staticmethod
+    def _line(text: str, offsets, line: int) -> str:
+        return text[offsets[line]:offsets[line + 1] - 1]
+
+    def name(self, file_id: int) -> str:
+        return self._line(self.names, self.name_offsets, file_id)
+
+    def path(self, file_id: int) -> str:
+        return self._line(self.paths, self.path_offsets, file_id)
+
+    def initials_of(self, file_id: int) -> Optional[str]:
+        line = self.initial_lines.get(file_id)
+        return None if line is None else self._line(self.initials, self.initial_offsets, line)
+
+    def lookup(self, needles: List[str]):
+        """
+        文件名 (或其拼音首字母形式) 含有全部 needle 的 trigram 的文件编号 (升序 numpy 数组)；
+        没有倒排表或 needle 都不足 3 个字符时返回 None
+        """
+        if self.grams is None:
+            return None
+        codes = set()
+        for needle in needles:
+            codes.update(_TrigramPostings.grams(needle) or ())
+        return self.grams.lookup(list(codes)) if codes else None
+
+    def count_needle(self, needle: str, on_path: bool) -> int:
+        if on_path:
+            return self.paths.count(needle)
+        return self.names.count(needle) + self.initials.count(needle)
+
+    @staticmethod
+    def _find(needle: str, text: str, offsets, ids=None):
+        """按出现顺序产生包含 needle 的行号 (同一行多次命中只产生一次)"""
+        lead = 1 if needle.startswith('\n') else 0
+        last = -1
+        position = text.find(needle)
+        while position != -1:
+            line = bisect_right(offsets, position + lead) - 1
+            if line != last:
+                last = line
+                yield line if ids is None else ids[line]
+            position = text.find(needle, position + 1)
+
+    def scan(self, needle: str, on_path: bool):
+        """按编号升序产生命中的文件编号 (文件名与其拼音首字母形式合并)"""
+        if on_path:
+            yield from self._find(needle, self.paths, self.path_offsets)
+            return
+        last = -1
+        for file_id in heapq.merge(
+            self._find(needle, self.names, self.name_offsets),
+            self._find(needle, self.initials, self.initial_offsets, self.initial_ids),
+        ):
+            if file_id != last:
+                last = file_id
+                yield file_id
+
+
+class _WordMatcher:
+    """单个查询词；含路径分隔符时匹配完整路径，否则匹配文件名或其拼音首字母形式"""
+
+    def __init__(self, word: str):
+        self.on_path = PATH_SEPARATOR_PATTERN.search(word) is not None
+        self.is_glob = GLOB_CHARS.search(word) is not None
+        if self.is_glob:
+            # 通配符须匹配整个文件名 (或整条路径)
+            self.regex = re.compile(_glob_to_regex(word), re.DOTALL)
+            plain = GLOB_CLASS_PATTERN.sub('?', word)
+            literals = GLOB_LITERAL_PATTERN.findall(plain)
+            self.needles = list(literals)
+            # 开头/结尾的字面量锚定到行首/行尾，区分度更高
+            if literals and plain.startswith(literals[0]):
+                self.needles.append('\n' + literals[0])
+            if literals and plain.endswith(literals[-1]):
+                self.needles.append(literals[-1] + '\n')
+        else:
+            self.word = word
+            self.needles = [word]
+
+    def matches(self, text: str, initials: Optional[str]) -> bool:
+        if not self.is_glob:
+            return self.word in text or (initials is not None and self.word in initials)
+        return self.regex.fullmatch(text) is not None or (initials is not None and self.regex.fullmatch(initials) is not None)
+
+
+class PathIndex:
+    """内存中的全部文件路径"""
+
+    def __init__(self, paths: List[str] = None):
+        self.paths: List[Optional[str]] = []   # 编号 -> 路径 (删除后为 None)
+        self.ids: Dict[str, int] = {}
+        self._removed = 0
+        self._segment = _Segment([])
+        self._lock = threading.RLock()
+        self._rebuilding = False
+        for path in paths or []:
+            self.add(path)
+        self._rebuild()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, path: str):
+        with self._lock:
+            if path in self.ids:
+                return
+            self.ids[path] = len(self.paths)
+            self.paths.append(path)
+
+    def remove(self, path: str):
+        with self._lock:
+            file_id = self.ids.pop(path, None)
+            if file_id is not None:
+                self.paths[file_id] = None
+                self._removed += 1
+
+    def remove_prefix(self, prefix: str):
+        prefix = prefix.lower()
+        with self._lock:
+            for path in [p for p in self.ids if p.lower().startswith(prefix)]:
+                self.remove(path)
+
+    def _rebuild(self):
+        """去掉已删除的编号并重新拼接"""
+        self.paths = [p for p in self.paths if p is not None]
+        self.ids = {p: i for i, p in enumerate(self.paths)}
+        self._removed = 0
+        self._segment = _Segment(self.paths)
+
+    def _refresh(self):
+        pending = len(self.paths) - self._segment.count
+        if self._rebuilding:
+            return
+        if pending > MAX_PENDING_FILES or self._removed > max(MAX_PENDING_FILES, len(self.paths) // 10):
+            self._rebuilding = True
+            threading.Thread(target=self._rebuild_in_background, name='path-index-rebuild', daemon=True).start()
+
+    def _rebuild_in_background(self):
+        """在后台拼接新快照 (不持有锁)；期间的新增留在尾部，删除的编号保留为 None"""
+        try:
+            with self._lock:
+                count = len(self.paths)
+                snapshot = [p for p in self.paths if p is not None]
+            segment = _Segment(snapshot)
+            with self._lock:
+                # 建立期间被删除 (或删除后重新加入、编号已变) 的文件
+                paths = [p if self.ids.get(p, count) < count else None for p in snapshot]
+                paths.extend(self.paths[count:])
+                self.paths = paths
+                self.ids = {p: i for i, p in enumerate(paths) if p is not None}
+                self._removed = len(paths) - len(self.ids)
+                self._segment = segment
+        except Exception as e:
+            logger.error(f"Failed to rebuild path index: {e}")
+        finally:
+            self._rebuilding = False
+
+    def _texts(self, file_id: int, on_path: bool):
+        """(小写文件名或路径, 拼音首字母形式)"""
+        segment = self._segment
+        if file_id < segment.count:
+            if on_path:
+                return segment.path(file_id), None
+            return segment.name(file_id), segment.initials_of(file_id)
+        lowered = self.paths[file_id].lower()
+        if on_path:
+            return lowered, None
+        name = _basename(lowered)
+        return name, pinyin_initials(name) if CJK_RUN_PATTERN.search(name) else None
+
+    def _candidates(self, matchers: List[_WordMatcher]):
+        """
+        候选编号 (升序)：文件名的字面量在 trigram 倒排表中求交；没有可用的倒排表时，
+        在快照中选出现次数最少的字面量 (str.count/find 均为 C 层扫描)；
+        尾部尚未拼接的文件逐条列出
+        """
+        segment = self._segment
+        candidates = segment.lookup([needle for matcher in matchers if not matcher.on_path for needle in matcher.needles])
+        if candidates is not None:
+            # 按块转换为 Python 整数，匹配数达到上限时不必转换全部候选
+            for start in range(0, len(candidates), CANDIDATE_CHUNK):
+                yield from candidates[start:start + CANDIDATE_CHUNK].tolist()
+            yield from range(segment.count, len(self.paths))
+            return
+
+        best = None
+        if len(matchers) == 1 and len(matchers[0].needles) == 1:
+            # 只有一个字面量时无需比较
+            best = (0, matchers[0].needles[0], matchers[0].on_path)
+        for matcher in matchers if best is None else ():
+            for needle in matcher.needles:
+                count = segment.count_needle(needle, matcher.on_path)
+                if best is None or count < best[0]:
+                    best = (count, needle, matcher.on_path)
+                if count < SELECTIVE_NEEDLE_COUNT:
+                    break
+            if best is not None and best[0] < SELECTIVE_NEEDLE_COUNT:
+                break
+        if best is not None:
+            yield from segment.scan(best[1], best[2])
+        else:
+            yield from range(segment.count)
+        yield from range(segment.count, len(self.paths))
+
+    def search(self, query: str, limit: int = DEFAULT_FILENAME_LIMIT, paths: List[str] = None) -> dict:
+        """
+        按文件名搜索；空格分隔的多个词须同时匹配
+        - 普通词: 文件名 (或其拼音首字母形式) 包含该词；含路径分隔符时匹配完整路径
+        - 通配符: *.sas、adsl_??.xpt、t_[0-9]*.rtf，整个文件名须匹配
+        返回 {'results': [{'file_path', 'title'}], 'total_count': n}
+        total_count 最多统计到 MAX_FILENAME_MATCHES
+        """
+        words = [w for w in query.lower().split() if w]
+        if not words:
+            return {'results': [], 'total_count': 0}
+        scopes = [p.lower() for p in paths] if paths else None
+        matchers = [_WordMatcher(w) for w in words]
+        need_name = any(not m.on_path for m in matchers)
+        need_path = any(m.on_path for m in matchers)
+
+        first = words[0]
+        with self._lock:
+            self._refresh()
+            matched = []
+            for file_id in self._candidates(matchers):
+                path = self.paths[file_id]
+                if path is None:
+                    continue
+                if scopes and not any(path.lower().startswith(s) for s in scopes):
+                    continue
+                name_texts = self._texts(file_id, False) if need_name else None
+                path_texts = self._texts(file_id, True) if need_path else None
+                if all(m.matches(*(path_texts if m.on_path else name_texts)) for m in matchers):
+                    # 排序键在验证时一并算出: 文件名等于/以查询开头的排在前面，其次文件名短、路径短的
+                    name = name_texts[0] if name_texts else self._texts(file_id, False)[0]
+                    matched.append((name != first, not name.startswith(first), len(name), len(path), file_id))
+                    if len(matched) >= MAX_FILENAME_MATCHES:
+                        break
+
+            best = [key[-1] for key in heapq.nsmallest(limit, matched)]
+            results = [{'file_path': self.paths[i], 'title': _basename(self.paths[i])} for i in best]
+        return {'results': results, 'total_count': len(matched)}
+
+    @classmethod
+    def load(cls, connections) -> "PathIndex":
+        """从各库 (主库和分片) 的 files 表加载"""
+        return cls([row['file_path'] for conn in connections for row in conn.execute("SELECT file_path FROM files")])
+
+
+_path_index: Optional[PathIndex] = None
+_path_index_lock = threading.Lock()
+
+
+def get_path_index() -> PathIndex:
+    """返回路径索引，首次调用 (或失效后) 从 files 表加载"""
+    global _path_index
+    index = _path_index
+    if index is not None:
+        return index
+    with _path_index_lock:
+        if _path_index is None:
+            start = time.perf_counter()
+            connections = [get_db_connection(db_path) for db_path in attached_databases()]
+            try:
+                _path_index = PathIndex.load(connections)
+            except Exception as e:
+                logger.error(f"Failed to load path index: {e}")
+                return PathIndex()
+            finally:
+                for conn in connections:
+                    conn.close()
+            logger.info(f"Loaded path index: {len(_path_index)} files in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return _path_index
+
+
+def loaded_path_index() -> Optional[PathIndex]:
+    """已加载的路径索引 (未加载时返回 None，供索引器增量更新)"""
+    return _path_index
+
+
+def invalidate_path_index():
+    global _path_index
+    with _path_index_lock:
+        _path_index = None
@@ -0,0 +1,62 @@
+"""
+拼音辅助索引
+索引时把标题 (可选正文) 中的汉字转换为全拼和首字母，写入 pinyin_index，
+查询时用户输入 "yangben" 或 "ybl" 即可通过 trigram 索引命中 "样本量"，查询时不再调用 pypinyin
+"""
+
+from .cjk_bigram import CJK_RUN_PATTERN
+from .query_parser import iter_terms, MIN_TRIGRAM_TERM_LENGTH
+from .memo import LRUMemo
+
+try:
+    import pypinyin
+    PYPINYIN_AVAILABLE = True
+except ImportError:
+    PYPINYIN_AVAILABLE = False
+    print("警告: pypinyin库未安装，拼音搜索功能将不可用")
+
+# 正文拼音会让索引体积明显增大，默认只为标题生成拼音
+PINYIN_INDEX_CONTENT = False
+
+# 汉字片段 -> (全拼, 首字母)；标题中的词 (方案、分析、报告...) 高度重复
+_pinyin_memo = LRUMemo('pinyin', 8192)
+
+
+def _run_pinyin(run: str) -> tuple:
+    syllables = pypinyin.lazy_pinyin(run, style=pypinyin.NORMAL)
+    return ''.join(syllables), ''.join(s[0] for s in syllables if s)
+
+
+def to_pinyin_text(text: str) -> str:
+    """
+    汉字片段 -> "全拼 首字母"，多个片段以空格分隔，非汉字内容丢弃
+    "样本量计算.docx" -> "yangbenliangjisuan ybljs"
+    """
+    if not text or not PYPINYIN_AVAILABLE:
+        return ""
+    parts = []
+    for run in CJK_RUN_PATTERN.findall(text):
+        parts.extend(_pinyin_memo.get_or_compute(run, lambda: _run_pinyin(run)))
+    return " ".join(parts)
+
+
+def pinyin_initials(text: str) -> str:
+    """
+    汉字替换为拼音首字母，其余字符保留
+    "样本量计算_v2.docx" -> "ybljs_v2.docx"
+    """
+    if not text or not PYPINYIN_AVAILABLE:
+        return text or ""
+    return CJK_RUN_PATTERN.sub(lambda m: _pinyin_memo.get_or_compute(m.group(), lambda: _run_pinyin(m.group()))[1], text)
+
+
+def is_pinyin_term(text: str) -> bool:
+    """纯 ASCII 字母且不短于 trigram 最小长度的词可能是拼音"""
+    text = text.rstrip('*')
+    return len(text) >= MIN_TRIGRAM_TERM_LENGTH and text.isascii() and text.isalpha()
+
+
+def is_pinyin_query(node) -> bool:
+    """查询中所有词 (含排除词) 都可能是拼音时，同时在 pinyin_index 中查找"""
+    terms = list(iter_terms(node, include_negated=True))
+    return bool(terms) and all(is_pinyin_term(term.text) for term in terms)
@@ -0,0 +1,342 @@
+"""
+查询语法解析与编译
+将用户输入解析为语法树，再一次性编译为单条 FTS5 MATCH 表达式
+
+支持的语法:
+- AND / OR / NOT (大小写不敏感，相邻词之间默认 AND)
+- 括号分组: (盲法 OR blinding) AND 方案
+- 引号短语: "sample size"
+- 邻近查询: 随机化 NEAR/5 分层 (NEAR 默认距离 10 个词)
+- 字段过滤: title:报告 keywords:make_adsl content:"adverse event"
+"""
+
+import re
+from typing import List, Optional
+
+from .cjk_bigram import bigram_match_expr, bigram_phrase
+
+# 可用于字段过滤的列
+FIELD_COLUMNS = ('title', 'content', 'keywords')
+
+DEFAULT_NEAR_DISTANCE = 10
+
+# trigram 分词器的 token 是单个字符位置，NEAR 的词距需要换算为 token 距离:
+# 每个允许的词按一个平均词长加一个分隔符计算 (取偏大的值，宁可放宽)
+TRIGRAM_CHARS_PER_WORD = 8
+
+# 少于 3 个字符的词无法被 trigram 索引 MATCH
+MIN_TRIGRAM_TERM_LENGTH = 3
+
+TOKEN_PATTERN = re.compile(
+    r'\s*(?:'
+    r'(?P<lparen>\()|(?P<rparen>\))'
+    r'|(?P<field>(?:' + '|'.join(FIELD_COLUMNS) + r')):(?=\S)'
+    r'|"(?P<phrase>[^"]*)"?'
+    r'|(?P<word>[^\s()"]+)'
+    r')',
+    re.IGNORECASE
+)
+
+NEAR_PATTERN = re.compile(r'^NEAR(?:/(\d+))?$', re.IGNORECASE)
+
+
+class QueryParseError(ValueError):
+    """查询语法错误"""
+
+
+class Term:
+    """查询词；phrase=True 表示引号短语 (不做前缀匹配)"""
+
+    def __init__(self, text: str, phrase: bool = False):
+        self.text = text
+        self.phrase = phrase
+
+    def __repr__(self):
+        return f"Term({self.text!r}, phrase={self.phrase})"
+
+
+class And:
+    def __init__(self, children: list):
+        self.children = children
+
+    def __repr__(self):
+        return f"And({self.children!r})"
+
+
+class Or:
+    def __init__(self, children: list):
+        self.children = children
+
+    def __repr__(self):
+        return f"Or({self.children!r})"
+
+
+class Not:
+    """FTS5 的 NOT 是二元运算: left NOT right"""
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def __repr__(self):
+        return f"Not({self.left!r}, {self.right!r})"
+
+
+class Near:
+    def __init__(self, terms: List[Term], distance: int = DEFAULT_NEAR_DISTANCE):
+        self.terms = terms
+        self.distance = distance
+
+    def __repr__(self):
+        return f"Near({self.terms!r}, {self.distance})"
+
+
+class Field:
+    def __init__(self, column: str, child):
+        self.column = column
+        self.child = child
+
+    def __repr__(self):
+        return f"Field({self.column!r}, {self.child!r})"
+
+
+def _tokenize(query: str) -> list:
+    tokens = []
+    pos = 0
+    while pos < len(query):
+        m = TOKEN_PATTERN.match(query, pos)
+        if not m or m.end() == pos:
+            break
+        pos = m.end()
+        if m.group('lparen'):
+            tokens.append(('LPAREN', '('))
+        elif m.group('rparen'):
+            tokens.append(('RPAREN', ')'))
+        elif m.group('field'):
+            tokens.append(('FIELD', m.group('field').lower()))
+        elif m.group('phrase') is not None:
+            if m.group('phrase').strip():
+                tokens.append(('PHRASE', m.group('phrase').strip()))
+        elif m.group('word'):
+            word = m.group('word')
+            upper = word.upper()
+            if upper in ('AND', 'OR', 'NOT'):
+                tokens.append((upper, word))
+            elif NEAR_PATTERN.match(word):
+                tokens.append(('NEAR', word))
+            else:
+                tokens.append(('WORD', word))
+    return tokens
+
+
+class _Parser:
+    """
+    递归下降解析器
+        or_expr  := and_expr (OR and_expr)*
+        and_expr := near_expr ((AND | NOT)? near_expr)*
+        near_expr:= unary (NEAR/k unary)*
+        unary    := '(' or_expr ')' | FIELD unary | PHRASE | WORD
+    """
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            return None
+        node = self.or_expr()
+        if self.pos < len(self.tokens):
+            raise QueryParseError(f"Unexpected token: {self.tokens[self.pos][1]}")
+        return node
+
+    def or_expr(self):
+        children = [self.and_expr()]
+        while self.peek() == 'OR':
+            self.next()
+            if self.peek() in (None, 'RPAREN'):
+                break  # 忽略末尾多余的 OR
+            children.append(self.and_expr())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def and_expr(self):
+        node = self.near_expr()
+        children = [node]
+        while self.peek() not in (None, 'OR', 'RPAREN'):
+            operator = self.peek()
+            if operator in ('AND', 'NOT'):
+                self.next()
+                if operator == 'AND' and self.peek() == 'NOT':
+                    operator = 'NOT'  # "a AND NOT b" 等同于 "a NOT b"
+                    self.next()
+                if self.peek() in (None, 'OR', 'RPAREN'):
+                    break  # 忽略末尾多余的 AND / NOT
+            if operator == 'NOT':
+                left = children[0] if len(children) == 1 else And(children)
+                children = [Not(left, self.near_expr())]
+            else:
+                children.append(self.near_expr())
+        return children[0] if len(children) == 1 else And(children)
+
+    def near_expr(self):
+        node = self.unary()
+        while self.peek() == 'NEAR':
+            m = NEAR_PATTERN.match(self.next()[1])
+            distance = int(m.group(1)) if m.group(1) else DEFAULT_NEAR_DISTANCE
+            right = self.unary()
+            if not isinstance(right, Term):
+                raise QueryParseError("NEAR operands must be words or phrases")
+            if isinstance(node, Near) and node.distance == distance:
+                node.terms.append(right)
+            elif isinstance(node, Term):
+                node = Near([node, right], distance)
+            else:
+                raise QueryParseError("NEAR operands must be words or phrases")
+        return node
+
+    def unary(self):
+        kind = self.peek()
+        if kind is None:
+            raise QueryParseError("Unexpected end of query")
+        kind, value = self.next()
+        if kind == 'LPAREN':
+            node = self.or_expr()
+            if self.peek() == 'RPAREN':
+                self.next()
+            return node
+        if kind == 'FIELD':
+            return Field(value, self.unary())
+        if kind == 'PHRASE':
+            return Term(value, phrase=True)
+        if kind == 'WORD':
+            return Term(value)
+        raise QueryParseError(f"Unexpected operator: {value}")
+
+
+def parse_query(query: str):
+    """
+    解析查询字符串，返回语法树 (空查询返回 None)
+    语法错误时抛出 QueryParseError
+    """
+    return _Parser(_tokenize(query or "")).parse()
+
+
+def parse_plain(query: str):
+    """将查询按空白切分为普通词的 AND 组合，用于语法错误时的降级处理"""
+    terms = [Term(w) for w in query.split() if w]
+    if not terms:
+        return None
+    return terms[0] if len(terms) == 1 else And(terms)
+
+
+def iter_terms(node, include_negated: bool = False):
+    """遍历语法树中的查询词 (默认跳过 NOT 右侧的排除词)"""
+    if node is None:
+        return
+    if isinstance(node, Term):
+        yield node
+    elif isinstance(node, (And, Or)):
+        for child in node.children:
+            yield from iter_terms(child, include_negated)
+    elif isinstance(node, Not):
+        yield from iter_terms(node.left, include_negated)
+        if include_negated:
+            yield from iter_terms(node.right, include_negated)
+    elif isinstance(node, Near):
+        yield from node.terms
+    elif isinstance(node, Field):
+        yield from iter_terms(node.child, include_negated)
+
+
+def is_short_term(text: str) -> bool:
+    """trigram 索引无法匹配的短词 (如 1-2 个汉字或 "AE" 这类缩写)"""
+    return len(text.strip()) < MIN_TRIGRAM_TERM_LENGTH
+
+
+def requires_bigram_index(node) -> bool:
+    """查询中存在 trigram 无法匹配的短词时，整条查询改用 bigram_index"""
+    return any(is_short_term(term.text) for term in iter_terms(node, include_negated=True))
+
+
+def _quote(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _compile_term(term: Term, target: str) -> str:
+    if target == 'bigram_index':
+        if term.phrase:
+            return bigram_phrase(term.text)
+        expr = bigram_match_expr(term.text.rstrip('*'))
+        return f"({expr})" if ' AND ' in expr else expr
+    if term.phrase:
+        return _quote(term.text)
+    return _quote(term.text.rstrip('*')) + '*'
+
+
+def _compile_near_term(term: Term, target: str) -> str:
+    prefix = not term.phrase and term.text.endswith('*')
+    text = term.text.rstrip('*') if prefix else term.text
+    if target == 'bigram_index':
+        phrase = bigram_phrase(text)
+        return phrase + '*' if prefix and phrase else phrase
+    # trigram 按子串匹配，本身已包含前缀匹配
+    return _quote(text)
+
+
+def _trigram_near_distance(words: int, texts: List[str]) -> int:
+    """
+    NEAR 的词距 -> trigram token 距离
+    长度为 n 的短语占 n-2 个 token；相邻短语之间的 m 个字符对应 m+2 个 token (跨越边界的 trigram)；
+    FTS5 把夹在首尾之间的短语也计入距离，其 token 数以除最短两个以外的短语之和为上限
+    """
+    tokens = sorted(max(len(text) - 2, 1) for text in texts)
+    middle = sum(tokens[2:])
+    return words * TRIGRAM_CHARS_PER_WORD + (len(texts) - 1) * 3 + middle
+
+
+def _join(parts: list, operator: str) -> str:
+    parts = [p for p in parts if p]
+    if not parts:
+        return ""
+    if len(parts) == 1:
+        return parts[0]
+    return "(" + f" {operator} ".join(parts) + ")"
+
+
+def compile_query(node, target: str = 'search_index') -> str:
+    """
+    将语法树编译为 FTS5 MATCH 表达式
+    target: 'search_index' (trigram) 或 'bigram_index' (unicode61 + 中文二元词)
+    """
+    if node is None:
+        return ""
+    if isinstance(node, Term):
+        return _compile_term(node, target)
+    if isinstance(node, And):
+        return _join([compile_query(c, target) for c in node.children], 'AND')
+    if isinstance(node, Or):
+        return _join([compile_query(c, target) for c in node.children], 'OR')
+    if isinstance(node, Not):
+        left = compile_query(node.left, target)
+        right = compile_query(node.right, target)
+        if not right:
+            return left
+        return f"({left} NOT {right})" if left else ""
+    if isinstance(node, Near):
+        phrases = [p for p in (_compile_near_term(t, target) for t in node.terms) if p]
+        distance = node.distance
+        if target == 'search_index':
+            distance = _trigram_near_distance(distance, [t.text.rstrip('*') for t in node.terms])
+        return f"NEAR({' '.join(phrases)}, {distance})"
+    if isinstance(node, Field):
+        child = compile_query(node.child, target)
+        return f"{{{node.column}}} : ({child})" if child else ""
+    raise QueryParseError(f"Unknown query node: {node!r}")
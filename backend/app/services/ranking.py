@@ -0,0 +1,92 @@
+"""
+搜索结果排序配置
+在 SQL 中计算最终得分: bm25 列权重 × 时效加权 × 文件类型加权 ÷ 路径深度惩罚
+排序和 LIMIT 均在 SQLite 中完成，不在 Python 中二次排序
+"""
+
+import os
+import time
+from typing import Dict, Optional
+
+
+class RankingProfile:
+    """
+    排序参数
+
+    - title_weight / content_weight / keywords_weight: bm25() 列权重
+    - recency_boost: 新文件的最大加权比例 (0 表示不考虑修改时间)
+    - recency_half_life_days: 修改时间距今多少天时加权减半
+    - type_boosts: 按文件类型加权，如 {'sas': 1.2, 'log': 0.8}
+    - depth_penalty: 每多一级目录的得分衰减比例
+    """
+
+    def __init__(
+        self,
+        title_weight: float = 10.0,
+        content_weight: float = 1.0,
+        keywords_weight: float = 5.0,
+        recency_boost: float = 0.0,
+        recency_half_life_days: float = 365.0,
+        type_boosts: Optional[Dict[str, float]] = None,
+        depth_penalty: float = 0.0,
+    ):
+        self.title_weight = title_weight
+        self.content_weight = content_weight
+        self.keywords_weight = keywords_weight
+        self.recency_boost = recency_boost
+        self.recency_half_life_days = recency_half_life_days
+        self.type_boosts = type_boosts or {}
+        self.depth_penalty = depth_penalty
+
+    @property
+    def needs_file_metadata(self) -> bool:
+        """是否需要关联 files 表 (修改时间 / 文件类型 / 路径深度；FTS 表不保存 file_path)"""
+        return bool(self.recency_boost or self.type_boosts or self.depth_penalty)
+
+    def score_sql(self, fts_table: str, path_column: str, files_alias: str = "f") -> tuple[str, list]:
+        """
+        生成得分表达式及参数 (得分越小越相关，与 FTS5 rank 约定一致)
+
+        fts_table: FTS5 表名 (search_index / bigram_index)，列顺序为 file_path, title, content, keywords
+        path_column: 用于计算目录深度的路径列
+        files_alias: 关联 files 表时使用的别名
+        """
+        expr = f"bm25({fts_table}, 0.0, ?, ?, ?)"
+        params = [self.title_weight, self.content_weight, self.keywords_weight]
+
+        if self.recency_boost:
+            # 双曲衰减: 半衰期时为 0.5，越新越接近 1
+            expr += (
+                f" * (1.0 + ? * (? / (? + MAX(0.0, (? - COALESCE({files_alias}.last_modified, 0)) / 86400.0))))"
+            )
+            half_life = self.recency_half_life_days
+            params.extend([self.recency_boost, half_life, half_life, time.time()])
+
+        if self.type_boosts:
+            cases = " ".join("WHEN ? THEN ?" for _ in self.type_boosts)
+            expr += f" * (CASE {files_alias}.file_type {cases} ELSE 1.0 END)"
+            for file_type, boost in self.type_boosts.items():
+                params.extend([file_type.lower().lstrip('.'), boost])
+
+        if self.depth_penalty:
+            expr += f" / (1.0 + ? * (LENGTH({path_column}) - LENGTH(REPLACE({path_column}, ?, ''))))"
+            params.extend([self.depth_penalty, os.sep])
+
+        return expr, params
+
+
+# 预置排序方案，可通过 /search?ranking=<name> 选择
+RANKING_PROFILES = {
+    # 列权重 + 轻度时效加权
+    "default": RankingProfile(recency_boost=0.2),
+    # 只看文本相关度
+    "relevance": RankingProfile(),
+    # 优先最近修改的文件
+    "recent": RankingProfile(recency_boost=1.0, recency_half_life_days=90.0),
+    # 优先程序代码 (keywords 中的函数/宏/数据集名)
+    "code": RankingProfile(keywords_weight=10.0, type_boosts={'sas': 1.5, 'py': 1.3, 'r': 1.3}),
+}
+
+
+def get_ranking_profile(name: Optional[str]) -> RankingProfile:
+    return RANKING_PROFILES.get(name or "default", RANKING_PROFILES["default"])
@@ -0,0 +1,366 @@
+"""
+正则搜索
+- 从正则中提取必须出现的字面量 (如 %macro\\s+\\w+_adsl -> "%macro" AND "_adsl")，
+  编译为 trigram 索引的 MATCH 表达式，先缩小候选文档范围
+- 候选文档按批交给工作进程，用编译后的正则逐个验证，返回命中所在行号与位置标签
+- 提取不到任何字面量时才全表扫描，并受时间预算限制
+"""
+
+import os
+import re
+import time
+import logging
+import multiprocessing
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from ..core import database
+from ..core.database import get_db_connection
+from .snippets import DEFAULT_CONTEXT, parse_location
+from .query_parser import Term, And, Or, Field, MIN_TRIGRAM_TERM_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# 每批交给工作进程验证的文档数
+REGEX_BATCH_SIZE = 50
+
+REGEX_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+# 同时在途的批次数，限制预取量，消费方停止后不会多做太多无用功
+MAX_PENDING_BATCHES = REGEX_WORKERS * 2
+
+# 无法提取字面量时全表扫描的时间预算
+FULL_SCAN_BUDGET_MS = 5000
+
+# 每个文档返回的命中行数和统计的命中次数上限
+MAX_MATCH_LINES = 5
+MAX_COUNTED_MATCHES = 1000
+
+# 等待工作进程时检查取消的间隔 (秒)
+POLL_INTERVAL = 0.05
+
+_REPEAT_OPS = tuple(op for op in (
+    sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)
+) if op is not None)
+_ATOMIC_GROUP = getattr(sre_parse, 'ATOMIC_GROUP', None)
+
+
+class RegexSearchError(ValueError):
+    """正则表达式无效"""
+
+
+def compile_pattern(pattern: str, case_sensitive: bool = False) -> re.Pattern:
+    """编译用户输入的正则 (默认忽略大小写，^ $ 按行匹配)"""
+    flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+    try:
+        return re.compile(pattern, flags)
+    except re.error as e:
+        raise RegexSearchError(f"Invalid regular expression: {e}") from e
+
+
+def _literal_text(items) -> Optional[str]:
+    """子模式只由普通字符组成时返回对应字符串"""
+    chars = []
+    for op, av in items:
+        if op is not sre_parse.LITERAL:
+            return None
+        chars.append(chr(av))
+    return ''.join(chars)
+
+
+def _required(items):
+    """子模式中必须出现的字面量，返回 Term/And/Or 语法树 (提取不到时返回 None)"""
+    required = []
+    run = []
+
+    def flush():
+        text = ''.join(run)
+        if len(text) >= MIN_TRIGRAM_TERM_LENGTH:
+            required.append(Term(text, phrase=True))
+        run.clear()
+
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+        elif op is sre_parse.AT:
+            # ^ $ \b 等零宽断言不打断相邻字面量
+            continue
+        elif op is sre_parse.SUBPATTERN or (_ATOMIC_GROUP is not None and op is _ATOMIC_GROUP):
+            sub = av[-1] if op is sre_parse.SUBPATTERN else av
+            text = _literal_text(sub)
+            if text is not None:
+                run.append(text)
+                continue
+            flush()
+            node = _required(sub)
+            if node is not None:
+                required.append(node)
+        elif op in _REPEAT_OPS:
+            flush()
+            low, _, sub = av
+            if low >= 1:
+                node = _required(sub)
+                if node is not None:
+                    required.append(node)
+        elif op is sre_parse.BRANCH:
+            flush()
+            branches = [_required(branch) for branch in av[1]]
+            # 任一分支没有必需字面量时，整个分支结构都不能用于过滤
+            if branches and all(node is not None for node in branches):
+                required.append(Or(branches))
+        else:
+            flush()
+    flush()
+
+    if not required:
+        return None
+    return required[0] if len(required) == 1 else And(required)
+
+
+def literal_query(pattern: re.Pattern):
+    """
+    正则的字面量预过滤条件 (限定在 content 列)，供 compile_query 编译为 trigram MATCH
+    提取不到长度 >= 3 的必需字面量时返回 None
+    """
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception as e:
+        logger.info(f"Cannot analyse regex for literals ({e}), falling back to full scan")
+        return None
+    node = _required(parsed)
+    return Field('content', node) if node is not None else None
+
+
+def _match_lines(content: str, pattern: re.Pattern, locations: list) -> dict:
+    """在正文中查找全部命中，按行聚合为摘要"""
+    offsets = [offset for offset, _ in locations]
+    lines = {}
+    hit_count = 0
+    line_no = 1
+    cursor = 0
+    for m in pattern.finditer(content):
+        start, end = m.span()
+        if start == end:
+            continue
+        hit_count += 1
+        if hit_count > MAX_COUNTED_MATCHES:
+            break
+        line_no += content.count('\n', cursor, start)
+        cursor = start
+        if line_no in lines:
+            lines[line_no]['matches'].append([start, end])
+        elif len(lines) < MAX_MATCH_LINES:
+            lines[line_no] = {'line': line_no, 'matches': [[start, end]]}
+
+    snippets = []
+    hit_locations = []
+    for line in lines.values():
+        matches = line['matches']
+        line_start = content.rfind('\n', 0, matches[0][0]) + 1
+        line_end = content.find('\n', matches[-1][1])
+        if line_end < 0:
+            line_end = len(content)
+        # 超长的行只截取命中附近的部分
+        start = max(line_start, matches[0][0] - DEFAULT_CONTEXT)
+        end = min(line_end, matches[-1][1] + DEFAULT_CONTEXT)
+        parts = []
+        pos = start
+        for s, e in matches:
+            s, e = max(s, pos), min(e, end)
+            if s >= e:
+                continue
+            parts.append(content[pos:s])
+            parts.append(f"<b>{content[s:e]}</b>")
+            pos = e
+        parts.append(content[pos:end])
+        text = ''.join(parts)
+        if start > line_start:
+            text = "..." + text
+        if end < line_end:
+            text = text + "..."
+
+        idx = bisect_right(offsets, matches[0][0]) - 1
+        location = parse_location(locations[idx][1]) if idx >= 0 else None
+        label = locations[idx][1] if idx >= 0 else f"Line:{line['line']}"
+        if label not in hit_locations:
+            hit_locations.append(label)
+        snippets.append({
+            'text': text,
+            'start': start,
+            'end': end,
+            'matches': matches,
+            'hit_count': len(matches),
+            'location': location,
+            'line': line['line'],
+        })
+    return {'hit_count': min(hit_count, MAX_COUNTED_MATCHES), 'snippets': snippets, 'locations': hit_locations}
+
+
+def verify_rows(conn, rowids: List[int], pattern: str, flags: int) -> list:
+    """
+    读取一批文档并用正则验证，返回命中的文档 (保持 rowids 的顺序)
+    [(rowid, result_dict), ...]
+    """
+    if not rowids:
+        return []
+    compiled = re.compile(pattern, flags)
+    placeholders = ','.join('?' * len(rowids))
+    locations = {}
+    for doc_id, offset, label in conn.execute(f"""
+        SELECT doc_id, offset, label FROM doc_locations
+        WHERE doc_id IN ({placeholders})
+        ORDER BY doc_id, offset
+    """, tuple(rowids)):
+        locations.setdefault(doc_id, []).append((offset, label))
+
+    documents = {}
+    for rowid, file_path, title, content in conn.execute(f"""
+        SELECT doc_id, file_path, title, decompress(content)
+        FROM documents
+        WHERE doc_id IN ({placeholders})
+    """, tuple(rowids)):
+        info = _match_lines(content or "", compiled, locations.get(rowid, []))
+        if not info['hit_count']:
+            continue
+        snippets = info['snippets']
+        documents[rowid] = {
+            'file_path': file_path,
+            'title': title,
+            'highlight': snippets[0]['text'],
+            'snippets': snippets,
+            'hit_count': info['hit_count'],
+            'hit_locations': info['locations'],
+            'match_type': 'regex',
+        }
+    return [(rowid, documents[rowid]) for rowid in rowids if rowid in documents]
+
+
+_worker_conns = {}
+
+
+def _verify_in_worker(db_path: Optional[str], rowids: List[int], pattern: str, flags: int) -> list:
+    """工作进程入口: 每个进程为每个库 (主库或分片) 保持一个只读用途的数据库连接"""
+    conn = _worker_conns.get(db_path)
+    if conn is None:
+        conn = _worker_conns[db_path] = get_db_connection(db_path)
+        conn.row_factory = None
+    return verify_rows(conn, rowids, pattern, flags)
+
+
+def _warm_up():
+    """空任务: 让工作进程提前启动并导入本模块"""
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_failed = False
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    懒加载的进程池；无法创建时返回 None，由调用方在当前线程验证
+    工作进程用 spawn 启动: 服务进程中有搜索/后台线程和打开的 SQLite 连接，
+    fork 会把其它线程持有的锁原样复制到子进程中，可能死锁
+    """
+    global _pool, _pool_failed
+    if _pool is None and not _pool_failed:
+        try:
+            _pool = ProcessPoolExecutor(max_workers=REGEX_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        except (OSError, NotImplementedError, ValueError) as e:
+            logger.warning(f"Regex worker pool unavailable, verifying in-process: {e}")
+            _pool_failed = True
+    return _pool
+
+
+def start_regex_pool():
+    """启动时创建进程池并预先启动工作进程 (spawn 启动较慢，不让第一次正则搜索等待)"""
+    pool = _get_pool()
+    if pool is not None:
+        for _ in range(REGEX_WORKERS):
+            pool.submit(_warm_up)
+
+
+def shutdown_regex_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class RegexScan:
+    """
+    一次正则搜索的候选验证过程
+    iter_batches(conn, batches) 按候选顺序产出命中文档 (conn 与 db_path 指向同一个库)；
+    结束后 truncated 表示全表扫描因时间预算提前停止
+    """
+
+    def __init__(self, pattern: re.Pattern, token=None, budget_ms: Optional[int] = None, db_path: Optional[str] = None):
+        self.pattern = pattern
+        self.token = token
+        self.db_path = db_path
+        self.deadline = time.monotonic() + budget_ms / 1000 if budget_ms else None
+        self.scanned = 0
+        self.truncated = False
+
+    def _over_budget(self) -> bool:
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.truncated = True
+            return True
+        return False
+
+    def _check(self):
+        if self.token:
+            self.token.check()
+
+    def iter_batches(self, conn, batches):
+        """batches: 产出 rowid 列表的迭代器"""
+        pool = _get_pool()
+        if pool is None:
+            yield from self._iter_inline(conn, batches)
+            return
+
+        pending = []
+        batches = iter(batches)
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < MAX_PENDING_BATCHES and not self._over_budget():
+                    self._check()
+                    rowids = next(batches, None)
+                    if rowids is None:
+                        exhausted = True
+                        break
+                    self.scanned += len(rowids)
+                    # 工作进程不继承本进程中修改过的模块状态，主库路径显式传入
+                    db_path = self.db_path or database.DB_PATH
+                    pending.append(pool.submit(_verify_in_worker, db_path, rowids, self.pattern.pattern, self.pattern.flags))
+                if not pending:
+                    return
+                # 按提交顺序产出，保持候选的排序
+                head = pending[0]
+                while not head.done():
+                    self._check()
+                    if self._over_budget():
+                        # 全表扫描超出预算: 丢弃尚未完成的批次
+                        return
+                    wait([head], timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                pending.pop(0)
+                for _, result in head.result():
+                    yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _iter_inline(self, conn, batches):
+        for rowids in batches:
+            self._check()
+            if self._over_budget():
+                return
+            self.scanned += len(rowids)
+            for _, result in verify_rows(conn, rowids, self.pattern.pattern, self.pattern.flags):
+                yield result
@@ -1,8 +1,36 @@
 import re
 import os
+import time
+import sqlite3
+from itertools import islice
 from ..core.database import get_db_connection
 from .fuzzy_matcher import FuzzySearchEngine
+from .thesaurus import get_thesaurus
 from .search_precision import SearchPrecisionController, PrecisionLevel
+from .ranking import RankingProfile, get_ranking_profile
+from .snippets import SnippetBuilder
+from .cancellation import CancellationToken, SearchCancelled
+from .pinyin_index import is_pinyin_query
+from .facets import facet_groups, summarize_facets, empty_facets
+from .near_duplicates import ResultCollapser
+from .filters import SearchFilters
+from .semantic_index import get_semantic_index, SemanticIndexUnavailable, NUMPY_AVAILABLE
+from .shards import databases_in_scope, map_databases, merge_ranked
+from .regex_search import RegexScan, compile_pattern, literal_query, REGEX_BATCH_SIZE, FULL_SCAN_BUDGET_MS
+from .query_parser import (
+    QueryParseError, Term, And, Or, Not, Near, Field,
+    parse_query, parse_plain, compile_query, iter_terms, requires_bigram_index, is_short_term
+)
+
+# 每批从排序结果中读取的行数 (按需翻倍，直到填满一页)
+SEARCH_BATCH_SIZE = 20
+MAX_SEARCH_BATCH_SIZE = 500
+
+# 查询中连续多少个词可以整体匹配领域词库中的多词条目
+MAX_THESAURUS_WORDS = 4
+
+# 语义 (混合) 搜索: RRF 的平滑常数
+RRF_K = 60
 
 class SearchEngine:
     def __init__(self):
@@ -15,390 +43,657 @@ class SearchEngine:
         pattern = r'(\[(?:Page|Sheet|Row|Col|Slide|Para|Table).*?\])'
         return re.sub(pattern, r'<span class="meta">\1</span>', text)
 
-    def _parse_logical_query(self, query: str) -> tuple[str, list[str]]:
+    def _parse(self, query: str):
+        """解析查询语法；语法错误时降级为普通词的 AND 组合"""
+        try:
+            return parse_query(query)
+        except QueryParseError as e:
+            import logging
+            logging.getLogger(__name__).info(f"Query syntax error ({e}), searching as plain words")
+            return parse_plain(query)
+
+    def _expand(self, node):
+        """对语法树中的普通查询词做同义词/纠错扩展 (短语和排除词保持不变)"""
+        if isinstance(node, Term):
+            if node.phrase:
+                return node
+            return self._variants_node([node], self.fuzzy_engine.expand_query(node.text))
+        if isinstance(node, And):
+            return And(self._expand_children(node.children))
+        if isinstance(node, Or):
+            return Or([self._expand(c) for c in node.children])
+        if isinstance(node, Not):
+            return Not(self._expand(node.left), node.right)
+        if isinstance(node, Field):
+            return Field(node.column, self._expand(node.child))
+        return node
+
+    def _expand_children(self, children: list) -> list:
+        """相邻的普通词先整体查领域词库 (如 adverse event -> AE / 不良事件)，未命中的词逐个扩展"""
+        thesaurus = get_thesaurus()
+        expanded = []
+        i = 0
+        while i < len(children):
+            run = []
+            for child in children[i:i + MAX_THESAURUS_WORDS]:
+                if not isinstance(child, Term) or child.phrase:
+                    break
+                run.append(child)
+            for length in range(len(run), 1, -1):
+                variants = thesaurus.expand(' '.join(t.text for t in run[:length]))
+                if variants:
+                    expanded.append(self._variants_node(run[:length], variants))
+                    i += length
+                    break
+            else:
+                expanded.append(self._expand(children[i]))
+                i += 1
+        return expanded
+
+    def _variants_node(self, terms: list, candidates: list):
+        """terms (原查询词) 与扩展词组成 OR；扩展出的短词不加入 (会使整条查询改走 bigram 索引)"""
+        text = ' '.join(t.text for t in terms)
+        variants = [text]
+        for variant in candidates:
+            if variant.lower() != text.lower() and not is_short_term(variant):
+                variants.append(variant)
+        # Limit expansion to avoid overly complex queries
+        variants = variants[:5]
+        if len(variants) == 1:
+            return terms[0] if len(terms) == 1 else And(terms)
+        children = []
+        for variant in variants:
+            words = [Term(w) for w in variant.split()]
+            children.append(words[0] if len(words) == 1 else And(words))
+        return Or(children)
+
+    def _path_filter(self, paths: list[str], rowid_column: str = "rowid", filters: SearchFilters = None) -> tuple[str, list]:
         """
-        解析逻辑查询语法 (AND/OR)
-        返回: (operator, terms_list)
+        Build the scope clause (case-insensitive path prefix) and selected facet filters pushed into the SQL.
+        Both are checked on the files table in one uncorrelated subquery over doc_id,
+        since the contentless FTS tables store no file paths.
         """
-        query = query.strip()
-        
-        # 检查是否包含 AND 或 OR (大小写不敏感)
-        # 优先处理 AND（更严格）
-        if re.search(r'\s+AND\s+', query, re.IGNORECASE):
-            terms = re.split(r'\s+AND\s+', query, flags=re.IGNORECASE)
-            return ('AND', [t.strip() for t in terms if t.strip()])
-        elif re.search(r'\s+OR\s+', query, re.IGNORECASE):
-            terms = re.split(r'\s+OR\s+', query, flags=re.IGNORECASE)
-            return ('OR', [t.strip() for t in terms if t.strip()])
-        else:
-            return ('NONE', [query])
+        conditions, params = [], []
+        if paths:
+            conditions.append("(" + " OR ".join("LOWER(file_path) LIKE ?" for _ in paths) + ")")
+            params.extend(f"{path.lower()}%" for path in paths)
+        if filters:
+            filter_conditions, filter_params = filters.conditions()
+            conditions += filter_conditions
+            params += filter_params
+        if not conditions:
+            return "", []
+        # "+" keeps FTS5 from re-running MATCH once per rowid in the IN list
+        return f" AND +{rowid_column} IN (SELECT doc_id FROM files WHERE {' AND '.join(conditions)})", params
 
-    def search(self, query: str, limit: int = 50, precision: str = "medium", paths: list[str] = None):
+    def _ranked_sql(self, fts_table: str, profile: RankingProfile, path_sql: str, order: bool = True) -> tuple[str, list]:
         """
-        Perform full-text search using SQLite FTS5 with V2.1 logic integration.
-        Supports AND/OR logical operators.
+        Query returning (rowid, score) ordered by the ranking profile.
+        Scoring and ordering happen inside SQLite; rows are consumed lazily.
+        """
+        score_sql, score_params = profile.score_sql(fts_table, "f.file_path")
+        sql = f"""
+            SELECT {fts_table}.rowid AS rowid, {score_sql} AS score
+            FROM {fts_table}
         """
+        if profile.needs_file_metadata:
+            sql += f" LEFT JOIN files f ON f.doc_id = {fts_table}.rowid"
+        sql += f" WHERE {fts_table} MATCH ? {path_sql}"
+        if order:
+            sql += " ORDER BY score"
+        return sql, score_params
+
+    def _prepare(self, query: str, precision: str, paths: list[str]):
+        """Parse and expand the query and normalize scope paths -> (query_tree, normalized_paths)."""
         import logging
         logger = logging.getLogger(__name__)
         
-        # 解析逻辑查询
-        operator, query_terms = self._parse_logical_query(query)
-        logger.info(f"Logical operator: {operator}, terms: {query_terms}")
+        # 解析查询语法
+        query_tree = self._parse(query)
+        if query_tree is None:
+            return None, None
+        
+        # 1. Expand Query (V2.1 Logic)
+        # Only expand if precision is NOT exact
+        if precision != PrecisionLevel.EXACT:
+            query_tree = self._expand(query_tree)
+        logger.info(f"Query tree: {query_tree}")
         
         # 标准化路径以匹配数据库中的格式
         normalized_paths = None
         if paths:
             normalized_paths = [os.path.normpath(os.path.abspath(p)) for p in paths]
             logger.info(f"Search paths normalized: {normalized_paths}")
+        return query_tree, normalized_paths
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 检查数据库是否有数据
-        cursor.execute("SELECT COUNT(*) as total FROM search_index")
-        total_records = cursor.fetchone()['total']
-        logger.info(f"Total records in search_index: {total_records}")
-        
-        if total_records == 0:
-            logger.warning("Search index is empty!")
-            conn.close()
-            return []
-        
-        # 对于 AND 查询，需要特殊处理
-        if operator == 'AND':
-            return self._search_with_and(cursor, query_terms, limit, conn, normalized_paths, precision)
-        elif operator == 'OR':
-            return self._search_with_or(cursor, query_terms, limit, conn, normalized_paths, precision)
+    def search(self, query: str, limit: int = 50, precision: str = "medium", paths: list[str] = None,
+               ranking: str = None, offset: int = 0, token: CancellationToken = None, filters: SearchFilters = None,
+               collapse: bool = False):
+        """
+        Perform full-text search using SQLite FTS5 with V2.1 logic integration.
+        Returns one page of quality-filtered results (see iter_search).
+        """
+        results = self.iter_search(query, precision, paths, ranking, batch_size=offset + limit, token=token,
+                                   filters=filters, collapse=collapse)
+        try:
+            return list(islice(results, offset, offset + limit))
+        finally:
+            results.close()
+
+    def iter_search(self, query: str, precision: str = "medium", paths: list[str] = None,
+                    ranking: str = None, batch_size: int = SEARCH_BATCH_SIZE, token: CancellationToken = None,
+                    filters: SearchFilters = None, collapse: bool = False):
+        """
+        Yield search results in ranked order.
+        The query (AND/OR/NOT, parentheses, phrases, NEAR/k, field filters) is
+        compiled into a single MATCH expression; scope paths are pushed into the same SQL.
+        Results are ordered by the named ranking profile (see ranking.RANKING_PROFILES).
+        Filters (file type, folder, modification date/year, size; see filters.py)
+        are pushed into the same SQL as indexed predicates on `files`.
+        Ranked rows are pulled from SQLite in batches and low-quality snippets are
+        skipped on the fly, so callers get full pages without over-fetching.
+        If a cancellation token is given, running statements are aborted once it is
+        cancelled or its deadline passes, and SearchCancelled is raised.
+        With collapse, near-duplicate versions of a document (see near_duplicates.py)
+        are collapsed to their newest member at the position of the best-ranked one;
+        the result then carries 'similar_versions' (count) and 'versions' (list).
+        When the scope spans several shards (see shards.py), the same query runs on
+        each shard in parallel and the ranked results are merged by rank.
+        """
+        import logging
+        logger = logging.getLogger(__name__)
         
-        # 单一查询词的原有逻辑
-        query = query_terms[0]
+        query_tree, normalized_paths = self._prepare(query, precision, paths)
+        if query_tree is None:
+            return
+
+        profile = get_ranking_profile(ranking)
         
-        # Check if we should use LIKE fallback for short CJK queries
+        # Queries containing short terms go to the bigram index
         # Trigram tokenizer fails to MATCH terms < 3 chars
-        use_like_fallback = self._is_short_cjk(query)
-        logger.info(f"Using LIKE fallback: {use_like_fallback}")
-        
-        if use_like_fallback:
-            return self._search_with_like(cursor, query, limit, conn, normalized_paths)
+        use_bigram_index = requires_bigram_index(query_tree)
+        logger.info(f"Using bigram index: {use_bigram_index}")
+        
+        databases = databases_in_scope(normalized_paths)
+        if len(databases) == 1:
+            yield from self._iter_database(databases[0], query, query_tree, normalized_paths, precision, profile,
+                                           use_bigram_index, batch_size, token, filters, collapse)
+        elif databases:
+            logger.info(f"Searching {len(databases)} shards")
+            # 每个库先读取一页的均分份额 (摘要只为这些行生成)，归并时不够再按需翻倍读取
+            shard_batch_size = -(-batch_size // len(databases))
+            yield from merge_ranked([
+                lambda db_path=db_path: self._iter_database(
+                    db_path, query, query_tree, normalized_paths, precision, profile,
+                    use_bigram_index, shard_batch_size, token, filters, collapse)
+                for db_path in databases
+            ], shard_batch_size)
 
-        # 1. Expand Query (V2.1 Logic)
-        # Only expand if precision is NOT exact
-        search_terms = [query]
-        if precision != PrecisionLevel.EXACT:
-            expanded_terms = self.fuzzy_engine.expand_query(query)
-            # Limit expansion to avoid overly complex queries
-            search_terms = list(expanded_terms)[:5] 
-        
-        logger.info(f"Search terms: {search_terms}")
+    def _iter_database(self, db_path, query: str, query_tree, normalized_paths: list[str], precision: str,
+                       profile: RankingProfile, use_bigram_index: bool, batch_size: int,
+                       token: CancellationToken = None, filters: SearchFilters = None, collapse: bool = False):
+        """Ranked, quality-filtered results of one database (db_path None: the main database)."""
+        import logging
+        logger = logging.getLogger(__name__)
         
-        # 2. Construct FTS Query
-        fts_query_parts = []
-        for term in search_terms:
-            words = term.strip().split()
-            word_parts = []
-            for word in words:
-                clean_word = word.replace('"', '""')
-                word_parts.append(f'"{clean_word}"*')
+        conn = get_db_connection(db_path)
+        if token:
+            token.attach(conn)
+        try:
+            collapser = None
+            if collapse:
+                collapser = ResultCollapser(conn, *self._path_filter(normalized_paths, "m.doc_id", filters))
+            if precision == PrecisionLevel.SEMANTIC:
+                rows = self._iter_semantic_results(conn, query_tree, normalized_paths, profile, batch_size, filters,
+                                                   collapser, use_semantic_index=db_path is None)
+            elif use_bigram_index:
+                rows = self._iter_bigram_results(conn, query_tree, normalized_paths, profile, batch_size, filters, collapser)
+            else:
+                rows = self._iter_trigram_results(conn, query_tree, normalized_paths, profile, batch_size, filters, collapser)
             
-            if word_parts:
-                fts_query_parts.append(f"({' AND '.join(word_parts)})")
-        
-        fts_query_str = " OR ".join(fts_query_parts)
-        logger.info(f"FTS query: {fts_query_str}")
-        
-        # 3. Execute Search - 增加snippet长度以包含位置信息
-        base_sql = """
-        SELECT 
-            file_path, 
-            title, 
-            snippet(search_index, 2, '<b>', '</b>', '...', 64) as highlight,
-            rank
-        FROM search_index 
-        WHERE search_index MATCH ? 
+            # Filter Results and enhance with location info
+            for res in rows:
+                # Highlight metadata tags in the snippets
+                res['highlight'] = self._highlight_metadata(res['highlight'])
+                for snippet in res['snippets']:
+                    snippet['text'] = self._highlight_metadata(snippet['text'])
+                
+                content_snippet = res['highlight'].replace('<b>', '').replace('</b>', '')
+                if self.precision_controller.is_content_quality_acceptable(content_snippet):
+                    if token:
+                        token.check()
+                    yield res
+        except sqlite3.Error as e:
+            if token and token.cancelled:
+                logger.info(f"Search aborted ({token.reason}): {query}")
+                raise SearchCancelled(token.reason)
+            logger.error(f"Search error: {e}")
+        finally:
+            if token:
+                token.detach(conn)
+            conn.close()
+
+    def iter_regex_search(self, pattern: str, paths: list[str] = None, ranking: str = None,
+                          case_sensitive: bool = False, token: CancellationToken = None, stats: dict = None,
+                          filters: SearchFilters = None):
         """
+        Yield documents whose content matches a regular expression.
+        Literals required by the pattern are compiled into a trigram MATCH to
+        narrow the candidates (ranked by the ranking profile); candidates are
+        verified with the compiled regex in worker processes. Patterns without
+        extractable literals fall back to a full scan limited to FULL_SCAN_BUDGET_MS.
+        If given, stats is filled with the prefilter query, scanned count and
+        whether the full scan was truncated.
+        Raises RegexSearchError for an invalid pattern.
+        """
+        import logging
+        logger = logging.getLogger(__name__)
         
-        params = [fts_query_str]
-        
-        # Add path filtering if provided
-        if normalized_paths:
-            path_clauses = []
-            for path in normalized_paths:
-                # Use LIKE for path prefix matching (Case Insensitive)
-                path_clauses.append("LOWER(file_path) LIKE ?")
-                params.append(f"{path.lower()}%")
-            
-            if path_clauses:
-                base_sql += f" AND ({' OR '.join(path_clauses)})"
-                logger.info(f"Added path filtering: {path_clauses}")
+        compiled = compile_pattern(pattern, case_sensitive)
+        prefilter = literal_query(compiled)
+        fts_query_str = compile_query(prefilter, 'search_index') if prefilter is not None else None
+        logger.info(f"Regex search: pattern={pattern!r}, prefilter={fts_query_str!r}")
         
-        base_sql += " ORDER BY rank LIMIT ?"
-        params.append(limit * 2)
+        normalized_paths = None
+        if paths:
+            normalized_paths = [os.path.normpath(os.path.abspath(p)) for p in paths]
+        path_sql, path_params = self._path_filter(normalized_paths, "search_index.rowid", filters)
         
-        logger.info(f"Final SQL: {base_sql}")
-        logger.info(f"SQL params: {params}")
+        if fts_query_str:
+            ranked_sql, score_params = self._ranked_sql('search_index', get_ranking_profile(ranking), path_sql)
+            candidate_sql, params = ranked_sql, score_params + [fts_query_str] + path_params
+            deadline = None
+        else:
+            path_sql, path_params = self._path_filter(normalized_paths, "doc_id", filters)
+            candidate_sql = f"SELECT doc_id AS rowid FROM documents WHERE 1 {path_sql}"
+            params = path_params
+            # 全表扫描的时间预算由范围内的各分片共用
+            deadline = time.monotonic() + FULL_SCAN_BUDGET_MS / 1000
+        
+        # 分片依次扫描 (正则验证本身已在进程池中并行)
+        scans = []
+        truncated = False
+        try:
+            for db_path in databases_in_scope(normalized_paths):
+                budget_ms = None
+                if deadline is not None:
+                    budget_ms = (deadline - time.monotonic()) * 1000
+                    if budget_ms <= 0:
+                        truncated = True
+                        break
+                scan = RegexScan(compiled, token, budget_ms=budget_ms, db_path=db_path)
+                scans.append(scan)
+                yield from self._iter_regex_database(db_path, pattern, candidate_sql, params, scan, token)
+        finally:
+            if stats is not None:
+                stats.update({
+                    'prefilter': fts_query_str,
+                    'scanned': sum(scan.scanned for scan in scans),
+                    'truncated': truncated or any(scan.truncated for scan in scans),
+                })
+
+    def _iter_regex_database(self, db_path, pattern: str, candidate_sql: str, params: list, scan: RegexScan,
+                             token: CancellationToken = None):
+        """Verified regex matches among the candidates of one database."""
+        import logging
+        logger = logging.getLogger(__name__)
         
+        conn = get_db_connection(db_path)
+        if token:
+            token.attach(conn)
         try:
-            cursor.execute(base_sql, tuple(params)) 
-            raw_results = [dict(row) for row in cursor.fetchall()]
-            logger.info(f"Raw results count: {len(raw_results)}")
-        except Exception as e:
-            logger.error(f"Search error: {e}")
+            cursor = conn.execute(candidate_sql, tuple(params))
+            batches = iter(lambda: [row['rowid'] for row in cursor.fetchmany(REGEX_BATCH_SIZE)], [])
+            for res in scan.iter_batches(conn, batches):
+                res['rank'] = 0
+                res['highlight'] = self._highlight_metadata(res['highlight'])
+                for snippet in res['snippets']:
+                    snippet['text'] = self._highlight_metadata(snippet['text'])
+                yield res
+        except sqlite3.Error as e:
+            if token and token.cancelled:
+                logger.info(f"Regex search aborted ({token.reason}): {pattern}")
+                raise SearchCancelled(token.reason)
+            logger.error(f"Regex search error: {e}")
+        finally:
+            if token:
+                token.detach(conn)
             conn.close()
-            return []
+
+    def facet_counts(self, query: str, precision: str = "medium", paths: list[str] = None,
+                     filters: SearchFilters = None, token: CancellationToken = None) -> dict:
+        """
+        Facet counts (file type, root folder, modification year) over the full
+        match set of a query, computed in one aggregated SQL pass (see facets.py)
+        per shard in scope; the shards are counted in parallel.
+        Counts are taken before snippet quality filtering.
+        """
+        import logging
+        logger = logging.getLogger(__name__)
         
-        conn.close()
+        query_tree, normalized_paths = self._prepare(query, precision, paths)
+        if query_tree is None:
+            return empty_facets()
         
-        # 4. Filter Results and enhance with location info
-        filtered_results = []
-        for res in raw_results:
-            # Highlight metadata tags in the snippet
-            res['highlight'] = self._highlight_metadata(res['highlight'])
-            
-            content_snippet = res['highlight'].replace('<b>', '').replace('</b>', '')
-            if self.precision_controller.is_content_quality_acceptable(content_snippet):
-                filtered_results.append(res)
+        # 分面计数不应用已选分面本身 (见 facets.py)，但保留时间区间和大小条件
+        base_filters = filters.without_facets() if filters else None
+        path_sql, path_params = self._path_filter(normalized_paths, "rowid", base_filters)
+        if requires_bigram_index(query_tree):
+            match_sql = f"SELECT rowid AS doc_id FROM bigram_index WHERE bigram_index MATCH ? {path_sql}"
+            params = [compile_query(query_tree, 'bigram_index')] + path_params
+        else:
+            fts_query_str = compile_query(query_tree, 'search_index')
+            match_sql = f"SELECT rowid AS doc_id FROM search_index WHERE search_index MATCH ? {path_sql}"
+            params = [fts_query_str] + path_params
+            if is_pinyin_query(query_tree):
+                match_sql += f" UNION SELECT rowid AS doc_id FROM pinyin_index WHERE pinyin_index MATCH ? {path_sql}"
+                params += [fts_query_str] + path_params
+        
+        def groups(db_path):
+            conn = get_db_connection(db_path)
+            if token:
+                token.attach(conn)
+            try:
+                return facet_groups(conn, match_sql, params, normalized_paths)
+            finally:
+                if token:
+                    token.detach(conn)
+                conn.close()
         
-        logger.info(f"Filtered results count: {len(filtered_results)}")
-        return filtered_results[:limit]
-
-    def _is_short_cjk(self, term: str) -> bool:
-        """Check if term is short CJK which fails with trigram MATCH."""
-        term = term.strip()
-        if not term:
-            return False
-        # If length is >= 3, trigram should handle it (or scan it correctly)
-        # But specifically for 1-2 char CJK, it fails often with MATCH
-        if len(term) >= 3:
-            return False
-            
-        # Check for CJK characters
-        for char in term:
-            if '\u4e00' <= char <= '\u9fff':
-                return True
-        return False
-
-    def _search_with_like(self, cursor, query: str, limit: int, conn, paths: list[str] = None, close_conn: bool = True):
-        """Fallback search using LIKE for short CJK terms."""
         try:
-            # Search in content OR title
-            # We select content to generate snippet manually
-            base_sql = """
-            SELECT file_path, title, content 
-            FROM search_index 
-            WHERE (content LIKE ? OR title LIKE ?) 
-            """
-            
-            wildcard_query = f"%{query}%"
-            params = [wildcard_query, wildcard_query]
-            
-            # Add path filtering if provided
-            if paths:
-                path_clauses = []
-                for path in paths:
-                    path_clauses.append("LOWER(file_path) LIKE ?")
-                    params.append(f"{path.lower()}%")
-                
-                if path_clauses:
-                    base_sql += f" AND ({' OR '.join(path_clauses)})"
-            
-            base_sql += " LIMIT ?"
-            params.append(limit)
-            
-            cursor.execute(base_sql, tuple(params))
-            rows = cursor.fetchall()
-            
+            shard_groups = map_databases(groups, databases_in_scope(normalized_paths))
+            return summarize_facets([group for result in shard_groups for group in result], filters)
+        except sqlite3.Error as e:
+            if token and token.cancelled:
+                raise SearchCancelled(token.reason)
+            logger.error(f"Facet count error: {e}")
+            return empty_facets()
+
+    def similar_documents(self, file_path: str, limit: int = 10, paths: list[str] = None,
+                          filters: SearchFilters = None):
+        """
+        "More like this": indexed documents most similar to file_path, ranked by
+        the cosine similarity of the per-document signature vectors stored in the
+        semantic index (the document itself is not re-read). Covers the main
+        database only, like the semantic index.
+        Returns None if file_path is not indexed; raises SemanticIndexUnavailable
+        while no semantic index is available.
+        """
+        if not NUMPY_AVAILABLE:
+            raise SemanticIndexUnavailable("numpy is not installed")
+        index = get_semantic_index()
+        if index is None:
+            raise SemanticIndexUnavailable("semantic index is being built")
+        
+        conn = get_db_connection()
+        try:
+            row = conn.execute("SELECT doc_id FROM files WHERE file_path = ?", (file_path,)).fetchone()
+            if row is None or row['doc_id'] is None:
+                return None
+            # 多取一些候选，搜索范围和过滤条件在 SQL 中应用
+            candidates = index.similar(row['doc_id'], limit * 3 if paths or filters else limit)
+            if not candidates:
+                return []
+            path_sql, path_params = self._path_filter(paths, "d.doc_id", filters)
+            placeholders = ','.join('?' * len(candidates))
+            documents = {r['rowid']: r for r in conn.execute(f"""
+                SELECT d.doc_id AS rowid, d.file_path AS file_path, d.title AS title,
+                       f.file_type AS file_type, f.last_modified AS last_modified, f.file_size AS file_size
+                FROM documents d
+                LEFT JOIN files f ON f.doc_id = d.doc_id
+                WHERE d.doc_id IN ({placeholders}) {path_sql}
+            """, tuple(doc_id for doc_id, _ in candidates) + tuple(path_params))}
             results = []
-            for row in rows:
-                content = row['content'] or ""
-                title = row['title'] or ""
-                snippet = self._generate_snippet(content, query)
-                snippet = self._highlight_metadata(snippet)
-                
-                # Calculate pseudo-rank (higher count = better)
-                # FTS5 returns negative for better rank (usually). 
-                # Let's return negative count to match "lower is better" convention.
-                q_lower = query.lower()
-                c_count = content.lower().count(q_lower)
-                t_count = title.lower().count(q_lower)
-                score = c_count + (t_count * 5) # Weighted score
-                
+            for doc_id, score in candidates:
+                document = documents.get(doc_id)
+                if document is None:
+                    continue
                 results.append({
-                    'file_path': row['file_path'],
-                    'title': row['title'],
-                    'highlight': snippet,
-                    'rank': -score  # Negative score for sorting
+                    'file_path': document['file_path'],
+                    'title': document['title'],
+                    'file_type': document['file_type'],
+                    'last_modified': document['last_modified'],
+                    'file_size': document['file_size'],
+                    'similarity': round(min(score, 1.0), 4),
                 })
-            
-            # Sort by rank (ascending, so more negative is first)
-            results.sort(key=lambda x: x['rank'])
-            
-            conn.close() if close_conn else None
+                if len(results) >= limit:
+                    break
             return results
-        except Exception as e:
-            print(f"LIKE Search error: {e}")
-            if close_conn:
-                conn.close()
-            return []
+        finally:
+            conn.close()
 
-    def _generate_snippet(self, content: str, query: str, context: int = 100) -> str:
-        """Generate snippet with location metadata preserved."""
-        if not content:
-            return ""
-        
-        # Find the query in content (case insensitive)
-        idx = content.lower().find(query.lower())
-        if idx == -1:
-            # Maybe match in title? Return start of content
-            return content[:context*2] + "..."
-        
-        # Try to include location metadata before the match
-        # Look backwards for the nearest [Slide:X] or similar tag
-        start = max(0, idx - context)
-        
-        # Search backwards from match position to find location tag
-        location_pattern = r'\[(Page|Sheet|Row|Col|Slide|Para|Table):[^\]]+\]'
-        before_match = content[:idx]
-        location_matches = list(re.finditer(location_pattern, before_match))
-        
-        if location_matches:
-            # Get the last location tag before the match
-            last_location = location_matches[-1]
-            # Start from the location tag if it's within reasonable distance
-            if idx - last_location.start() < context * 2:
-                start = last_location.start()
-        
-        end = min(len(content), idx + len(query) + context)
-        snippet = content[start:end]
-        
-        if start > 0:
-            snippet = "..." + snippet
-        if end < len(content):
-            snippet = snippet + "..."
-        
-        # Highlight the query (case insensitive)
-        pattern = re.compile(re.escape(query), re.IGNORECASE)
-        snippet = pattern.sub(lambda m: f"<b>{m.group()}</b>", snippet)
-        
-        return snippet
+    def _iter_ranked(self, conn, ranked_sql: str, params: list, load_batch, batch_size: int,
+                     collapser: ResultCollapser = None):
+        """
+        Step through the ranked (rowid, score) cursor in batches and load the
+        display fields for each batch only when the consumer asks for more rows.
+        load_batch(rowids) -> {rowid: result_dict}
+        """
+        ranked = conn.execute(ranked_sql, tuple(params))
+        batch_size = max(batch_size, 1)
+        while True:
+            batch = ranked.fetchmany(batch_size)
+            if not batch:
+                return
+            scores = {row['rowid']: row['score'] for row in batch}
+            for rowid, res in self._load_ranked([row['rowid'] for row in batch], load_batch, collapser):
+                res['rank'] = scores[rowid]
+                yield res
+            batch_size = min(batch_size * 2, MAX_SEARCH_BATCH_SIZE)
 
-    def _search_with_and(self, cursor, terms: list[str], limit: int, conn, paths: list[str], precision: str):
+    def _load_ranked(self, rowids: list[int], load_batch, collapser: ResultCollapser = None):
+        """
+        Load one ranked batch -> (rowid, result_dict) in rank order.
+        With a collapser, later versions of an already shown cluster are skipped
+        before any snippet is built, and each cluster shows its newest version.
         """
-        AND 逻辑搜索：所有词必须同时出现在同一文档中
+        if collapser is None:
+            details = load_batch(rowids)
+            for rowid in rowids:
+                if rowid in details:
+                    yield rowid, details[rowid]
+            return
+        groups = collapser.collapse(rowids)
+        details = load_batch(list(dict.fromkeys(representative for _, representative, _, _ in groups)))
+        for rowid, representative, versions, version_count in groups:
+            res = details.get(representative)
+            if res is not None:
+                res['similar_versions'] = version_count
+                res['versions'] = versions
+                yield rowid, res
+
+    def _load_documents(self, conn, rowids: list[int], builder: SnippetBuilder, fallback_offsets: dict = None) -> dict:
         """
+        Load title/content for a batch of hits and build structured snippets.
+        Location labels come from the offsets stored in doc_locations.
+        fallback_offsets: {rowid: offset} shown when no query term occurs in the content.
+        """
+        placeholders = ','.join('?' * len(rowids))
+        locations = {}
+        for row in conn.execute(f"""
+            SELECT doc_id, offset, label FROM doc_locations
+            WHERE doc_id IN ({placeholders})
+            ORDER BY doc_id, offset
+        """, tuple(rowids)):
+            locations.setdefault(row['doc_id'], []).append((row['offset'], row['label']))
+        
+        documents = {}
+        for row in conn.execute(f"""
+            SELECT doc_id AS rowid, file_path, title, decompress(content) AS content
+            FROM documents
+            WHERE doc_id IN ({placeholders})
+        """, tuple(rowids)):
+            snippet_info = builder.build(row['content'], locations.get(row['rowid']),
+                                         (fallback_offsets or {}).get(row['rowid'], 0))
+            snippets = snippet_info['snippets']
+            documents[row['rowid']] = {
+                'file_path': row['file_path'],
+                'title': row['title'],
+                'highlight': snippets[0]['text'] if snippets else "",
+                'snippets': snippets,
+                'hit_count': snippet_info['hit_count'],
+                'hit_locations': snippet_info['locations'],
+            }
+        return documents
+
+    def _trigram_ranked_sql(self, query_tree, paths: list[str], profile: RankingProfile,
+                            filters: SearchFilters = None) -> tuple[str, list]:
+        """Ranked (rowid, score) query over the trigram index (plus pinyin_index for pinyin input)."""
         import logging
         logger = logging.getLogger(__name__)
         
-        if not terms:
-            conn.close()
-            return []
-        
-        # 对每个词分别搜索，然后取交集
-        term_results = []
-        for term in terms:
-            use_like = self._is_short_cjk(term)
-            if use_like:
-                results = self._search_with_like(cursor, term, 200, conn, paths, close_conn=False)
-            else:
-                # 构建单词 FTS 查询
-                clean_term = term.replace('"', '""')
-                fts_query = f'"{clean_term}"*'
-                
-                sql = """
-                SELECT file_path, title, file_type,
-                       snippet(search_index, 3, '<b>', '</b>', '...', 50) as highlight,
-                       rank
-                FROM search_index
-                WHERE content MATCH ?
-                ORDER BY rank
-                LIMIT 200
-                """
-                try:
-                    cursor.execute(sql, (fts_query,))
-                    results = [dict(row) for row in cursor.fetchall()]
-                except:
-                    results = self._search_with_like(cursor, term, 200, conn, paths, close_conn=False)
-            
-            # 仅保留文件路径集合
-            file_paths = set(r['file_path'] for r in results)
-            term_results.append((file_paths, {r['file_path']: r for r in results}))
-        
-        if not term_results:
-            conn.close()
-            return []
-        
-        # 取所有词结果的交集
-        common_paths = term_results[0][0]
-        for paths_set, _ in term_results[1:]:
-            common_paths = common_paths & paths_set
-        
-        # 从第一个词的结果中获取详细信息
-        final_results = []
-        result_dict = term_results[0][1]
-        for path in common_paths:
-            if path in result_dict:
-                result = result_dict[path].copy()
-                # 高亮所有搜索词
-                for term in terms:
-                    pattern = re.compile(re.escape(term), re.IGNORECASE)
-                    result['highlight'] = pattern.sub(
-                        lambda m: f'<b>{m.group()}</b>', 
-                        result.get('highlight', '')
-                    )
-                final_results.append(result)
+        # 2. Construct FTS Query
+        fts_query_str = compile_query(query_tree, 'search_index')
+        logger.info(f"FTS query: {fts_query_str}")
         
-        conn.close()
-        return final_results[:limit]
+        # 3. Execute Search
+        path_sql, path_params = self._path_filter(paths, "search_index.rowid", filters)
+        ranked_sql, score_params = self._ranked_sql('search_index', profile, path_sql)
+        
+        params = score_params + [fts_query_str] + path_params
+        
+        if is_pinyin_query(query_tree):
+            # 拼音输入 ("yangben" / "ybl") 同时匹配 pinyin_index，两路结果按 rowid 合并取最优得分
+            pinyin_path_sql, pinyin_path_params = self._path_filter(paths, "pinyin_index.rowid", filters)
+            text_sql, _ = self._ranked_sql('search_index', profile, path_sql, order=False)
+            pinyin_sql, pinyin_score_params = self._ranked_sql('pinyin_index', profile, pinyin_path_sql, order=False)
+            ranked_sql = f"""
+                SELECT rowid, MIN(score) AS score
+                FROM ({text_sql} UNION ALL {pinyin_sql})
+                GROUP BY rowid ORDER BY score
+            """
+            params += pinyin_score_params + [fts_query_str] + pinyin_path_params
+        return ranked_sql, params
 
-    def _search_with_or(self, cursor, terms: list[str], limit: int, conn, paths: list[str], precision: str):
+    def _bigram_ranked_sql(self, query_tree, paths: list[str], profile: RankingProfile,
+                           filters: SearchFilters = None) -> tuple[str, list]:
+        """Ranked (rowid, score) query over the bigram auxiliary index."""
+        path_sql, path_params = self._path_filter(paths, "bigram_index.rowid", filters)
+        ranked_sql, score_params = self._ranked_sql('bigram_index', profile, path_sql)
+        return ranked_sql, score_params + [compile_query(query_tree, 'bigram_index')] + path_params
+
+    def _iter_trigram_results(self, conn, query_tree, paths: list[str], profile: RankingProfile, batch_size: int,
+                              filters: SearchFilters = None, collapser: ResultCollapser = None):
+        """Search the trigram index."""
+        ranked_sql, params = self._trigram_ranked_sql(query_tree, paths, profile, filters)
+        builder = SnippetBuilder(self._snippet_terms(query_tree))
+        return self._iter_ranked(conn, ranked_sql, params, lambda rowids: self._load_documents(conn, rowids, builder),
+                                 batch_size, collapser)
+
+    def _iter_bigram_results(self, conn, query_tree, paths: list[str], profile: RankingProfile, batch_size: int,
+                             filters: SearchFilters = None, collapser: ResultCollapser = None):
+        """Search through the bigram auxiliary index (queries with short CJK terms)."""
+        ranked_sql, params = self._bigram_ranked_sql(query_tree, paths, profile, filters)
+        builder = SnippetBuilder(self._snippet_terms(query_tree))
+        return self._iter_ranked(conn, ranked_sql, params, lambda rowids: self._load_documents(conn, rowids, builder),
+                                 batch_size, collapser)
+
+    def _iter_semantic_results(self, conn, query_tree, paths: list[str], profile: RankingProfile, batch_size: int,
+                               filters: SearchFilters = None, collapser: ResultCollapser = None,
+                               use_semantic_index: bool = True):
         """
-        OR 逻辑搜索：任一词出现即可，结果合并去重
+        Hybrid search: the FTS ranking and the local semantic index ranking
+        (see semantic_index.py) are fused with reciprocal rank fusion, so documents
+        that only use synonyms of the query terms are recalled as well.
+        Both rankings are read in growing batches; a fused result is yielded once
+        no document that has not been read yet (or is missing from one of the
+        rankings read so far) can still score higher, so the fused order is exact
+        and pagination runs until both rankings are exhausted.
+        Falls back to plain FTS ranking while no semantic index is available, and
+        on shards (the semantic index covers the main database only).
         """
         import logging
         logger = logging.getLogger(__name__)
         
-        if not terms:
-            conn.close()
-            return []
-        
-        all_results = {}
-        
-        for term in terms:
-            use_like = self._is_short_cjk(term)
-            if use_like:
-                results = self._search_with_like(cursor, term, limit, conn, paths, close_conn=False)
-            else:
-                clean_term = term.replace('"', '""')
-                fts_query = f'"{clean_term}"*'
-                
-                sql = """
-                SELECT file_path, title, file_type,
-                       snippet(search_index, 3, '<b>', '</b>', '...', 50) as highlight,
-                       rank
-                FROM search_index
-                WHERE content MATCH ?
-                ORDER BY rank
-                LIMIT ?
-                """
-                try:
-                    cursor.execute(sql, (fts_query, limit))
-                    results = [dict(row) for row in cursor.fetchall()]
-                except:
-                    results = self._search_with_like(cursor, term, limit, conn, paths, close_conn=False)
+        if requires_bigram_index(query_tree):
+            ranked_sql, params = self._bigram_ranked_sql(query_tree, paths, profile, filters)
+        else:
+            ranked_sql, params = self._trigram_ranked_sql(query_tree, paths, profile, filters)
+        fts_ranked = conn.execute(ranked_sql, tuple(params))
+        
+        index = get_semantic_index() if use_semantic_index else None
+        if index is None and use_semantic_index:
+            logger.info("Semantic index not available yet, using FTS ranking only")
+        query_text = ' '.join(term.text.rstrip('*') for term in iter_terms(query_tree))
+        # 搜索范围与过滤条件在 SQL 中应用 (同时去掉索引后已删除的文档)
+        path_sql, path_params = self._path_filter(paths, "doc_id", filters)
+        
+        fts_ranks, semantic_ranks, segment_offsets = {}, {}, {}
+        fts_done, semantic_done = False, index is None
+        semantic_read, semantic_seen = 0, set()
+        fused, pending = {}, set()
+        builder = SnippetBuilder(self._snippet_terms(query_tree))
+        load_batch = lambda rowids: self._load_documents(conn, rowids, builder, segment_offsets)
+        batch_size = max(batch_size, 1)
+        while True:
+            if not fts_done:
+                rows = fts_ranked.fetchmany(batch_size)
+                fts_done = len(rows) < batch_size
+                for row in rows:
+                    rowid = row['rowid']
+                    if rowid not in fts_ranks:
+                        fts_ranks[rowid] = len(fts_ranks)
+                        fused[rowid] = fused.get(rowid, 0.0) + 1.0 / (RRF_K + fts_ranks[rowid] + 1)
+                        pending.add(rowid)
+            if not semantic_done:
+                # 语义检索每次重新计算并取更长的前缀，只处理新读到的文档
+                hits = index.search(query_text, semantic_read + batch_size)
+                semantic_done = len(hits) < semantic_read + batch_size
+                semantic_read = len(hits)
+                hits = [hit for hit in hits if hit[0] not in semantic_seen]
+                semantic_seen.update(doc_id for doc_id, _, _ in hits)
+                if hits:
+                    placeholders = ','.join('?' * len(hits))
+                    allowed = {row['rowid'] for row in conn.execute(
+                        f"SELECT doc_id AS rowid FROM documents WHERE doc_id IN ({placeholders}) {path_sql}",
+                        tuple(doc_id for doc_id, _, _ in hits) + tuple(path_params)
+                    )}
+                    for doc_id, _, offset in hits:
+                        if doc_id in allowed:
+                            semantic_ranks[doc_id] = len(semantic_ranks)
+                            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + semantic_ranks[doc_id] + 1)
+                            segment_offsets[doc_id] = offset
+                            pending.add(doc_id)
             
-            # 合并结果，避免重复
-            for r in results:
-                path = r['file_path']
-                if path not in all_results:
-                    all_results[path] = r
+            # 尚未读到的排名最多贡献下一名的得分
+            fts_bound = 0.0 if fts_done else 1.0 / (RRF_K + len(fts_ranks) + 1)
+            semantic_bound = 0.0 if semantic_done else 1.0 / (RRF_K + len(semantic_ranks) + 1)
+            threshold = fts_bound + semantic_bound
+            final = []
+            for rowid in pending:
+                missing = (fts_bound if rowid not in fts_ranks else 0.0) + \
+                          (semantic_bound if rowid not in semantic_ranks else 0.0)
+                if missing:
+                    threshold = max(threshold, fused[rowid] + missing)
                 else:
-                    # 合并高亮
-                    existing = all_results[path]
-                    if len(r.get('highlight', '')) > len(existing.get('highlight', '')):
-                        existing['highlight'] = r['highlight']
-        
-        # 按 rank 排序
-        final_results = list(all_results.values())
-        final_results.sort(key=lambda x: x.get('rank', 0))
-        
-        conn.close()
-        return final_results[:limit]
\ No newline at end of file
+                    final.append(rowid)
+            ready = sorted((rowid for rowid in final if fused[rowid] >= threshold),
+                           key=lambda rowid: (-fused[rowid], rowid))
+            pending.difference_update(ready)
+            
+            for position in range(0, len(ready), batch_size):
+                for rowid, res in self._load_ranked(ready[position:position + batch_size], load_batch, collapser):
+                    # 与 bm25 一致: 数值越小越相关
+                    res['rank'] = -fused[rowid]
+                    if rowid not in fts_ranks:
+                        res['match_type'] = 'semantic'
+                    yield res
+            if fts_done and semantic_done and not pending:
+                logger.info(f"Hybrid search: {len(fts_ranks)} FTS + {len(semantic_ranks)} semantic candidates")
+                return
+            batch_size = min(batch_size * 2, MAX_SEARCH_BATCH_SIZE)
+
+    def _snippet_terms(self, query_tree) -> list[str]:
+        """Literal terms to highlight (excluded NOT terms are skipped)."""
+        return [term.text.rstrip('*') for term in iter_terms(query_tree)]
+
+
+_search_engine: SearchEngine = None
+
+
+def get_search_engine() -> SearchEngine:
+    """Shared SearchEngine instance (the engine keeps no per-request state)."""
+    global _search_engine
+    if _search_engine is None:
+        _search_engine = SearchEngine()
+    return _search_engine
@@ -15,6 +15,7 @@ class PrecisionLevel(str, Enum):
     MEDIUM = "medium"         # 中等精度
     LOOSE = "loose"           # 宽松匹配
     VERY_LOOSE = "very_loose" # 低精度
+    SEMANTIC = "semantic"     # 语义 (全文 + 本地向量索引混合排序)
 
 class SearchPrecisionController:
     """搜索精度控制器"""
@@ -40,10 +41,15 @@ class SearchPrecisionController:
                 r'^[a-zA-Z]{1,2}$',        # 单个或两个字母 (too short)
                 r'^\W{1,3}$',              # 1-3个非单词字符
                 r'^[^\w\u4e00-\u9fff\s]{1,5}$',  # 1-5个非字母数字汉字字符
-                r'^[a-zA-Z]\W*$',          # 单个字母后跟特殊字符
+                r'^[a-zA-Z]\W*$',          # 单个字母后跟特殊字符 (如 "u(")
                 r'^\W*[a-zA-Z]\W*$',       # 被特殊字符包围的单个字母
             ]
         }
+        
+        # 黑名单预编译为单个组合正则，每条结果只匹配一次
+        self.blacklist_regex = re.compile(
+            '|'.join(f'(?:{p})' for p in self.quality_filters['blacklist_patterns'])
+        )
     
     def get_threshold(self, precision_level: PrecisionLevel) -> int:
         """获取精度级别对应的阈值"""
@@ -68,10 +74,6 @@ class SearchPrecisionController:
         if len(content) < self.quality_filters['min_length']:
             return False
         
-        # 专门检查"u("这样的模式
-        if re.match(r'^[a-zA-Z]\W+$', content):  # 单个字母后跟特殊字符
-            return False
-        
         # 检查是否主要由特殊字符组成（如"u(", "a)", "x!"等）
         if len(content) <= 3:
             alpha_count = sum(1 for c in content if c.isalpha())
@@ -80,8 +82,7 @@ class SearchPrecisionController:
                 return False
         
         # 黑名单模式检查
-        for pattern in self.quality_filters['blacklist_patterns']:
-            if re.match(pattern, content):
-                return False
+        if self.blacklist_regex.match(content):
+            return False
                 
         return True
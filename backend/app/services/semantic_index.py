@@ -0,0 +1,673 @@
+"""
+离线语义检索 (LSA: TF-IDF + 截断 SVD，纯 CPU，无需网络)
+- 文档按固定长度切分为片段，每个片段的 TF-IDF 向量投影到 VECTOR_DIM 维语义空间；
+  共现关系相近的词 (如 "adverse event" 与 "不良事件"、"AE") 在该空间中彼此接近，
+  因此查询可以召回不含原词的同义表述
+- 投影矩阵用随机化 SVD 在片段样本上训练；片段向量以 float16 写入内存映射文件
+- 近似最近邻: 片段较多时用球面 k-means 建倒排列表 (IVF)，查询只扫描最近的 IVF_NPROBE 个列表
+- 每个文档另存一个文档级签名向量 (片段向量之和归一化)，用于"相似文档"查询
+- 新索引的文档用现有模型折叠进内存中的增量部分；增量过多或没有索引时在后台重建
+- numpy 为可选依赖，未安装时语义检索不可用，搜索退回全文检索
+"""
+
+import os
+import re
+import json
+import math
+import time
+import shutil
+import random
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..core import database
+from .cjk_bigram import CJK_RUN_PATTERN
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("警告: numpy库未安装，语义搜索功能将不可用")
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DIM = 128
+# 每个语义维度至少对应的词表词数
+MIN_TERMS_PER_DIM = 8
+
+# 词表: 至少出现在 MIN_DOC_FREQ 个片段中，且不超过片段总数的 MAX_DOC_FREQ_RATIO
+MAX_VOCAB_TERMS = 30000
+MIN_DOC_FREQ = 2
+MAX_DOC_FREQ_RATIO = 0.5
+
+# 片段长度 (字符) 及每个文档最多的片段数
+SEGMENT_CHARS = 2000
+MAX_SEGMENTS_PER_DOC = 16
+
+# 训练投影矩阵时使用的片段样本数
+TRAIN_SAMPLE_SEGMENTS = 20000
+SVD_OVERSAMPLE = 10
+SVD_POWER_ITERATIONS = 2
+
+# 片段数不超过该值时直接暴力计算相似度，否则使用 IVF
+BRUTE_FORCE_LIMIT = 20000
+IVF_NPROBE = 8
+
+# 低于该余弦相似度的片段视为不相关，不参与融合
+MIN_SIMILARITY = 0.3
+KMEANS_ITERATIONS = 10
+
+# 稀疏矩阵乘法时每块的非零元素数，控制临时内存
+SPARSE_CHUNK_NNZ = 200000
+
+# 增量部分超过已建索引的该比例时后台重建
+REBUILD_RATIO = 0.2
+
+# 磁盘格式版本，旧版本的索引在加载时视为不存在并重建
+INDEX_FORMAT_VERSION = 2
+MIN_REBUILD_SEGMENTS = 100
+
+TOKEN_PATTERN = re.compile(r'[a-z][a-z0-9]+|[一-鿿]+')
+
+
+class SemanticIndexUnavailable(RuntimeError):
+    """numpy 未安装，或语义索引尚未建好"""
+
+
+def tokenize(text: str) -> List[str]:
+    """英文/代码按单词 (下划线分开)，中文按二元词"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or "").lower()):
+        if CJK_RUN_PATTERN.fullmatch(token):
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def iter_segments(title: str, content: str) -> Iterable[Tuple[int, str]]:
+    """文档 -> [(偏移, 片段文本)]，每个片段都带上标题"""
+    content = content or ""
+    if not content:
+        yield 0, title or ""
+        return
+    for index, offset in enumerate(range(0, len(content), SEGMENT_CHARS)):
+        if index >= MAX_SEGMENTS_PER_DOC:
+            return
+        yield offset, f"{title or ''}\n{content[offset:offset + SEGMENT_CHARS]}"
+
+
+def _csr_dot(indptr, indices, data, matrix):
+    """CSR 稀疏矩阵 (n × V) 乘稠密矩阵 (V × r)，按块累加"""
+    n_rows = len(indptr) - 1
+    out = np.zeros((n_rows, matrix.shape[1]), dtype=np.float32)
+    row = 0
+    while row < n_rows:
+        end = row + 1
+        while end < n_rows and indptr[end + 1] - indptr[row] <= SPARSE_CHUNK_NNZ:
+            end += 1
+        start_nnz, end_nnz = indptr[row], indptr[end]
+        if end_nnz > start_nnz:
+            gathered = data[start_nnz:end_nnz, None] * matrix[indices[start_nnz:end_nnz]]
+            starts = indptr[row:end] - start_nnz
+            nonempty = indptr[row + 1:end + 1] > indptr[row:end]
+            sums = np.add.reduceat(gathered, starts[nonempty], axis=0)
+            out[row:end][nonempty] = sums
+        row = end
+    return out
+
+
+def _transpose_csr(indptr, indices, data, n_cols):
+    """CSR 转置 (即原矩阵的 CSC)"""
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    counts = np.bincount(indices, minlength=n_cols)
+    t_indptr = np.concatenate(([0], np.cumsum(counts)))
+    return t_indptr, rows[order], data[order]
+
+
+class SemanticModel:
+    """词表 + idf + 投影矩阵 (V × VECTOR_DIM)"""
+
+    def __init__(self, terms: List[str], idf, projection):
+        self.terms = list(terms)
+        self.vocab = {term: i for i, term in enumerate(self.terms)}
+        self.idf = idf.astype(np.float32)
+        self.projection = projection.astype(np.float32)
+
+    @property
+    def dim(self) -> int:
+        return self.projection.shape[1]
+
+    def to_csr(self, texts: List[str]):
+        """文本 -> 行归一化的 TF-IDF CSR 矩阵 (次线性 tf)"""
+        indptr = [0]
+        indices = []
+        data = []
+        for text in texts:
+            counts = Counter(self.vocab[t] for t in tokenize(text) if t in self.vocab)
+            if counts:
+                cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+                weights = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * self.idf[cols]
+                weights /= np.linalg.norm(weights)
+                indices.extend(cols.tolist())
+                data.extend(weights.tolist())
+            indptr.append(len(indices))
+        return (np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64),
+                np.asarray(data, dtype=np.float32))
+
+    def embed(self, texts: List[str]):
+        """文本 -> 单位长度的语义向量 (n × dim)；不含已知词的文本为零向量"""
+        vectors = _csr_dot(*self.to_csr(texts), self.projection)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+    @classmethod
+    def train(cls, doc_freq: Counter, n_segments: int, sample_texts: List[str], dim: int = VECTOR_DIM) -> "SemanticModel":
+        max_df = max(MIN_DOC_FREQ, int(n_segments * MAX_DOC_FREQ_RATIO))
+        candidates = [(term, df) for term, df in doc_freq.items() if MIN_DOC_FREQ <= df <= max_df]
+        candidates.sort(key=lambda item: (-item[1], item[0]))
+        candidates = candidates[:MAX_VOCAB_TERMS]
+        terms = [term for term, _ in candidates]
+        idf = np.asarray([math.log((n_segments + 1) / (df + 1)) + 1.0 for _, df in candidates], dtype=np.float32)
+        if not terms:
+            return cls([], idf, np.zeros((0, dim), dtype=np.float32))
+
+        model = cls(terms, idf, np.zeros((len(terms), 0), dtype=np.float32))
+        indptr, indices, data = model.to_csr(sample_texts)
+        keep = np.diff(indptr) > 0
+        if not keep.any():
+            return cls(terms, idf, np.zeros((len(terms), dim), dtype=np.float32))
+        # 去掉不含词表词的空行
+        lengths = np.diff(indptr)[keep]
+        rows = np.flatnonzero(keep)
+        indices = np.concatenate([indices[indptr[r]:indptr[r + 1]] for r in rows])
+        data = np.concatenate([data[indptr[r]:indptr[r + 1]] for r in rows])
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        t_csr = _transpose_csr(indptr, indices, data, len(terms))
+
+        # 随机化 SVD (Halko et al.): 只需要 X·M 和 Xᵀ·M 两种稀疏乘法
+        # 维度须远小于词表，否则投影近似于恒等变换，学不到同义关系 (小语料时自动降维)
+        k = max(1, min(dim, len(terms) // MIN_TERMS_PER_DIM, len(rows) - 1))
+        rng = np.random.default_rng(0)
+        omega = rng.standard_normal((len(terms), k + SVD_OVERSAMPLE)).astype(np.float32)
+        q, _ = np.linalg.qr(_csr_dot(indptr, indices, data, omega))
+        for _ in range(SVD_POWER_ITERATIONS):
+            z, _ = np.linalg.qr(_csr_dot(*t_csr, q))
+            q, _ = np.linalg.qr(_csr_dot(indptr, indices, data, z))
+        b = _csr_dot(*t_csr, q).T
+        _, _, vt = np.linalg.svd(b, full_matrices=False)
+        projection = np.zeros((len(terms), dim), dtype=np.float32)
+        projection[:, :min(k, vt.shape[0])] = vt[:k].T
+        return cls(terms, idf, projection)
+
+    def save(self, path: str):
+        np.savez(path, terms=np.asarray(self.terms, dtype=object), idf=self.idf, projection=self.projection)
+
+    @classmethod
+    def load(cls, path: str) -> "SemanticModel":
+        with np.load(path, allow_pickle=True) as f:
+            return cls(f['terms'].tolist(), f['idf'], f['projection'])
+
+
+def _index_root() -> str:
+    return os.path.join(os.path.dirname(database.DB_PATH), 'semantic_index')
+
+
+def _kmeans(vectors, n_lists: int, iterations: int = KMEANS_ITERATIONS):
+    """球面 k-means (余弦相似度)，返回单位长度的质心"""
+    rng = np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        sums[empty] = centroids[empty]
+        norms[empty] = 1.0
+        centroids = sums / norms
+    return centroids
+
+
+def _signature(vectors):
+    """文档签名: 片段向量之和归一化 (全为零向量时返回 None)"""
+    total = vectors.sum(axis=0)
+    norm = np.linalg.norm(total)
+    return total / norm if norm > 0 else None
+
+
+def _open_matrix(path: str, rows: int, dim: int):
+    """只读内存映射 float16 矩阵 (空矩阵无法映射)"""
+    if not rows:
+        return np.zeros((0, dim), dtype=np.float16)
+    return np.memmap(path, dtype=np.float16, mode='r', shape=(rows, dim))
+
+
+class SemanticIndex:
+    """
+    片段向量 (内存映射) + IVF 倒排列表 + 文档签名向量 (内存映射) + 增量部分
+    search(text) -> [(doc_id, 相似度, 片段偏移), ...]
+    similar(doc_id) -> [(doc_id, 相似度), ...]
+    """
+
+    def __init__(self, model: SemanticModel, vectors, doc_ids, offsets, centroids=None, list_offsets=None,
+                 max_doc_id: int = 0, directory: Optional[str] = None, document_ids=None, document_vectors=None):
+        self.model = model
+        self.vectors = vectors
+        self.doc_ids = doc_ids
+        self.offsets = offsets
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.max_doc_id = max_doc_id
+        self.directory = directory
+        # 按 doc_id 升序
+        self.document_ids = document_ids if document_ids is not None else np.zeros(0, dtype=np.int64)
+        self.document_vectors = document_vectors if document_vectors is not None else np.zeros((0, model.dim), dtype=np.float16)
+        self._tail_documents: Dict[int, object] = {}
+        self._tail_vectors: List = []
+        self._tail_ids: List[Tuple[int, int]] = []
+        self._deleted = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.doc_ids) + len(self._tail_ids)
+
+    @property
+    def tail_size(self) -> int:
+        return len(self._tail_ids)
+
+    def add_document(self, doc_id: int, title: str, content: str):
+        """用现有模型折叠进新文档 (不重新训练)"""
+        segments = list(iter_segments(title, content))
+        vectors = self.model.embed([text for _, text in segments])
+        signature = _signature(vectors)
+        with self._lock:
+            for (offset, _), vector in zip(segments, vectors):
+                if vector.any():
+                    self._tail_vectors.append(vector)
+                    self._tail_ids.append((doc_id, offset))
+            if signature is not None:
+                self._tail_documents[doc_id] = signature
+
+    def remove_document(self, doc_id: int):
+        """已建索引中的片段在查询时过滤；增量部分直接删除 (rowid 可能被新文档复用)"""
+        with self._lock:
+            self._deleted.add(doc_id)
+            self._tail_documents.pop(doc_id, None)
+            keep = [i for i, (tail_id, _) in enumerate(self._tail_ids) if tail_id != doc_id]
+            if len(keep) != len(self._tail_ids):
+                self._tail_vectors = [self._tail_vectors[i] for i in keep]
+                self._tail_ids = [self._tail_ids[i] for i in keep]
+
+    def _candidate_rows(self, query) -> Iterable[Tuple[int, int]]:
+        """需要计算相似度的行区间"""
+        if self.centroids is None:
+            yield 0, len(self.doc_ids)
+            return
+        nearest = np.argsort(-(self.centroids @ query))[:IVF_NPROBE]
+        for cluster in sorted(nearest):
+            yield int(self.list_offsets[cluster]), int(self.list_offsets[cluster + 1])
+
+    def search(self, text: str, limit: int = 200) -> List[Tuple[int, float, int]]:
+        if not self.model.terms:
+            return []
+        query = self.model.embed([text])[0]
+        if not query.any():
+            return []
+
+        scores = []
+        rows = []
+        for start, end in self._candidate_rows(query):
+            if end > start:
+                scores.append(np.asarray(self.vectors[start:end], dtype=np.float32) @ query)
+                rows.append(np.arange(start, end))
+        with self._lock:
+            tail_vectors = list(self._tail_vectors)
+            tail_ids = list(self._tail_ids)
+            deleted = set(self._deleted)
+        if tail_vectors:
+            scores.append(np.vstack(tail_vectors) @ query)
+            rows.append(np.arange(len(self.doc_ids), len(self.doc_ids) + len(tail_ids)))
+        if not scores:
+            return []
+        scores = np.concatenate(scores)
+        rows = np.concatenate(rows)
+
+        # 每个文档取得分最高的片段；多取一些片段以便去重后仍有 limit 个文档，不够时再多取
+        eligible = np.flatnonzero(scores >= MIN_SIMILARITY)
+        top = min(len(eligible), limit * 4)
+        base = len(self.doc_ids)
+        while True:
+            results = {}
+            if top:
+                kth = np.partition(scores[eligible], len(eligible) - top)[len(eligible) - top]
+                best = eligible[scores[eligible] >= kth]
+                # 得分相同时按行号排列，顺序确定: 更大的 limit 返回的是更长的前缀
+                best = best[np.lexsort((rows[best], -scores[best]))]
+            else:
+                best = []
+            for i in best:
+                row = int(rows[i])
+                if row < base:
+                    doc_id, offset = int(self.doc_ids[row]), int(self.offsets[row])
+                    if doc_id in deleted:
+                        continue
+                else:
+                    doc_id, offset = tail_ids[row - base]
+                if doc_id in results:
+                    continue
+                results[doc_id] = (doc_id, float(scores[i]), offset)
+                if len(results) >= limit:
+                    break
+            if len(results) >= limit or top >= len(eligible):
+                break
+            top = min(len(eligible), top * 4)
+        return list(results.values())
+
+    def document_vector(self, doc_id: int):
+        """文档签名向量 (不在索引中时返回 None)"""
+        with self._lock:
+            vector = self._tail_documents.get(doc_id)
+            if vector is not None:
+                return vector
+            if doc_id in self._deleted:
+                return None
+        i = int(np.searchsorted(self.document_ids, doc_id))
+        if i < len(self.document_ids) and self.document_ids[i] == doc_id:
+            return np.asarray(self.document_vectors[i], dtype=np.float32)
+        return None
+
+    def similar(self, doc_id: int, limit: int = 20) -> List[Tuple[int, float]]:
+        """与 doc_id 最相似的文档 (按签名向量余弦相似度，暴力计算)"""
+        vector = self.document_vector(doc_id)
+        if vector is None:
+            return []
+        with self._lock:
+            tail = dict(self._tail_documents)
+            excluded = self._deleted | set(tail)
+        excluded.add(doc_id)
+
+        scores = np.empty(len(self.document_ids), dtype=np.float32)
+        for chunk in range(0, len(scores), 65536):
+            scores[chunk:chunk + 65536] = np.asarray(self.document_vectors[chunk:chunk + 65536], dtype=np.float32) @ vector
+        ids = self.document_ids
+        if excluded and len(ids):
+            scores[np.isin(ids, np.fromiter(excluded, dtype=np.int64, count=len(excluded)))] = -np.inf
+        tail.pop(doc_id, None)
+        if tail:
+            scores = np.concatenate((scores, np.vstack(list(tail.values())) @ vector))
+            ids = np.concatenate((ids, np.fromiter(tail.keys(), dtype=np.int64, count=len(tail))))
+
+        top = min(len(scores), limit)
+        if not top:
+            return []
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(int(ids[i]), float(scores[i])) for i in best if scores[i] >= MIN_SIMILARITY]
+
+    def stats(self) -> dict:
+        return {
+            'documents': len(self.document_ids) + len(self._tail_documents),
+            'segments': len(self.doc_ids),
+            'pending_segments': self.tail_size,
+            'vocabulary': len(self.model.terms),
+            'dim': self.model.dim,
+            'ivf_lists': 0 if self.centroids is None else len(self.centroids),
+        }
+
+    @classmethod
+    def build(cls, conn) -> "SemanticIndex":
+        """从 documents 表全量构建并写入磁盘"""
+        start_time = time.perf_counter()
+        # 第一遍: 片段级文档频率 + 训练样本 (蓄水池抽样)
+        doc_freq = Counter()
+        n_segments = 0
+        sample = []
+        rng = random.Random(0)
+        max_doc_id = 0
+        for row in conn.execute("SELECT doc_id, title, decompress(content) FROM documents"):
+            max_doc_id = max(max_doc_id, row[0])
+            for _, text in iter_segments(row[1], row[2]):
+                doc_freq.update(set(tokenize(text)))
+                n_segments += 1
+                if len(sample) < TRAIN_SAMPLE_SEGMENTS:
+                    sample.append(text)
+                else:
+                    slot = rng.randrange(n_segments)
+                    if slot < TRAIN_SAMPLE_SEGMENTS:
+                        sample[slot] = text
+        model = SemanticModel.train(doc_freq, n_segments, sample)
+        del sample, doc_freq
+
+        root = _index_root()
+        directory = os.path.join(root, f"build-{int(time.time() * 1000)}")
+        os.makedirs(directory, exist_ok=True)
+        model.save(os.path.join(directory, 'model.npz'))
+
+        # 第二遍: 计算全部片段向量，先按文档顺序写入临时文件
+        raw_path = os.path.join(directory, 'vectors.raw')
+        documents_path = os.path.join(directory, 'documents.f16')
+        doc_ids = []
+        offsets = []
+        document_ids = []
+        with open(raw_path, 'wb') as raw, open(documents_path, 'wb') as documents:
+            batch_ids = []
+            batch_texts = []
+
+            def flush():
+                if not batch_texts:
+                    return
+                vectors = model.embed(batch_texts)
+                keep = np.flatnonzero(vectors.any(axis=1))
+                raw.write(vectors[keep].astype(np.float16).tobytes())
+                for i in keep:
+                    doc_ids.append(batch_ids[i][0])
+                    offsets.append(batch_ids[i][1])
+                # 一个文档的片段总在同一批中
+                batch_doc_ids = np.asarray([doc_id for doc_id, _ in batch_ids], dtype=np.int64)
+                starts = np.flatnonzero(np.r_[True, batch_doc_ids[1:] != batch_doc_ids[:-1]])
+                for start, end in zip(starts, np.r_[starts[1:], len(batch_doc_ids)]):
+                    signature = _signature(vectors[start:end])
+                    if signature is not None:
+                        documents.write(signature.astype(np.float16).tobytes())
+                        document_ids.append(int(batch_doc_ids[start]))
+                batch_ids.clear()
+                batch_texts.clear()
+
+            for row in conn.execute("SELECT doc_id, title, decompress(content) FROM documents"):
+                for offset, text in iter_segments(row[1], row[2]):
+                    batch_ids.append((row[0], offset))
+                    batch_texts.append(text)
+                if len(batch_texts) >= 1024:
+                    flush()
+            flush()
+
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int32)
+        count = len(doc_ids)
+        vectors_path = os.path.join(directory, 'vectors.f16')
+        centroids = None
+        list_offsets = None
+        if count:
+            raw_vectors = np.memmap(raw_path, dtype=np.float16, mode='r', shape=(count, model.dim))
+            if count > BRUTE_FORCE_LIMIT:
+                # IVF: 质心在样本上训练，向量按所属列表重新排列，使每个列表在文件中连续
+                n_lists = min(4096, max(16, int(math.sqrt(count))))
+                sample_rows = np.sort(np.random.default_rng(0).choice(count, min(count, n_lists * 40), replace=False))
+                centroids = _kmeans(np.asarray(raw_vectors[sample_rows], dtype=np.float32), n_lists)
+                assignments = np.empty(count, dtype=np.int32)
+                for chunk in range(0, count, 65536):
+                    block = np.asarray(raw_vectors[chunk:chunk + 65536], dtype=np.float32)
+                    assignments[chunk:chunk + 65536] = np.argmax(block @ centroids.T, axis=1)
+                order = np.argsort(assignments, kind='stable')
+                list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=n_lists))))
+                vectors = np.memmap(vectors_path, dtype=np.float16, mode='w+', shape=(count, model.dim))
+                for chunk in range(0, count, 65536):
+                    vectors[chunk:chunk + 65536] = raw_vectors[order[chunk:chunk + 65536]]
+                vectors.flush()
+                del vectors
+                doc_ids = doc_ids[order]
+                offsets = offsets[order]
+                del raw_vectors
+                os.remove(raw_path)
+            else:
+                del raw_vectors
+                os.replace(raw_path, vectors_path)
+        else:
+            os.replace(raw_path, vectors_path)
+
+        np.savez(os.path.join(directory, 'segments.npz'), doc_ids=doc_ids, offsets=offsets,
+                 centroids=centroids if centroids is not None else np.zeros((0, model.dim), dtype=np.float32),
+                 list_offsets=list_offsets if list_offsets is not None else np.zeros(0, dtype=np.int64),
+                 document_ids=np.asarray(document_ids, dtype=np.int64))
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_FORMAT_VERSION, 'count': count, 'documents': len(document_ids),
+                       'dim': model.dim, 'max_doc_id': max_doc_id}, f)
+        # 切换到新版本后清理旧版本
+        with open(os.path.join(root, 'CURRENT.tmp'), 'w', encoding='utf-8') as f:
+            f.write(os.path.basename(directory))
+        os.replace(os.path.join(root, 'CURRENT.tmp'), os.path.join(root, 'CURRENT'))
+        for name in os.listdir(root):
+            if name.startswith('build-') and name != os.path.basename(directory):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+        logger.info(f"Built semantic index: {count} segments, {len(model.terms)} terms in {time.perf_counter() - start_time:.1f} s")
+        return cls.open(directory)
+
+    @classmethod
+    def open(cls, directory: str) -> "SemanticIndex":
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"outdated semantic index format {meta.get('version')}")
+        model = SemanticModel.load(os.path.join(directory, 'model.npz'))
+        with np.load(os.path.join(directory, 'segments.npz')) as f:
+            doc_ids, offsets = f['doc_ids'], f['offsets']
+            centroids = f['centroids'] if len(f['centroids']) else None
+            list_offsets = f['list_offsets'] if len(f['list_offsets']) else None
+            document_ids = f['document_ids']
+        vectors = _open_matrix(os.path.join(directory, 'vectors.f16'), meta['count'], meta['dim'])
+        document_vectors = _open_matrix(os.path.join(directory, 'documents.f16'), meta['documents'], meta['dim'])
+        return cls(model, vectors, doc_ids, offsets, centroids, list_offsets, meta['max_doc_id'], directory,
+                   document_ids, document_vectors)
+
+    @classmethod
+    def load(cls) -> Optional["SemanticIndex"]:
+        """打开当前版本 (没有已建索引时返回 None)"""
+        root = _index_root()
+        try:
+            with open(os.path.join(root, 'CURRENT'), encoding='utf-8') as f:
+                directory = os.path.join(root, f.read().strip())
+            return cls.open(directory)
+        except (OSError, ValueError, KeyError) as e:
+            logger.info(f"No semantic index loaded: {e}")
+            return None
+
+    def catch_up(self, conn):
+        """折叠进建索引之后新增的文档 (documents.doc_id 为 AUTOINCREMENT，删除的 id 不会复用)"""
+        for row in conn.execute("SELECT doc_id, title, decompress(content) FROM documents WHERE doc_id > ?", (self.max_doc_id,)):
+            self.add_document(row[0], row[1], row[2])
+
+
+_semantic_index: Optional[SemanticIndex] = None
+_semantic_lock = threading.Lock()
+_build_thread: Optional[threading.Thread] = None
+
+
+def _build_in_background():
+    global _semantic_index
+    conn = database.get_db_connection()
+    try:
+        index = SemanticIndex.build(conn)
+        # 构建期间新增的文档
+        index.catch_up(conn)
+        with _semantic_lock:
+            _semantic_index = index
+    except Exception as e:
+        logger.error(f"Failed to build semantic index: {e}")
+    finally:
+        conn.close()
+
+
+def rebuild_semantic_index() -> bool:
+    """在后台线程重建语义索引；已有构建在进行时返回 False"""
+    global _build_thread
+    if not NUMPY_AVAILABLE:
+        return False
+    with _semantic_lock:
+        if _build_thread is not None and _build_thread.is_alive():
+            return False
+        _build_thread = threading.Thread(target=_build_in_background, daemon=True)
+        _build_thread.start()
+        return True
+
+
+def is_building() -> bool:
+    return _build_thread is not None and _build_thread.is_alive()
+
+
+def get_semantic_index() -> Optional[SemanticIndex]:
+    """
+    返回语义索引；首次调用时从磁盘打开，没有已建索引时在后台开始构建并返回 None
+    (此时搜索只使用全文检索)
+    """
+    global _semantic_index
+    if not NUMPY_AVAILABLE:
+        return None
+    index = _semantic_index
+    if index is not None:
+        return index
+    with _semantic_lock:
+        if _semantic_index is None:
+            index = SemanticIndex.load()
+            if index is not None:
+                conn = database.get_db_connection()
+                try:
+                    index.catch_up(conn)
+                finally:
+                    conn.close()
+                _semantic_index = index
+    if _semantic_index is None:
+        rebuild_semantic_index()
+    return _semantic_index
+
+
+def loaded_semantic_index() -> Optional[SemanticIndex]:
+    """已加载的语义索引 (未加载时返回 None，供索引器增量更新)"""
+    return _semantic_index
+
+
+def maybe_rebuild_semantic_index():
+    """
+    索引器批量写入后调用: 增量部分过多，或现有模型还没有词表 (在空索引上构建) 时后台重建
+    (新词只有重新训练才能进入模型)
+    """
+    index = _semantic_index
+    if index is None:
+        return
+    if not index.model.terms or index.tail_size > max(MIN_REBUILD_SEGMENTS, len(index.doc_ids) * REBUILD_RATIO):
+        rebuild_semantic_index()
+
+
+def semantic_stats() -> dict:
+    """语义索引状态 (/debug/stats)"""
+    stats = {'available': NUMPY_AVAILABLE, 'loaded': _semantic_index is not None, 'building': is_building()}
+    if _semantic_index is not None:
+        stats.update(_semantic_index.stats())
+    return stats
+
+
+def invalidate_semantic_index():
+    """清空索引后调用"""
+    global _semantic_index
+    with _semantic_lock:
+        _semantic_index = None
+    shutil.rmtree(_index_root(), ignore_errors=True)
@@ -0,0 +1,334 @@
+"""
+按根目录分片的索引
+- 默认所有文档都在主库 (search_index.db) 中。对某个根目录建立分片后，该目录下的文档保存在
+  数据目录 shards/ 下单独的 SQLite 文件中 (表结构与主库相同，doc_id 在各库内独立编号)；
+  主库的 shards 表是分片目录，记录根目录、文件名和是否挂载
+- 索引器按文件路径把文档写入所属的库 (database_for)；搜索只打开搜索范围内的库
+  (databases_in_scope)，各库在各自的线程中并行执行同样的查询，再按得分归并 (merge_ranked)
+- 建立 / 重建分片时先写入新文件，完成后在目录中切换文件名 (swap_shard)，期间查询照常读取旧数据；
+  卸载只修改目录项，删除只删除目录项和文件，都不需要逐行删除
+- 限制: 语义检索和相似文档只覆盖主库；近重复折叠在各库内进行；各库的 bm25 基于各自的
+  词频统计，跨库归并的顺序是近似的
+"""
+
+import os
+import time
+import heapq
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterator, List, Optional
+
+from ..core import database
+
+logger = logging.getLogger(__name__)
+
+# 分片结果按需读取时每批的行数上限 (与 search_engine.MAX_SEARCH_BATCH_SIZE 一致)
+MAX_SHARD_BATCH_SIZE = 500
+
+# map_databases 同时查询的库数上限
+MAX_PARALLEL_SHARDS = 8
+
+
+class ShardDetached(Exception):
+    """路径属于已卸载的分片"""
+
+
+class Shard:
+    def __init__(self, root: str, file_name: str, attached: bool = True, created_at: Optional[float] = None):
+        self.root = root
+        self.file_name = file_name
+        self.attached = attached
+        self.created_at = created_at
+
+    @property
+    def db_path(self) -> str:
+        return os.path.join(shard_dir(), self.file_name)
+
+
+def shard_dir() -> str:
+    return os.path.join(os.path.dirname(database.DB_PATH), 'shards')
+
+
+def normalize_root(path: str) -> str:
+    return os.path.normpath(os.path.abspath(path))
+
+
+def is_under(path: str, root: str) -> bool:
+    """path 是 root 本身或 root 下的文件 / 目录"""
+    path, root = os.path.normcase(path), os.path.normcase(root)
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+_catalog: Optional[List[Shard]] = None
+_catalog_lock = threading.Lock()
+
+
+def get_shards() -> List[Shard]:
+    """分片目录 (含未挂载的分片)，根目录长的在前 (嵌套时最长前缀优先)"""
+    global _catalog
+    catalog = _catalog
+    if catalog is not None:
+        return catalog
+    with _catalog_lock:
+        if _catalog is None:
+            conn = database.get_db_connection()
+            try:
+                rows = conn.execute("SELECT root, file_name, attached, created_at FROM shards").fetchall()
+            finally:
+                conn.close()
+            _catalog = sorted(
+                (Shard(row['root'], row['file_name'], bool(row['attached']), row['created_at']) for row in rows),
+                key=lambda shard: -len(shard.root)
+            )
+        return _catalog
+
+
+def invalidate_shards():
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
+
+
+def find_shard(path: str) -> Optional[Shard]:
+    """包含 path 的分片 (含未挂载的)"""
+    for shard in get_shards():
+        if is_under(path, shard.root):
+            return shard
+    return None
+
+
+def get_shard(root: str) -> Optional[Shard]:
+    root = normalize_root(root)
+    for shard in get_shards():
+        if os.path.normcase(shard.root) == os.path.normcase(root):
+            return shard
+    return None
+
+
+def database_for(path: str) -> Optional[str]:
+    """path 所属的库 (None 为主库)；属于已卸载的分片时抛出 ShardDetached"""
+    shard = find_shard(path)
+    if shard is None:
+        return None
+    if not shard.attached:
+        raise ShardDetached(f"Shard is detached: {shard.root}")
+    return shard.db_path
+
+
+def attached_databases() -> List[Optional[str]]:
+    """主库 (None) 和所有已挂载的分片"""
+    return [None] + [shard.db_path for shard in get_shards() if shard.attached]
+
+
+def databases_in_scope(paths: Optional[List[str]] = None) -> List[Optional[str]]:
+    """
+    搜索范围涉及的库 (None 为主库)
+    范围在某个分片内时只查询该分片；否则查询主库和范围内的分片
+    """
+    attached = [shard for shard in get_shards() if shard.attached]
+    if not paths:
+        return [None] + [shard.db_path for shard in attached]
+    databases = []
+    for path in paths:
+        shard = find_shard(path)
+        if shard is not None:
+            if shard.attached:
+                databases.append(shard.db_path)
+            continue
+        databases.append(None)
+        # 与搜索 SQL 中的范围条件一致: 不区分大小写的字符串前缀
+        databases.extend(shard.db_path for shard in attached if shard.root.lower().startswith(path.lower()))
+    return list(dict.fromkeys(databases))
+
+
+def new_shard_file(root: str) -> str:
+    """为 root 创建一个空的分片文件 (建立 / 重建时写入，完成后由 swap_shard 切换)，返回文件路径"""
+    os.makedirs(shard_dir(), exist_ok=True)
+    digest = hashlib.sha1(os.path.normcase(normalize_root(root)).encode('utf-8')).hexdigest()[:12]
+    db_path = os.path.join(shard_dir(), f"{digest}-{time.time_ns()}.db")
+    database.init_db(db_path)
+    return db_path
+
+
+def remove_shard_file(db_path: str):
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(db_path + suffix)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Windows 下仍在被读取的文件无法删除，下次启动时由 remove_orphan_files 清理
+            logger.warning(f"Could not remove shard file {db_path}{suffix}: {e}")
+
+
+def swap_shard(root: str, db_path: str):
+    """让 root 的分片改为使用 db_path (新建时加入目录)，并删除被替换的旧文件"""
+    root = normalize_root(root)
+    old = get_shard(root)
+    conn = database.get_db_connection()
+    try:
+        if old is not None:
+            conn.execute("DELETE FROM shards WHERE root = ?", (old.root,))
+        conn.execute(
+            "INSERT INTO shards (root, file_name, attached, created_at) VALUES (?, ?, ?, ?)",
+            (root, os.path.basename(db_path), 1 if old is None or old.attached else 0, time.time())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    invalidate_shards()
+    if old is not None:
+        remove_shard_file(old.db_path)
+    logger.info(f"Shard for {root} now uses {os.path.basename(db_path)}")
+
+
+def set_attached(root: str, attached: bool) -> bool:
+    """挂载 / 卸载分片；没有该分片时返回 False"""
+    shard = get_shard(root)
+    if shard is None:
+        return False
+    conn = database.get_db_connection()
+    try:
+        conn.execute("UPDATE shards SET attached = ? WHERE root = ?", (1 if attached else 0, shard.root))
+        conn.commit()
+    finally:
+        conn.close()
+    invalidate_shards()
+    return True
+
+
+def drop_shard(root: str) -> bool:
+    """删除分片 (目录项和文件)；没有该分片时返回 False"""
+    shard = get_shard(root)
+    if shard is None:
+        return False
+    conn = database.get_db_connection()
+    try:
+        conn.execute("DELETE FROM shards WHERE root = ?", (shard.root,))
+        conn.commit()
+    finally:
+        conn.close()
+    invalidate_shards()
+    remove_shard_file(shard.db_path)
+    return True
+
+
+def remove_orphan_files():
+    """删除目录中没有引用的分片文件 (中断的建立 / 重建、未能删除的旧文件)；只在启动时调用"""
+    directory = shard_dir()
+    if not os.path.isdir(directory):
+        return
+    referenced = {shard.file_name for shard in get_shards()}
+    for name in os.listdir(directory):
+        if name.endswith('.db') and name not in referenced:
+            remove_shard_file(os.path.join(directory, name))
+
+
+def document_count(databases: Optional[List[Optional[str]]] = None) -> int:
+    """各库 (默认所有已挂载的库) 的文档数之和"""
+    total = 0
+    for db_path in attached_databases() if databases is None else databases:
+        conn = database.get_db_connection(db_path)
+        try:
+            total += conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        finally:
+            conn.close()
+    return total
+
+
+def shard_stats() -> List[dict]:
+    stats = []
+    for shard in get_shards():
+        exists = os.path.exists(shard.db_path)
+        stats.append({
+            'root': shard.root,
+            'file': shard.file_name,
+            'attached': shard.attached,
+            'created_at': shard.created_at,
+            'size_mb': round(os.path.getsize(shard.db_path) / 1024 / 1024, 2) if exists else 0,
+            'documents': document_count([shard.db_path]) if exists else 0,
+        })
+    return stats
+
+
+def map_databases(fn: Callable[[Optional[str]], object], databases: List[Optional[str]]) -> list:
+    """fn(db_path) 在各库上并行执行 (fn 自己打开连接)，按 databases 的顺序返回结果"""
+    if len(databases) <= 1:
+        return [fn(db_path) for db_path in databases]
+    with ThreadPoolExecutor(max_workers=min(len(databases), MAX_PARALLEL_SHARDS),
+                            thread_name_prefix='shard-query') as pool:
+        return list(pool.map(fn, databases))
+
+
+class _RankedStream:
+    """
+    一个库的排序结果: 迭代器 (及其数据库连接) 在专用线程中创建和使用，
+    首批在构造时开始读取，之后在消费方需要时按批读取
+    """
+
+    def __init__(self, factory: Callable[[], Iterator[dict]], batch_size: int):
+        self._factory = factory
+        self._iterator = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shard-search')
+        self._buffer = deque()
+        self._exhausted = False
+        self._batch_size = max(batch_size, 1)
+        self._future = self._executor.submit(self._read, self._batch_size)
+
+    def _read(self, count: int) -> list:
+        if self._iterator is None:
+            self._iterator = self._factory()
+        return list(islice(self._iterator, count))
+
+    def head(self) -> Optional[dict]:
+        """下一条结果 (不取出)；没有更多结果时返回 None"""
+        if not self._buffer and not self._exhausted:
+            if self._future is None:
+                self._batch_size = min(self._batch_size * 2, MAX_SHARD_BATCH_SIZE)
+                self._future = self._executor.submit(self._read, self._batch_size)
+            batch = self._future.result()
+            self._future = None
+            self._buffer.extend(batch)
+            self._exhausted = len(batch) < self._batch_size
+        return self._buffer[0] if self._buffer else None
+
+    def pop(self) -> dict:
+        return self._buffer.popleft()
+
+    def _close_iterator(self):
+        if self._iterator is not None:
+            self._iterator.close()
+
+    def close(self):
+        # 关闭也在专用线程中进行 (连接只能在创建它的线程中使用)，不等待
+        self._executor.submit(self._close_iterator)
+        self._executor.shutdown(wait=False)
+
+
+def merge_ranked(factories: List[Callable[[], Iterator[dict]]], batch_size: int) -> Iterator[dict]:
+    """
+    各库按 rank 升序产出的结果 -> 按 rank 归并的单一序列
+    factories 在各自的线程中创建结果迭代器；各库的前 batch_size 条并行读取，之后按需读取
+    """
+    streams = [_RankedStream(factory, batch_size) for factory in factories]
+    try:
+        heap = []
+        for index, stream in enumerate(streams):
+            head = stream.head()
+            if head is not None:
+                heap.append((head['rank'], index))
+        heapq.heapify(heap)
+        while heap:
+            _, index = heapq.heappop(heap)
+            stream = streams[index]
+            yield stream.pop()
+            head = stream.head()
+            if head is not None:
+                heapq.heappush(heap, (head['rank'], index))
+    finally:
+        for stream in streams:
+            stream.close()
@@ -0,0 +1,162 @@
+"""
+结构化摘要生成
+- 索引时: 记录文档中位置标记 ([Page:3] / [Slide:2] / [Sheet:名称 Row:5 ...]) 的字符偏移，写入 doc_locations
+- 查询时: 单次匹配得到命中偏移，按命中密度选出 top-k 摘要窗口，
+  位置信息通过二分查找已存储的偏移得到，无需再用正则回溯正文
+- contentless FTS5 表不提供命中偏移 (fts5vocab instance 视图按词读取整个倒排列表，比扫描命中文档慢得多)，
+  因此仍在正文中匹配；命中很多的文档扫描到 MAX_SCANNED_MATCHES 处为止，不再扫描剩余正文
+"""
+
+import re
+from bisect import bisect_right
+from itertools import islice
+from typing import List, Optional, Tuple
+
+from .memo import LRUMemo
+
+# [Page:1], [Sheet:Sheet1 Row:1 Col:A], [Slide:1], [Para:1], [Table:1...]
+LOCATION_PATTERN = re.compile(r'\[((?:Page|Sheet|Row|Col|Slide|Para|Table):[^\]]+)\]')
+LOCATION_PART_PATTERN = re.compile(r'(Page|Sheet|Row|Col|Slide|Para|Table):(.+?)(?=\s+(?:Page|Sheet|Row|Col|Slide|Para|Table):|$)')
+
+DEFAULT_SNIPPET_COUNT = 3
+DEFAULT_CONTEXT = 80
+# 返回给前端的命中位置标签上限 (如 "第 3、7、41 页")
+MAX_HIT_LOCATIONS = 20
+# 每个文档统计的命中次数上限 (与正则搜索相同)；摘要窗口从这些命中中选出
+MAX_SCANNED_MATCHES = 1000
+
+# 查询词 -> 编译后的匹配正则 (分页和流式请求会反复用同一组词)
+_pattern_memo = LRUMemo('snippet_pattern', 256)
+
+
+def _compile_terms(terms: tuple):
+    return re.compile('|'.join(re.escape(t) for t in terms), re.IGNORECASE) if terms else None
+
+
+def _location_key(label: str) -> str:
+    """Excel 单元格标记按行合并 (去掉 Col)，其余标记保持原样"""
+    return re.sub(r'\s+Col:\S+', '', label)
+
+
+def extract_locations(content: str) -> List[Tuple[int, str]]:
+    """
+    提取位置标记及其字符偏移，只在位置变化时记录一条
+    返回: [(offset, label), ...]，label 如 "Page:3"、"Sheet:Data Row:5"
+    """
+    locations = []
+    last_label = None
+    for m in LOCATION_PATTERN.finditer(content or ""):
+        label = _location_key(m.group(1))
+        if label != last_label:
+            locations.append((m.start(), label))
+            last_label = label
+    return locations
+
+
+def parse_location(label: str) -> dict:
+    """"Sheet:Data Row:5" -> {'label': 'Sheet:Data Row:5', 'sheet': 'Data', 'row': '5'}"""
+    location = {'label': label}
+    for key, value in LOCATION_PART_PATTERN.findall(label):
+        location[key.lower()] = value.strip()
+    return location
+
+
+class SnippetBuilder:
+    """根据查询词为单个文档生成多段摘要"""
+
+    def __init__(self, terms: List[str], snippet_count: int = DEFAULT_SNIPPET_COUNT, context: int = DEFAULT_CONTEXT):
+        terms = tuple(sorted({t for t in terms if t}, key=lambda t: (-len(t), t)))
+        self.pattern = _pattern_memo.get_or_compute(terms, lambda: _compile_terms(terms))
+        self.snippet_count = snippet_count
+        self.context = context
+
+    def build(self, content: str, locations: Optional[List[Tuple[int, str]]] = None, fallback_offset: int = 0) -> dict:
+        """
+        fallback_offset: 正文中没有命中时摘要的起始位置 (语义搜索命中的片段)
+        返回:
+        {
+            'hit_count': 命中次数 (最多 MAX_SCANNED_MATCHES),
+            'locations': 命中所在位置标签 (去重，按出现顺序),
+            'snippets': [{'text', 'start', 'end', 'matches': [[s, e], ...], 'hit_count', 'location'}, ...]
+        }
+        snippets 按命中密度排序，text 中命中部分用 <b></b> 标记
+        """
+        content = content or ""
+        locations = locations or []
+        offsets = [offset for offset, _ in locations]
+        matches = [m.span() for m in islice(self.pattern.finditer(content), MAX_SCANNED_MATCHES)] if self.pattern else []
+
+        hit_locations = []
+        if offsets:
+            seen = set()
+            for start, _ in matches:
+                idx = bisect_right(offsets, start) - 1
+                if idx >= 0 and idx not in seen:
+                    seen.add(idx)
+                    hit_locations.append(locations[idx][1])
+                    if len(hit_locations) >= MAX_HIT_LOCATIONS:
+                        break
+
+        if not matches:
+            # 可能只命中标题，返回正文开头 (或指定位置)
+            start = min(max(fallback_offset, 0), len(content))
+            end = min(len(content), start + self.context * 2)
+            text = ("..." if start > 0 else "") + content[start:end] + ("..." if end < len(content) else "")
+            snippets = [{'text': text, 'start': start, 'end': end, 'matches': [], 'hit_count': 0,
+                         'location': self._location_at(start, offsets, locations)}] if content else []
+            return {'hit_count': 0, 'locations': hit_locations, 'snippets': snippets}
+
+        return {
+            'hit_count': len(matches),
+            'locations': hit_locations,
+            'snippets': [self._render(content, window, offsets, locations) for window in self._select_windows(matches)],
+        }
+
+    def _select_windows(self, matches: List[Tuple[int, int]]) -> List[List[Tuple[int, int]]]:
+        """把相邻命中聚合为窗口，按窗口内命中数选出 top-k 个不重叠窗口"""
+        span = self.context * 2
+        windows = []
+        current = [matches[0]]
+        for match in matches[1:]:
+            if match[1] - current[0][0] <= span:
+                current.append(match)
+            else:
+                windows.append(current)
+                current = [match]
+        windows.append(current)
+        # 命中数多的优先，同样多时靠前的优先
+        ranked = sorted(range(len(windows)), key=lambda i: (-len(windows[i]), i))
+        return [windows[i] for i in ranked[:self.snippet_count]]
+
+    def _location_at(self, offset: int, offsets: List[int], locations: List[Tuple[int, str]]) -> Optional[dict]:
+        idx = bisect_right(offsets, offset) - 1
+        return parse_location(locations[idx][1]) if idx >= 0 else None
+
+    def _render(self, content: str, window: List[Tuple[int, int]], offsets: List[int], locations) -> dict:
+        first_start = window[0][0]
+        last_end = window[-1][1]
+        padding = max(0, (self.context * 2 - (last_end - first_start)) // 2)
+        start = max(0, first_start - padding)
+        end = min(len(content), last_end + padding)
+
+        parts = []
+        cursor = start
+        for s, e in window:
+            parts.append(content[cursor:s])
+            parts.append(f"<b>{content[s:e]}</b>")
+            cursor = e
+        parts.append(content[cursor:end])
+        text = "".join(parts)
+        if start > 0:
+            text = "..." + text
+        if end < len(content):
+            text = text + "..."
+
+        return {
+            'text': text,
+            'start': start,
+            'end': end,
+            'matches': [[s, e] for s, e in window],
+            'hit_count': len(window),
+            'location': self._location_at(first_start, offsets, locations),
+        }
@@ -0,0 +1,272 @@
+"""
+离线领域词库 (同义词 / 缩写) 查询扩展
+- 用户把词库文件放在数据目录下的 thesaurus/ (.txt / .tsv / .csv)，每行一组互为同义的词，
+  用 | 、制表符、逗号或分号分隔，# 开头为注释，例:
+      AE | adverse event | 不良事件
+      ITT | intention-to-treat | 意向性治疗
+- 词库编译为一个只读二进制文件后以 mmap 方式打开，进程内几乎不占内存:
+  词的 64 位哈希升序排列，查询时二分查找，再校验原文 (排除哈希冲突)
+- 编译文件名包含源文件指纹，源文件变化后生成新文件，旧文件在不再被映射后清理
+- 查询扩展完全在本地完成；只有词库中没有的词才需要 AI 扩展
+"""
+
+import os
+import re
+import sys
+import mmap
+import struct
+import hashlib
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from ..core import database
+
+logger = logging.getLogger(__name__)
+
+SOURCE_EXTENSIONS = ('.txt', '.tsv', '.csv')
+SEPARATOR_PATTERN = re.compile(r'[|\t,;，；]')
+
+# 单组最多保留的词数，防止异常的超长行
+MAX_GROUP_SIZE = 64
+
+MAGIC = b'THS1'
+# magic, 字节序, 字符串数, 条目数, 组数, 组成员数, 字符串区字节数
+HEADER = struct.Struct('<4sBxxxIIIII')
+
+
+def thesaurus_dir() -> str:
+    return os.path.join(os.path.dirname(database.DB_PATH), 'thesaurus')
+
+
+def normalize(term: str) -> str:
+    return ' '.join((term or "").lower().split())
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _read_text(path: str) -> str:
+    with open(path, 'rb') as f:
+        data = f.read()
+    # 用户的词库常见 UTF-8 (含 BOM) 或 GBK 编码
+    for encoding in ('utf-8-sig', 'gb18030'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('utf-8', errors='ignore')
+
+
+def parse_groups(text: str) -> List[List[str]]:
+    """词库文本 -> 同义词组 (每组至少两个不同的词)"""
+    groups = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        terms: Dict[str, str] = {}
+        for part in SEPARATOR_PATTERN.split(line):
+            term = ' '.join(part.split())
+            if term:
+                terms.setdefault(term.lower(), term)
+        if len(terms) >= 2:
+            groups.append(list(terms.values())[:MAX_GROUP_SIZE])
+    return groups
+
+
+def source_files(directory: Optional[str] = None) -> List[str]:
+    directory = directory or thesaurus_dir()
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return []
+    return [os.path.join(directory, name) for name in names if name.lower().endswith(SOURCE_EXTENSIONS)]
+
+
+def fingerprint(sources: List[str]) -> str:
+    digest = hashlib.sha256(sys.byteorder.encode())
+    for path in sources:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _padded(data: bytes) -> bytes:
+    return data + b'\0' * (-len(data) % 8)
+
+
+def compile_thesaurus(groups: List[List[str]], path: str):
+    """把同义词组编译为 mmap 文件 (先写临时文件再替换)"""
+    string_ids: Dict[str, int] = {}
+    strings: List[str] = []
+    group_offsets = array('I', [0])
+    group_members = array('I')
+    entries = set()
+    for group_id, group in enumerate(groups):
+        for term in group:
+            key = term.lower()
+            string_id = string_ids.get(key)
+            if string_id is None:
+                string_id = string_ids[key] = len(strings)
+                strings.append(term)
+            group_members.append(string_id)
+            entries.add((_hash(key), string_id, group_id))
+        group_offsets.append(len(group_members))
+
+    entries = sorted(entries)
+    hashes = array('Q', (e[0] for e in entries))
+    entry_strings = array('I', (e[1] for e in entries))
+    entry_groups = array('I', (e[2] for e in entries))
+
+    blob = bytearray()
+    string_offsets = array('I', [0])
+    for term in strings:
+        blob += term.encode('utf-8')
+        string_offsets.append(len(blob))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_padded(HEADER.pack(MAGIC, 0 if sys.byteorder == 'little' else 1, len(strings),
+                                    len(entries), len(groups), len(group_members), len(blob))))
+        for section in (hashes, entry_strings, entry_groups, group_offsets, group_members, string_offsets):
+            f.write(_padded(section.tobytes()))
+        f.write(bytes(blob))
+    os.replace(tmp_path, path)
+
+
+class Thesaurus:
+    """已编译词库的只读视图 (mmap)"""
+
+    def __init__(self, path: Optional[str] = None, source_count: int = 0):
+        self.path = path
+        self.source_count = source_count
+        self._mmap = None
+        self.string_count = self.entry_count = self.group_count = 0
+        if path is None:
+            return
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, byteorder, self.string_count, self.entry_count, self.group_count, member_count, blob_size = \
+            HEADER.unpack_from(view)
+        if magic != MAGIC or byteorder != (0 if sys.byteorder == 'little' else 1):
+            raise ValueError(f"Unsupported thesaurus file: {path}")
+
+        offset = HEADER.size + (-HEADER.size % 8)
+
+        def section(fmt: str, count: int):
+            nonlocal offset
+            size = count * struct.calcsize(fmt)
+            data = view[offset:offset + size].cast(fmt)
+            offset += size + (-size % 8)
+            return data
+
+        self._hashes = section('Q', self.entry_count)
+        self._entry_strings = section('I', self.entry_count)
+        self._entry_groups = section('I', self.entry_count)
+        self._group_offsets = section('I', self.group_count + 1)
+        self._group_members = section('I', member_count)
+        self._string_offsets = section('I', self.string_count + 1)
+        self._blob = view[offset:offset + blob_size]
+
+    def _string(self, string_id: int) -> str:
+        return bytes(self._blob[self._string_offsets[string_id]:self._string_offsets[string_id + 1]]).decode('utf-8')
+
+    def expand(self, term: str) -> List[str]:
+        """term 的同义词和缩写 (不含 term 本身；按词库中的顺序，多组时依次合并)"""
+        if not self.entry_count:
+            return []
+        key = normalize(term)
+        h = _hash(key)
+        i = bisect_left(self._hashes, h)
+        expanded: Dict[str, None] = {}
+        while i < self.entry_count and self._hashes[i] == h:
+            if self._string(self._entry_strings[i]).lower() == key:
+                group = self._entry_groups[i]
+                for j in range(self._group_offsets[group], self._group_offsets[group + 1]):
+                    member = self._string(self._group_members[j])
+                    if member.lower() != key:
+                        expanded.setdefault(member)
+            i += 1
+        return list(expanded)
+
+    def stats(self) -> dict:
+        return {
+            'sources': self.source_count,
+            'terms': self.string_count,
+            'groups': self.group_count,
+            'size_kb': round(len(self._mmap) / 1024, 1) if self._mmap is not None else 0,
+        }
+
+
+def _remove_stale(directory: str, keep: str):
+    for name in os.listdir(directory):
+        if name.endswith('.idx') and os.path.join(directory, name) != keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                # Windows 下仍被映射的文件无法删除，下次加载时再清理
+                pass
+
+
+def load_thesaurus(directory: Optional[str] = None) -> Thesaurus:
+    """打开 (必要时先编译) directory 下的词库；没有词库文件时返回空词库"""
+    directory = directory or thesaurus_dir()
+    sources = source_files(directory)
+    if not sources:
+        return Thesaurus()
+    compiled_dir = os.path.join(directory, '.compiled')
+    os.makedirs(compiled_dir, exist_ok=True)
+    path = os.path.join(compiled_dir, f"thesaurus-{fingerprint(sources)}.idx")
+    if not os.path.exists(path):
+        groups = []
+        for source in sources:
+            groups.extend(parse_groups(_read_text(source)))
+        compile_thesaurus(groups, path)
+        logger.info(f"Compiled thesaurus: {len(groups)} groups from {len(sources)} files")
+    _remove_stale(compiled_dir, path)
+    return Thesaurus(path, len(sources))
+
+
+_thesaurus: Optional[Thesaurus] = None
+_thesaurus_lock = threading.Lock()
+# 每次重新加载加一，用于查询扩展缓存的键
+_generation = 0
+
+
+def get_thesaurus() -> Thesaurus:
+    global _thesaurus
+    thesaurus = _thesaurus
+    if thesaurus is not None:
+        return thesaurus
+    with _thesaurus_lock:
+        if _thesaurus is None:
+            try:
+                _thesaurus = load_thesaurus()
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load thesaurus: {e}")
+                _thesaurus = Thesaurus()
+        return _thesaurus
+
+
+def thesaurus_generation() -> int:
+    return _generation
+
+
+def reload_thesaurus() -> Thesaurus:
+    """词库文件变化后重新编译并加载"""
+    global _thesaurus, _generation
+    with _thesaurus_lock:
+        _thesaurus = None
+        _generation += 1
+    return get_thesaurus()
+
+
+def thesaurus_stats() -> dict:
+    stats = get_thesaurus().stats()
+    stats['directory'] = thesaurus_dir()
+    return stats
@@ -0,0 +1,228 @@
+"""
+索引词表与拼写纠错
+- 词表来自 bigram_index 的 fts5vocab 视图 (bigram_vocab)，每个词带文档频率
+- 纠错使用 SymSpell 对称删除算法: 建表时只为词的前缀生成删除变体，
+  查询时同样生成删除变体后查表，再用 Damerau-Levenshtein 距离校验候选
+- 索引内容变化后调用 invalidate_vocabulary()，在后台线程重新加载，加载完成前继续使用旧词表
+  (只有第一次加载在调用方线程中进行)
+"""
+
+import re
+import threading
+import time
+import logging
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from ..core.database import get_db_connection
+from .shards import attached_databases
+
+logger = logging.getLogger(__name__)
+
+# 只对字母开头的英文/代码词纠错 (中文由拼音和 bigram 处理)
+VOCAB_TERM_PATTERN = re.compile(r'^[a-z][a-z0-9]{2,}$')
+
+# 生成删除变体时只看词的前几个字符，控制内存 (SymSpell prefix length)
+PREFIX_LENGTH = 7
+
+# 删除变体的编辑距离；前缀内两侧各删一个字符，可覆盖替换和相邻交换
+DELETE_DISTANCE = 1
+
+# 词长不超过该值时最多允许 1 处编辑，更长的词允许 2 处
+SHORT_TERM_LENGTH = 7
+
+# 按文档频率保留的最大词数
+MAX_VOCAB_TERMS = 200000
+
+DEFAULT_MAX_CORRECTIONS = 3
+
+
+def damerau_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """
+    受限 Damerau-Levenshtein 距离 (含相邻交换)
+    超过 max_distance 时提前返回 max_distance + 1
+    """
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word: str, distance: int) -> set:
+    """word 删除至多 distance 个字符得到的全部变体 (含 word 本身)"""
+    results = {word}
+    frontier = {word}
+    for _ in range(distance):
+        next_frontier = set()
+        for item in frontier:
+            for i in range(len(item)):
+                next_frontier.add(item[:i] + item[i + 1:])
+        results |= next_frontier
+        frontier = next_frontier
+    return results
+
+
+def allowed_distance(term: str) -> int:
+    return 1 if len(term) <= SHORT_TERM_LENGTH else 2
+
+
+class Vocabulary:
+    """索引词表 + SymSpell 删除表"""
+
+    def __init__(self, doc_freq: Dict[str, int], generation: int = 0):
+        self.doc_freq = doc_freq
+        # 每次重新加载递增，供依赖词表的缓存作为 key 的一部分
+        self.generation = generation
+        self.sorted_terms = sorted(doc_freq)
+        self.deletes: Dict[str, List[str]] = {}
+        for term in doc_freq:
+            for variant in _deletes(term[:PREFIX_LENGTH], DELETE_DISTANCE):
+                self.deletes.setdefault(variant, []).append(term)
+
+    @classmethod
+    def load(cls, connections, generation: int = 0) -> "Vocabulary":
+        """从各库 (主库和分片) 的 bigram_vocab 读取词表 (文档频率相加，保留前 MAX_VOCAB_TERMS 个)"""
+        totals = {}
+        for conn in connections:
+            for term, doc in conn.execute(
+                "SELECT term, doc FROM bigram_vocab ORDER BY doc DESC LIMIT ?", (MAX_VOCAB_TERMS * 2,)
+            ):
+                if VOCAB_TERM_PATTERN.match(term):
+                    totals[term] = totals.get(term, 0) + doc
+        doc_freq = dict(sorted(totals.items(), key=lambda item: -item[1])[:MAX_VOCAB_TERMS])
+        return cls(doc_freq, generation)
+
+    def __len__(self):
+        return len(self.doc_freq)
+
+    def __contains__(self, term: str):
+        return term in self.doc_freq
+
+    def has_prefix(self, prefix: str) -> bool:
+        """是否有词以 prefix 开头 (查询词按前缀匹配，未输完的词不算拼错)"""
+        idx = bisect_left(self.sorted_terms, prefix)
+        return idx < len(self.sorted_terms) and self.sorted_terms[idx].startswith(prefix)
+
+    def lookup(self, term: str, max_distance: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """
+        返回与 term 编辑距离在允许范围内的词表词
+        结果: [(词, 编辑距离, 文档频率), ...]，按距离升序、文档频率降序
+        """
+        term = term.lower()
+        if max_distance is None:
+            max_distance = allowed_distance(term)
+        candidates = set()
+        for variant in _deletes(term[:PREFIX_LENGTH], DELETE_DISTANCE):
+            candidates.update(self.deletes.get(variant, ()))
+        results = []
+        for candidate in candidates:
+            if candidate == term:
+                continue
+            distance = damerau_levenshtein(term, candidate, max_distance)
+            if distance <= max_distance:
+                results.append((candidate, distance, self.doc_freq[candidate]))
+        results.sort(key=lambda r: (r[1], -r[2], r[0]))
+        return results
+
+    def corrections(self, term: str, limit: int = DEFAULT_MAX_CORRECTIONS) -> List[str]:
+        """
+        拼写纠错: 词表中不存在 (也不是任何词的前缀) 的查询词，返回最接近的索引词
+        """
+        term = term.lower().strip()
+        if not VOCAB_TERM_PATTERN.match(term) or term in self.doc_freq or self.has_prefix(term):
+            return []
+        return [candidate for candidate, _, _ in self.lookup(term)[:limit]]
+
+
+_vocabulary: Optional[Vocabulary] = None
+_vocabulary_lock = threading.Lock()
+_first_load_lock = threading.Lock()
+_generation = 0
+# 索引变化后词表已过期 / 后台重新加载正在进行
+_stale = False
+_reloading = False
+
+
+def _load_vocabulary() -> Optional[Vocabulary]:
+    """从数据库加载新的词表；失败时返回 None"""
+    global _generation
+    start = time.perf_counter()
+    with _vocabulary_lock:
+        _generation += 1
+        generation = _generation
+    connections = [get_db_connection(db_path) for db_path in attached_databases()]
+    try:
+        vocabulary = Vocabulary.load(connections, generation)
+    except Exception as e:
+        logger.error(f"Failed to load vocabulary: {e}")
+        return None
+    finally:
+        for conn in connections:
+            conn.close()
+    logger.info(f"Loaded vocabulary: {len(vocabulary)} terms in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return vocabulary
+
+
+def get_vocabulary() -> Vocabulary:
+    """返回当前词表；索引变化后在后台重新加载，期间返回旧词表"""
+    global _vocabulary
+    vocabulary = _vocabulary
+    if vocabulary is not None:
+        return vocabulary
+    with _first_load_lock:
+        if _vocabulary is None:
+            # 第一次加载没有旧词表可用，在当前线程加载 (启动时已在后台预加载)
+            vocabulary = _load_vocabulary()
+            if vocabulary is None:
+                return Vocabulary({}, _generation)
+            with _vocabulary_lock:
+                _vocabulary = vocabulary
+        return _vocabulary
+
+
+def _reload():
+    global _vocabulary, _stale, _reloading
+    try:
+        while True:
+            with _vocabulary_lock:
+                _stale = False
+            vocabulary = _load_vocabulary()
+            with _vocabulary_lock:
+                if vocabulary is not None:
+                    _vocabulary = vocabulary
+                # 加载期间索引又有变化时再加载一次
+                if not _stale:
+                    return
+    finally:
+        with _vocabulary_lock:
+            _reloading = False
+
+
+def invalidate_vocabulary():
+    """索引内容变化后调用: 在后台重新加载 (连续多次调用合并为一次加载)"""
+    global _stale, _reloading
+    with _vocabulary_lock:
+        if _vocabulary is None:
+            return
+        _stale = True
+        if _reloading:
+            return
+        _reloading = True
+    threading.Thread(target=_reload, name='vocabulary-reload', daemon=True).start()
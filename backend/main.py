@@ -1,10 +1,18 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Query
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
 from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import uvicorn
 import sys
 import os
+import json
+import asyncio
+import threading
+import multiprocessing
+import time
+from itertools import islice
 from typing import List, Optional
 
 # Import services
@@ -13,15 +21,47 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.core.database import init_db
 from app.services.indexer import Indexer
-from app.services.search_engine import SearchEngine
-from app.services.ai_client import AIClient
+from app.services.search_engine import get_search_engine
+from app.services.filters import SearchFilters, FilterError
+from app.services.memo import memo_stats
+from app.services.ai_client import AIClient, start_http_client, close_http_client, http_client_stats
+from app.services.ai_cache import get_ai_cache
+from app.services.thesaurus import (
+    get_thesaurus, reload_thesaurus, thesaurus_stats, thesaurus_dir, SOURCE_EXTENSIONS
+)
+from app.services.vocabulary import get_vocabulary, invalidate_vocabulary
+from app.services.autocomplete import get_autocomplete, invalidate_autocomplete
+from app.services.path_index import get_path_index, invalidate_path_index, DEFAULT_FILENAME_LIMIT
+from app.services.cancellation import SearchCancelled, search_registry, DEFAULT_SEARCH_TIMEOUT_MS
+from app.services.semantic_index import (
+    rebuild_semantic_index, semantic_stats, SemanticIndexUnavailable, NUMPY_AVAILABLE
+)
+from app.services.regex_search import RegexSearchError, compile_pattern, start_regex_pool, shutdown_regex_pool
+from app.services.maintenance import index_maintenance, note_activity
+from app.services import shards
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize DB on startup
     init_db()
+    # 中断的分片建立 / 重建留下的文件
+    shards.remove_orphan_files()
+    Indexer().upgrade_index()
+    # 文件名索引、拼写纠错词表和补全索引在后台加载，不阻塞启动
+    threading.Thread(target=get_path_index, daemon=True).start()
+    threading.Thread(target=get_vocabulary, daemon=True).start()
+    threading.Thread(target=get_autocomplete, daemon=True).start()
+    # AI 请求共用的连接池
+    start_http_client()
+    # 正则验证的工作进程 (spawn 启动，预先启动好)
+    start_regex_pool()
+    # 空闲时合并 FTS 段、更新统计信息、回收空闲页
+    index_maintenance.start()
     yield
     # Clean up resources on shutdown if needed
+    index_maintenance.stop()
+    await close_http_client()
+    shutdown_regex_pool()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -34,6 +74,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 不算作用户活动的请求 (维护任务只在没有其它请求时自动运行)
+QUIET_PATHS = ("/index/maintenance", "/health", "/debug")
+
+class ActivityMiddleware:
+    """Record request activity so index maintenance waits for idle periods."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(QUIET_PATHS):
+            note_activity()
+        await self.app(scope, receive, send)
+
+app.add_middleware(ActivityMiddleware)
+
 class FolderRequest(BaseModel):
     folder_path: str
 
@@ -102,7 +158,14 @@ def get_debug_stats():
                 "index_count": index_count,
                 "file_types": file_types
             },
-            "sample_paths": sample_paths
+            "sample_paths": sample_paths,
+            "caches": memo_stats(),
+            "semantic_index": semantic_stats(),
+            "ai_cache": get_ai_cache().stats(),
+            "ai_http": http_client_stats(),
+            "thesaurus": thesaurus_stats(),
+            "maintenance": index_maintenance.status(),
+            "shards": shards.shard_stats()
         }
     except Exception as e:
         return {
@@ -137,6 +200,147 @@ async def rebuild_index(request: RebuildRequest, background_tasks: BackgroundTas
     
     return {"status": "rebuild_started", "paths_count": len(request.paths)}
 
+@app.post("/index/semantic/rebuild")
+async def rebuild_semantic(background_tasks: BackgroundTasks):
+    """
+    在后台重建语义检索的向量索引 (重新训练词表和投影矩阵)
+    """
+    if not NUMPY_AVAILABLE:
+        raise HTTPException(status_code=501, detail="numpy is not installed, semantic search is unavailable")
+    started = rebuild_semantic_index()
+    return {"status": "rebuild_started" if started else "already_running"}
+
+class MaintenanceRequest(BaseModel):
+    full: bool = False
+
+@app.get("/index/maintenance")
+def get_maintenance_status():
+    """
+    索引健康状况 (各 FTS 表段数、空闲空间、统计信息)、待执行的维护步骤和最近一次维护的结果
+    """
+    return index_maintenance.status()
+
+@app.post("/index/maintenance")
+async def run_maintenance(request: Optional[MaintenanceRequest] = None):
+    """
+    立即执行一轮索引维护 (不等待空闲，不检查阈值)
+    full=true 时不限时间: 完整 optimize 各 FTS 表，旧数据库执行一次完整 VACUUM，耗时与索引大小成正比
+    """
+    full = request.full if request is not None else False
+    result = await run_in_threadpool(index_maintenance.run, True, full)
+    if result is None:
+        return {"status": "already_running"}
+    return {"status": "completed", **result}
+
+class ShardRequest(BaseModel):
+    root: str
+
+def _shard_root(root: str) -> str:
+    root = shards.normalize_root(root)
+    if not os.path.isdir(root):
+        raise HTTPException(status_code=404, detail="Folder not found")
+    return root
+
+@app.get("/index/shards")
+def list_shards():
+    """
+    分片列表: 根目录、文件、是否挂载、大小和文档数
+    """
+    return {"shards": shards.shard_stats()}
+
+@app.post("/index/shards")
+async def create_shard(request: ShardRequest, background_tasks: BackgroundTasks):
+    """
+    在后台为根目录建立分片 (已有分片时重建): 写入新的分片文件，完成后切换，
+    并从主库删除该目录下的文档；建立期间搜索照常使用旧数据
+    """
+    root = _shard_root(request.root)
+    shard = shards.find_shard(root)
+    if shard is not None and os.path.normcase(shard.root) != os.path.normcase(root):
+        raise HTTPException(status_code=409, detail=f"Folder is inside the shard {shard.root}")
+    # 分片不能嵌套: 包含其他分片的目录要先删除里面的分片
+    nested = [s.root for s in shards.get_shards() if shards.is_under(s.root, root) and s is not shard]
+    if nested:
+        raise HTTPException(status_code=409, detail=f"Folder contains the shards {nested}")
+    background_tasks.add_task(Indexer().build_shard, root)
+    return {"status": "build_started", "root": root}
+
+@app.post("/index/shards/rebuild")
+async def rebuild_shard(request: ShardRequest, background_tasks: BackgroundTasks):
+    """
+    在后台重建已有的分片 (重新索引到新文件后切换，旧文件直接删除)
+    """
+    root = shards.normalize_root(request.root)
+    if shards.get_shard(root) is None:
+        raise HTTPException(status_code=404, detail="Shard not found")
+    _shard_root(root)
+    background_tasks.add_task(Indexer().build_shard, root)
+    return {"status": "build_started", "root": root}
+
+def _set_shard_attached(root: str, attached: bool) -> dict:
+    root = shards.normalize_root(root)
+    if not shards.set_attached(root, attached):
+        raise HTTPException(status_code=404, detail="Shard not found")
+    invalidate_vocabulary()
+    invalidate_autocomplete()
+    invalidate_path_index()
+    return {"status": "attached" if attached else "detached", "root": root}
+
+@app.post("/index/shards/detach")
+def detach_shard(request: ShardRequest):
+    """
+    卸载分片: 保留文件，但不再参与搜索和索引更新
+    """
+    return _set_shard_attached(request.root, False)
+
+@app.post("/index/shards/attach")
+def attach_shard(request: ShardRequest):
+    """
+    重新挂载已卸载的分片
+    """
+    return _set_shard_attached(request.root, True)
+
+@app.post("/index/shards/delete")
+def delete_shard(request: ShardRequest):
+    """
+    删除分片及其文件 (根目录下的索引数据随之删除)
+    """
+    root = shards.normalize_root(request.root)
+    if shards.get_shard(root) is None:
+        raise HTTPException(status_code=404, detail="Shard not found")
+    return {"status": "completed", "root": root, "deleted_count": Indexer().remove_path(root)}
+
+@app.get("/thesaurus")
+def get_thesaurus_info():
+    """
+    离线领域词库的状态 (词库目录、文件数、词条数)
+    """
+    return thesaurus_stats()
+
+@app.post("/thesaurus/reload")
+def reload_thesaurus_files():
+    """
+    词库目录中的文件变化后重新编译并加载
+    """
+    reload_thesaurus()
+    return thesaurus_stats()
+
+@app.post("/thesaurus/import")
+def import_thesaurus(request: PathRequest):
+    """
+    把用户选择的词库文件复制到词库目录并重新加载
+    """
+    import shutil
+
+    if not os.path.isfile(request.path):
+        raise HTTPException(status_code=404, detail="File not found")
+    if not request.path.lower().endswith(SOURCE_EXTENSIONS):
+        raise HTTPException(status_code=400, detail=f"Unsupported thesaurus file type, expected one of {', '.join(SOURCE_EXTENSIONS)}")
+    os.makedirs(thesaurus_dir(), exist_ok=True)
+    shutil.copyfile(request.path, os.path.join(thesaurus_dir(), os.path.basename(request.path)))
+    reload_thesaurus()
+    return thesaurus_stats()
+
 class IndexStatusRequest(BaseModel):
     paths: List[str]
 
@@ -148,19 +352,21 @@ async def get_index_status(request: IndexStatusRequest):
     """
     from app.core.database import get_db_connection
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     results = []
     for path in request.paths:
         path = os.path.normpath(os.path.abspath(path))
         
-        # 查询该路径下已索引的文件数
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM files 
-            WHERE file_path LIKE ? AND indexed_status = 1
-        """, (path + '%',))
-        indexed_count = cursor.fetchone()['count']
+        # 查询该路径下已索引的文件数 (路径涉及的主库和分片)
+        indexed_count = 0
+        for db_path in shards.databases_in_scope([path]):
+            conn = get_db_connection(db_path)
+            try:
+                indexed_count += conn.execute("""
+                    SELECT COUNT(*) as count FROM files 
+                    WHERE file_path LIKE ? AND indexed_status = 1
+                """, (path + '%',)).fetchone()['count']
+            finally:
+                conn.close()
         
         # 判断索引状态
         if indexed_count > 0:
@@ -174,7 +380,6 @@ async def get_index_status(request: IndexStatusRequest):
             'indexed_count': indexed_count
         })
     
-    conn.close()
     return {"results": results}
 
 class BatchIndexRequest(BaseModel):
@@ -189,14 +394,8 @@ async def batch_index(request: BatchIndexRequest):
     import logging
     logger = logging.getLogger(__name__)
     
-    from app.core.database import get_db_connection
-    
-    # 获取索引前的记录数
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) as count FROM search_index")
-    before_count = cursor.fetchone()['count']
-    conn.close()
+    # 获取索引前的记录数 (主库和各分片)
+    before_count = shards.document_count()
     
     indexer = Indexer()
     indexed_paths = []
@@ -211,11 +410,7 @@ async def batch_index(request: BatchIndexRequest):
                 logger.error(f"Failed to index {path}: {e}")
     
     # 获取索引后的记录数
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) as count FROM search_index")
-    after_count = cursor.fetchone()['count']
-    conn.close()
+    after_count = shards.document_count()
     
     new_indexed = after_count - before_count
     
@@ -237,29 +432,12 @@ async def delete_index(request: DeleteIndexRequest):
     import logging
     logger = logging.getLogger(__name__)
     
-    from app.core.database import get_db_connection
-    
     path = os.path.normpath(os.path.abspath(request.path))
     logger.info(f"Deleting index for path: {path}")
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
-        # 统计要删除的记录数
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM files 
-            WHERE file_path LIKE ?
-        """, (path + '%',))
-        delete_count = cursor.fetchone()['count']
-        
-        # 从 files 表删除
-        cursor.execute("DELETE FROM files WHERE file_path LIKE ?", (path + '%',))
-        
-        # 从 search_index 表删除
-        cursor.execute("DELETE FROM search_index WHERE file_path LIKE ?", (path + '%',))
-        
-        conn.commit()
+        # 范围内的分片整体删除，其余的文档逐行删除
+        delete_count = Indexer().remove_path(path)
         logger.info(f"Deleted {delete_count} indexed files for path: {path}")
         
         return {
@@ -270,8 +448,6 @@ async def delete_index(request: DeleteIndexRequest):
     except Exception as e:
         logger.error(f"Failed to delete index: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 @app.post("/index/path")
 async def index_path(request: PathRequest):
@@ -286,13 +462,8 @@ async def index_path(request: PathRequest):
     
     logger.info(f"Starting indexing for path: {request.path}")
     
-    # 获取索引前的记录数
-    from app.core.database import get_db_connection
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) as count FROM search_index")
-    before_count = cursor.fetchone()['count']
-    conn.close()
+    # 获取索引前的记录数 (主库和各分片)
+    before_count = shards.document_count()
     
     # 同步执行索引
     try:
@@ -300,11 +471,7 @@ async def index_path(request: PathRequest):
         indexer.index_path(request.path)
         
         # 获取索引后的记录数
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM search_index")
-        after_count = cursor.fetchone()['count']
-        conn.close()
+        after_count = shards.document_count()
         
         indexed_count = after_count - before_count
         logger.info(f"Indexing completed: {indexed_count} new files indexed")
@@ -334,13 +501,8 @@ async def index_folder(request: FolderRequest):
     
     logger.info(f"Starting indexing for folder: {request.folder_path}")
     
-    # 获取索引前的记录数
-    from app.core.database import get_db_connection
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) as count FROM search_index")
-    before_count = cursor.fetchone()['count']
-    conn.close()
+    # 获取索引前的记录数 (主库和各分片)
+    before_count = shards.document_count()
     
     # 同步执行索引
     try:
@@ -348,11 +510,7 @@ async def index_folder(request: FolderRequest):
         indexer.index_folder(request.folder_path)
         
         # 获取索引后的记录数
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM search_index")
-        after_count = cursor.fetchone()['count']
-        conn.close()
+        after_count = shards.document_count()
         
         indexed_count = after_count - before_count
         logger.info(f"Indexing completed: {indexed_count} new files indexed")
@@ -369,10 +527,54 @@ async def index_folder(request: FolderRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Indexing failed: {str(e)}")
 
+# 检查客户端是否断开连接的间隔 (秒)
+DISCONNECT_POLL_INTERVAL = 0.1
+
+async def _cancel_on_disconnect(request: Request, token):
+    """Cancel the search as soon as the client goes away."""
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel("disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+def search_filters(file_types: Optional[List[str]] = Query(None), folders: Optional[List[str]] = Query(None),
+                   years: Optional[List[int]] = Query(None), modified_after: Optional[str] = None,
+                   modified_before: Optional[str] = None, min_size: Optional[int] = None,
+                   max_size: Optional[int] = None) -> SearchFilters:
+    """
+    Metadata filters shared by the search endpoints:
+    file_types (pdf, sas, ...), folders (path prefixes), years, modified_after /
+    modified_before (YYYY-MM-DD or Unix timestamp), min_size / max_size (bytes).
+    """
+    try:
+        return SearchFilters(file_types, folders, years, modified_after, modified_before, min_size, max_size)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class CancelSearchRequest(BaseModel):
+    request_id: str
+
+@app.post("/search/cancel")
+def cancel_search(request: CancelSearchRequest):
+    """
+    Cancel a running search by the request_id it was started with.
+    """
+    return {"request_id": request.request_id, "cancelled": search_registry.cancel(request.request_id)}
+
 @app.get("/search")
-def search(q: str, limit: int = 50, offset: int = 0, precision: str = "medium", paths: Optional[List[str]] = Query(None)):
+async def search(request: Request, q: str, limit: int = 50, offset: int = 0, precision: str = "medium", paths: Optional[List[str]] = Query(None), ranking: str = "default",
+                 request_id: Optional[str] = None, group: Optional[str] = None, timeout_ms: int = DEFAULT_SEARCH_TIMEOUT_MS,
+                 facets: bool = False, collapse: bool = False, filters: SearchFilters = Depends(search_filters)):
     """
     Search for files with pagination support.
+    The search is aborted when the client disconnects, when /search/cancel is called
+    with its request_id, when a newer search in the same group starts (e.g.
+    group=searchbar for search-as-you-type), or when timeout_ms elapses.
+    Metadata filters (see search_filters) are pushed into the search SQL;
+    facets=true adds counts per file type, root folder and modification year
+    over the full match set. collapse=true collapses near-duplicate versions
+    (_v1, _v2_final, ...) to the newest one, with a similar_versions count.
     """
     import logging
     logger = logging.getLogger(__name__)
@@ -381,7 +583,7 @@ def search(q: str, limit: int = 50, offset: int = 0, precision: str = "medium",
         return {"results": [], "total_count": 0, "has_more": False}
     
     # 记录搜索请求
-    logger.info(f"Search request: query='{q}', limit={limit}, offset={offset}, precision='{precision}', paths={paths}")
+    logger.info(f"Search request: query='{q}', limit={limit}, offset={offset}, precision='{precision}', paths={paths}, ranking='{ranking}', filters={filters}")
     
     # 标准化路径
     normalized_paths = None
@@ -389,23 +591,232 @@ def search(q: str, limit: int = 50, offset: int = 0, precision: str = "medium",
         normalized_paths = [os.path.normpath(os.path.abspath(p)) for p in paths]
         logger.info(f"Normalized paths: {normalized_paths}")
         
-    engine = SearchEngine()
-    # 获取更多结果用于计算总数
-    all_results = engine.search(q, limit + offset + 1, precision, normalized_paths)
-    
-    total_count = len(all_results)
-    has_more = total_count > offset + limit
+    engine = get_search_engine()
+    token = search_registry.register(request_id, group, timeout_ms)
+    watcher = asyncio.create_task(_cancel_on_disconnect(request, token))
+    try:
+        # 多取一条用于判断是否还有下一页 (质量过滤在查询循环中完成，页面总是满的)
+        page_results = await run_in_threadpool(
+            engine.search, q, limit + 1, precision, normalized_paths, ranking, offset, token, filters, collapse
+        )
+        facet_counts = None
+        if facets:
+            facet_counts = await run_in_threadpool(engine.facet_counts, q, precision, normalized_paths, filters, token)
+    except SearchCancelled as e:
+        logger.info(f"Search {e.reason}: query='{q}'")
+        return {"results": [], "total_count": 0, "has_more": False, "cancelled": True, "reason": e.reason}
+    finally:
+        watcher.cancel()
+        search_registry.release(token)
     
-    # 应用分页
-    paginated_results = all_results[offset:offset + limit]
+    has_more = len(page_results) > limit
+    paginated_results = page_results[:limit]
+    total_count = offset + len(page_results)
     
     logger.info(f"Search completed: {len(paginated_results)} results returned (total: {total_count})")
     
-    return {
+    response = {
         "results": paginated_results,
         "total_count": total_count,
         "has_more": has_more
     }
+    if facet_counts is not None:
+        response["facets"] = facet_counts
+    return response
+
+@app.get("/search/filenames")
+def search_filenames(q: str, limit: int = DEFAULT_FILENAME_LIMIT, paths: Optional[List[str]] = Query(None)):
+    """
+    Filename/path-only search served from the in-memory path index.
+    Space-separated words must all match; supports substrings, globs
+    (*.sas, adsl_??.xpt) and pinyin initials (ybl -> 样本量计算.docx).
+    """
+    start = time.perf_counter()
+    normalized_paths = [os.path.normpath(os.path.abspath(p)) for p in paths] if paths else None
+    response = get_path_index().search(q, limit, normalized_paths)
+    response['has_more'] = response['total_count'] > len(response['results'])
+    response['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return response
+
+@app.get("/search/similar")
+def search_similar(file_path: str, limit: int = 10, paths: Optional[List[str]] = Query(None),
+                   filters: SearchFilters = Depends(search_filters)):
+    """
+    "More like this": indexed documents most similar to an indexed file
+    (other versions of a SAP, related TFLs), using the document signature
+    vectors precomputed in the semantic index.
+    """
+    start = time.perf_counter()
+    file_path = os.path.normpath(os.path.abspath(file_path))
+    normalized_paths = [os.path.normpath(os.path.abspath(p)) for p in paths] if paths else None
+    try:
+        results = get_search_engine().similar_documents(file_path, limit, normalized_paths, filters)
+    except SemanticIndexUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if results is None:
+        raise HTTPException(status_code=404, detail=f"File is not indexed: {file_path}")
+    return {
+        "file_path": file_path,
+        "results": results,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
+# 流式搜索首批读取的行数，越小首条结果返回越快
+STREAM_FIRST_BATCH = 5
+
+@app.get("/search/stream")
+async def search_stream(q: str, limit: int = 50, offset: int = 0, precision: str = "medium", paths: Optional[List[str]] = Query(None), ranking: str = "default",
+                        request_id: Optional[str] = None, group: Optional[str] = None, timeout_ms: int = DEFAULT_SEARCH_TIMEOUT_MS,
+                        facets: bool = False, collapse: bool = False, filters: SearchFilters = Depends(search_filters)):
+    """
+    Streaming variant of /search (NDJSON, one JSON frame per line).
+    Results are sent as soon as they are ranked and snippeted:
+        {"type": "result", "result": {...}}
+    followed by a final summary frame:
+        {"type": "summary", "total_count": ..., "has_more": ..., "elapsed_ms": ..., "first_result_ms": ..., "cancelled": ...}
+    Cancellation works as in /search; a client disconnect stops the stream and
+    aborts the running statement. Metadata filters and collapse work as in
+    /search; with facets=true the summary frame carries the facet counts.
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    logger.info(f"Stream search request: query='{q}', limit={limit}, offset={offset}, precision='{precision}', paths={paths}, ranking='{ranking}'")
+    
+    # 标准化路径
+    normalized_paths = None
+    if paths:
+        normalized_paths = [os.path.normpath(os.path.abspath(p)) for p in paths]
+    
+    token = search_registry.register(request_id, group, timeout_ms)
+    
+    def generate():
+        start = time.perf_counter()
+        first_result_ms = None
+        count = 0
+        has_more = False
+        cancelled = None
+        facet_counts = None
+        
+        if q:
+            engine = get_search_engine()
+            results = engine.iter_search(q, precision, normalized_paths, ranking, batch_size=STREAM_FIRST_BATCH, token=token,
+                                         filters=filters, collapse=collapse)
+            try:
+                # 多取一条用于判断是否还有下一页
+                for res in islice(results, offset, offset + limit + 1):
+                    if count == limit:
+                        has_more = True
+                        break
+                    if first_result_ms is None:
+                        first_result_ms = round((time.perf_counter() - start) * 1000, 1)
+                    count += 1
+                    yield json.dumps({"type": "result", "result": res}, ensure_ascii=False) + "\n"
+            except SearchCancelled as e:
+                cancelled = e.reason
+            finally:
+                results.close()
+            if facets and not cancelled:
+                try:
+                    facet_counts = engine.facet_counts(q, precision, normalized_paths, filters, token)
+                except SearchCancelled as e:
+                    cancelled = e.reason
+        
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"Stream search completed: {count} results, first result {first_result_ms} ms, total {elapsed_ms} ms")
+        summary = {
+            "type": "summary",
+            "total_count": offset + count + (1 if has_more else 0),
+            "has_more": has_more,
+            "elapsed_ms": elapsed_ms,
+            "first_result_ms": first_result_ms,
+            "cancelled": cancelled
+        }
+        if facet_counts is not None:
+            summary["facets"] = facet_counts
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
+    
+    async def stream():
+        try:
+            async for chunk in iterate_in_threadpool(generate()):
+                yield chunk
+        finally:
+            # Runs on completion and when the client disconnects mid-stream;
+            # cancelling a finished token is a no-op
+            token.cancel("disconnected")
+            search_registry.release(token)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/search/regex")
+async def search_regex(pattern: str, limit: int = 50, offset: int = 0, paths: Optional[List[str]] = Query(None), ranking: str = "default",
+                       case_sensitive: bool = False, request_id: Optional[str] = None, group: Optional[str] = None,
+                       timeout_ms: int = DEFAULT_SEARCH_TIMEOUT_MS, filters: SearchFilters = Depends(search_filters)):
+    """
+    Regex search over document content (NDJSON, same frames as /search/stream).
+    Required literals of the pattern narrow the candidates through the trigram
+    index; each snippet carries the matching line number. Patterns without
+    literals are scanned within a time budget and the summary frame reports
+    "truncated" when the budget ran out. Invalid patterns return 400.
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    logger.info(f"Regex search request: pattern='{pattern}', limit={limit}, offset={offset}, paths={paths}, case_sensitive={case_sensitive}")
+    try:
+        compile_pattern(pattern, case_sensitive)
+    except RegexSearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    token = search_registry.register(request_id, group, timeout_ms)
+    
+    def generate():
+        start = time.perf_counter()
+        first_result_ms = None
+        count = 0
+        has_more = False
+        cancelled = None
+        stats = {}
+        
+        engine = get_search_engine()
+        results = engine.iter_regex_search(pattern, paths, ranking, case_sensitive, token, stats, filters)
+        try:
+            for res in islice(results, offset, offset + limit + 1):
+                if count == limit:
+                    has_more = True
+                    break
+                if first_result_ms is None:
+                    first_result_ms = round((time.perf_counter() - start) * 1000, 1)
+                count += 1
+                yield json.dumps({"type": "result", "result": res}, ensure_ascii=False) + "\n"
+        except SearchCancelled as e:
+            cancelled = e.reason
+        finally:
+            results.close()
+        
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"Regex search completed: {count} results, scanned {stats.get('scanned')} candidates in {elapsed_ms} ms")
+        yield json.dumps({
+            "type": "summary",
+            "total_count": offset + count + (1 if has_more else 0),
+            "has_more": has_more,
+            "elapsed_ms": elapsed_ms,
+            "first_result_ms": first_result_ms,
+            "cancelled": cancelled,
+            "prefilter": stats.get('prefilter'),
+            "scanned": stats.get('scanned', 0),
+            "truncated": stats.get('truncated', False)
+        }, ensure_ascii=False) + "\n"
+    
+    async def stream():
+        try:
+            async for chunk in iterate_in_threadpool(generate()):
+                yield chunk
+        finally:
+            token.cancel("disconnected")
+            search_registry.release(token)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @app.post("/ai/explain")
 async def explain_code(request: AIExplainRequest):
@@ -421,6 +832,41 @@ async def explain_code(request: AIExplainRequest):
     explanation = await client.explain_code(request.code_snippet, request.context)
     return {"explanation": explanation}
 
+@app.post("/ai/explain/stream")
+async def explain_code_stream(request: AIExplainRequest):
+    """
+    Stream a code explanation as NDJSON frames while the provider generates it.
+    Frames: {"type": "delta", "text"}, then {"type": "done", ...} or {"type": "error", "message"}.
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+
+    client = AIClient(
+        base_url=request.config.base_url,
+        api_key=request.config.api_key,
+        model=request.config.model
+    )
+
+    async def generate():
+        start = time.perf_counter()
+        first_token_ms = None
+        try:
+            async for text in client.explain_code_stream(request.code_snippet, request.context):
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - start) * 1000, 1)
+                yield json.dumps({"type": "delta", "text": text}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"AI explain stream failed: {e}")
+            yield json.dumps({"type": "error", "message": str(e)}, ensure_ascii=False) + "\n"
+            return
+        yield json.dumps({
+            "type": "done",
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            "first_token_ms": first_token_ms
+        }) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 class AITestRequest(BaseModel):
     base_url: str
     api_key: str
@@ -448,69 +894,34 @@ class AIExpandRequest(BaseModel):
 async def expand_query(request: AIExpandRequest):
     """
     Expand search query using AI.
+    Queries found in the offline thesaurus are answered locally without calling the API.
+    Expansions are cached in SQLite per (query, prompt, model, base_url) and
+    concurrent identical requests share one upstream call (see ai_cache.py).
     """
+    local_terms = get_thesaurus().expand(request.query)
+    if local_terms:
+        # 未读取 AI 缓存: cached 为 False，由 source 区分
+        return {"original": request.query, "expanded": local_terms, "cached": False, "source": "thesaurus"}
+
     client = AIClient(
         base_url=request.config.base_url,
         api_key=request.config.api_key,
         model=request.config.model
     )
     
-    expanded_terms = await client.expand_query(request.query, request.prompt)
-    return {"original": request.query, "expanded": expanded_terms}
+    expanded_terms, cached = await get_ai_cache().expand(client, request.query, request.prompt)
+    return {"original": request.query, "expanded": expanded_terms, "cached": cached, "source": "ai"}
 
 @app.get("/search/suggestions")
-def get_search_suggestions(q: str = ""):
+def get_search_suggestions(q: str = "", limit: int = 8):
     """
-    Get search suggestions based on query and history.
+    Autocomplete from file names, code symbols and frequent index terms.
+    Served from an in-memory prefix index kept up to date by the indexer.
     """
-    from app.core.database import get_db_connection
-    
     if not q or len(q) < 2:
         return []
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    suggestions = []
-    
-    try:
-        # 1. 从文件名中获取建议
-        cursor.execute("""
-            SELECT DISTINCT title 
-            FROM search_index 
-            WHERE title LIKE ? 
-            LIMIT 5
-        """, (f"%{q}%",))
-        
-        for row in cursor.fetchall():
-            suggestions.append({
-                "text": row['title'],
-                "type": "filename",
-                "source": "文件名"
-            })
-        
-        # 2. 从内容中获取常见词汇
-        cursor.execute("""
-            SELECT file_path, snippet(search_index, 2, '', '', '...', 10) as snippet
-            FROM search_index 
-            WHERE content MATCH ? 
-            LIMIT 3
-        """, (f'"{q}"*',))
-        
-        for row in cursor.fetchall():
-            suggestions.append({
-                "text": q,
-                "type": "content",
-                "source": f"来自: {os.path.basename(row['file_path'])}",
-                "preview": row['snippet']
-            })
-            
-    except Exception as e:
-        print(f"Suggestion error: {e}")
-    finally:
-        conn.close()
-    
-    return suggestions[:8]  # 限制返回数量
+    return get_autocomplete().suggest(q, limit)
 
 @app.get("/files/recent")
 def get_recent_files(limit: int = 10):
@@ -519,20 +930,26 @@ def get_recent_files(limit: int = 10):
     """
     from app.core.database import get_db_connection
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    def recent(db_path):
+        conn = get_db_connection(db_path)
+        try:
+            return conn.execute("""
+                SELECT file_path, last_modified, file_type
+                FROM files 
+                WHERE indexed_status = 1
+                ORDER BY last_modified DESC 
+                LIMIT ?
+            """, (limit,)).fetchall()
+        finally:
+            conn.close()
     
     try:
-        cursor.execute("""
-            SELECT file_path, last_modified, file_type
-            FROM files 
-            WHERE indexed_status = 1
-            ORDER BY last_modified DESC 
-            LIMIT ?
-        """, (limit,))
+        # 各库分别取最近的 limit 个，合并后再取前 limit 个
+        rows = [row for rows in shards.map_databases(recent, shards.attached_databases()) for row in rows]
+        rows.sort(key=lambda row: row['last_modified'], reverse=True)
         
         results = []
-        for row in cursor.fetchall():
+        for row in rows[:limit]:
             # 从文件路径提取文件名作为title
             file_name = os.path.basename(row['file_path'])
             results.append({
@@ -546,10 +963,10 @@ def get_recent_files(limit: int = 10):
         
     except Exception as e:
         return {"error": str(e)}
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
+    # 正则搜索使用进程池，打包后的可执行文件需要
+    multiprocessing.freeze_support()
     # Allow passing port as argument
     port = 8000
     if len(sys.argv) > 1:
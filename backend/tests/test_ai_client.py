@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.services import ai_client
+from app.services.ai_client import AIClient, CircuitOpenError, start_http_client, close_http_client
+
+# 测试中不真正等待退避
+ai_client.AI_BACKOFF_BASE = 0.01
+ai_client.AI_BACKOFF_MAX = 0.05
+
+
+class SSEStream:
+    def __init__(self, texts, delay=0.0):
+        self.events = [json.dumps({'choices': [{'delta': {'content': t}}]}) for t in texts] + ['[DONE]']
+        self.delay = delay
+
+
+class StubServer:
+    """
+    本地 OpenAI 兼容桩服务: 按顺序返回预设的 (状态码, 响应体)，用完后一直返回最后一个
+    响应体为 SSEStream 时逐个分片以 text/event-stream 发送
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self.rfile.read(length)
+                stub.requests.append(self.client_address[1])
+                index = min(len(stub.requests), len(stub.responses)) - 1
+                status, body = stub.responses[index]
+                if isinstance(body, SSEStream):
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Connection', 'close')
+                    self.end_headers()
+                    self.close_connection = True
+                    for event in body.events:
+                        self.wfile.write(f"data: {event}\n\n".encode('utf-8'))
+                        self.wfile.flush()
+                        time.sleep(body.delay)
+                    return
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if status == 429:
+                    self.send_header('Retry-After', '0')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def ok(content):
+    return 200, {'choices': [{'message': {'content': content}}]}
+
+
+def call(url, times=1):
+    async def run():
+        start_http_client()
+        try:
+            client = AIClient(url, "test-key", "stub-model")
+            return [await client._call_api([{"role": "user", "content": "hi"}]) for _ in range(times)]
+        finally:
+            await close_http_client()
+    return asyncio.run(run())
+
+
+def stream(url):
+    """返回 [(片段, 到达时间), ...]"""
+    async def run():
+        start_http_client()
+        try:
+            client = AIClient(url, "test-key", "stub-model")
+            start = time.perf_counter()
+            return [(text, time.perf_counter() - start) async for text in client.explain_code_stream("print(1)", "Python")]
+        finally:
+            await close_http_client()
+    return asyncio.run(run())
+
+
+def test_reuses_connection():
+    stub = StubServer([ok("pong")])
+    try:
+        assert call(stub.url, times=3) == ["pong"] * 3
+        # 同一个长连接 (客户端端口不变)
+        assert len(set(stub.requests)) == 1
+    finally:
+        stub.close()
+
+
+def test_retries_transient_errors():
+    stub = StubServer([(503, {'error': 'busy'}), (429, {'error': 'slow down'}), ok("pong")])
+    try:
+        assert call(stub.url) == ["pong"]
+        assert len(stub.requests) == 3
+    finally:
+        stub.close()
+
+
+def test_client_error_not_retried():
+    stub = StubServer([(400, {'error': 'bad request'}), ok("pong")])
+    try:
+        try:
+            call(stub.url)
+            raise AssertionError("expected an error")
+        except Exception as e:
+            assert "400" in str(e)
+        assert len(stub.requests) == 1
+        assert ai_client.get_breaker(stub.url).state == 'closed'
+    finally:
+        stub.close()
+
+
+def test_circuit_breaker_opens():
+    stub = StubServer([(500, {'error': 'down'})])
+    try:
+        # 第一次调用: 1 次请求 + 3 次重试，第二次调用在第 5 次失败后熔断
+        for _ in range(2):
+            try:
+                call(stub.url)
+            except CircuitOpenError:
+                break
+            except Exception as e:
+                assert "500" in str(e)
+        assert ai_client.get_breaker(stub.url).state == 'open'
+        sent = len(stub.requests)
+        assert sent == ai_client.BREAKER_FAILURE_THRESHOLD
+
+        try:
+            call(stub.url)
+            raise AssertionError("expected the circuit to be open")
+        except CircuitOpenError:
+            pass
+        assert len(stub.requests) == sent
+
+        # 冷却期结束后放行一次试探请求，成功则恢复
+        stub.responses = [ok("pong")]
+        stub.requests.clear()
+        ai_client.get_breaker(stub.url).opened_at -= ai_client.BREAKER_RESET_TIMEOUT
+        assert call(stub.url) == ["pong"]
+        assert ai_client.get_breaker(stub.url).state == 'closed'
+    finally:
+        stub.close()
+
+
+def test_cancelled_trial_releases_breaker():
+    # 半开状态下的试探请求被取消 (如客户端断开) 后，下一个请求可以重新试探
+    stub = StubServer([(200, SSEStream(["slow"], delay=1.0))])
+    try:
+        breaker = ai_client.get_breaker(stub.url)
+        breaker.failures = ai_client.BREAKER_FAILURE_THRESHOLD
+        breaker.opened_at = time.monotonic() - ai_client.BREAKER_RESET_TIMEOUT
+        assert breaker.state == 'half-open'
+
+        async def cancel_trial():
+            start_http_client()
+            try:
+                client = AIClient(stub.url, "test-key", "stub-model")
+                task = asyncio.create_task(client._call_api([{"role": "user", "content": "hi"}]))
+                await asyncio.sleep(0.2)
+                assert breaker.trial_in_flight
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            finally:
+                await close_http_client()
+
+        asyncio.run(cancel_trial())
+        assert not breaker.trial_in_flight
+        assert breaker.state == 'half-open'
+
+        stub.responses = [ok("pong")]
+        assert call(stub.url) == ["pong"]
+        assert breaker.state == 'closed'
+    finally:
+        stub.close()
+
+
+def test_unreachable_provider():
+    stub = StubServer([ok("pong")])
+    url = stub.url
+    stub.close()
+    try:
+        call(url)
+        raise AssertionError("expected a connection error")
+    except Exception as e:
+        assert "无法连接" in str(e)
+
+
+def test_streams_chunks_as_they_arrive():
+    stub = StubServer([(200, SSEStream(["这段", "代码", "打印 1"], delay=0.2))])
+    try:
+        chunks = stream(stub.url)
+        assert "".join(text for text, _ in chunks) == "这段代码打印 1"
+        # 第一个片段不等整个生成结束
+        assert chunks[0][1] < chunks[-1][1] - 0.3
+    finally:
+        stub.close()
+
+
+def test_stream_retries_before_first_byte():
+    stub = StubServer([(503, {'error': 'busy'}), (200, SSEStream(["ok"]))])
+    try:
+        assert [text for text, _ in stream(stub.url)] == ["ok"]
+        assert len(stub.requests) == 2
+    finally:
+        stub.close()
+
+
+def test_stream_falls_back_to_full_response():
+    # 不支持 stream 的服务商直接返回完整 JSON
+    stub = StubServer([ok("完整解释")])
+    try:
+        assert [text for text, _ in stream(stub.url)] == ["完整解释"]
+    finally:
+        stub.close()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
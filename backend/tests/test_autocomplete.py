@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import tempfile
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core import database
+from app.services import shards, autocomplete, vocabulary
+from app.services.indexer import Indexer
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def wait_for_reload(timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while autocomplete._reloading or vocabulary._reloading:
+        assert time.monotonic() < deadline, "autocomplete reload did not finish"
+        time.sleep(0.01)
+
+
+def suggested(prefix):
+    return [s['text'] for s in autocomplete.get_autocomplete().suggest(prefix) if s['type'] == 'filename']
+
+
+def test_reload_serves_previous_snapshot():
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, 'search_index.db')
+        shards.invalidate_shards()
+        autocomplete._autocomplete = None
+        vocabulary._vocabulary = vocabulary.Vocabulary({})
+        docs = os.path.join(directory, 'docs')
+        write(os.path.join(docs, 'keep', 'efficacy_tables.txt'), "efficacy tables")
+        write(os.path.join(docs, 'drop', 'efficacy_listings.txt'), "efficacy listings")
+        try:
+            database.init_db()
+            Indexer().index_folder(docs)
+            first = autocomplete.get_autocomplete()
+            assert sorted(suggested('effi')) == ['efficacy_listings.txt', 'efficacy_tables.txt']
+
+            # 新文件增量加入已加载的索引
+            new_file = os.path.join(docs, 'keep', 'efficacy_figures.txt')
+            write(new_file, "efficacy figures")
+            Indexer().index_path(new_file)
+            assert 'efficacy_figures.txt' in suggested('effi')
+
+            # 批量删除后不在请求线程重新加载: 立即返回旧索引
+            loaded = autocomplete._load_autocomplete
+            autocomplete._load_autocomplete = lambda: (time.sleep(0.3), loaded())[1]
+            try:
+                assert Indexer().remove_path(os.path.join(docs, 'drop')) == 1
+                start = time.perf_counter()
+                assert autocomplete.get_autocomplete() is first
+                assert time.perf_counter() - start < 0.1
+                wait_for_reload()
+            finally:
+                autocomplete._load_autocomplete = loaded
+
+            assert autocomplete.get_autocomplete() is not first
+            assert sorted(suggested('effi')) == ['efficacy_figures.txt', 'efficacy_tables.txt']
+        finally:
+            wait_for_reload()
+            autocomplete._autocomplete = None
+            vocabulary._vocabulary = None
+            database.DB_PATH = original_path
+            shards.invalidate_shards()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
@@ -0,0 +1,106 @@
+import os
+import sys
+import tempfile
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core import database
+from app.services import shards, document_store
+from app.services.indexer import Indexer
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def doc_ids():
+    conn = database.get_db_connection()
+    try:
+        return {row['file_path']: row['doc_id'] for row in conn.execute("SELECT doc_id, file_path FROM documents")}
+    finally:
+        conn.close()
+
+
+def test_doc_ids_are_not_reused():
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, 'search_index.db')
+        shards.invalidate_shards()
+        docs = os.path.join(directory, 'docs')
+        for name in ('a.txt', 'b.txt', 'c.txt'):
+            write(os.path.join(docs, name), f"{name} adverse events")
+        try:
+            database.init_db()
+            Indexer().index_folder(docs)
+            before = doc_ids()
+            newest = max(before, key=before.get)
+
+            # 重新索引最新的文件 (先删除再写入) 得到新的 doc_id
+            write(newest, "revised content")
+            os.utime(newest, (os.path.getmtime(newest) + 10,) * 2)
+            Indexer().index_path(newest)
+            assert doc_ids()[newest] > before[newest]
+
+            # 删除后新文件也不会拿到已删除的 id
+            Indexer().remove_path(newest)
+            other = os.path.join(docs, 'd.txt')
+            write(other, "d.txt adverse events")
+            Indexer().index_path(other)
+            assert doc_ids()[other] > before[newest] + 1
+        finally:
+            database.DB_PATH = original_path
+            shards.invalidate_shards()
+
+
+def test_migrates_documents_table():
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, 'search_index.db')
+        shards.invalidate_shards()
+        docs = os.path.join(directory, 'docs')
+        for name in ('a.txt', 'b.txt'):
+            write(os.path.join(docs, name), f"{name} adverse events")
+        try:
+            database.init_db()
+            Indexer().index_folder(docs)
+            before = doc_ids()
+            # 旧版本的 documents 表: doc_id 没有 AUTOINCREMENT
+            conn = database.get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("ALTER TABLE documents RENAME TO documents_new")
+            cursor.execute("DROP INDEX idx_documents_path")
+            cursor.execute("""
+                CREATE TABLE documents (doc_id INTEGER PRIMARY KEY, file_path TEXT NOT NULL,
+                                        title TEXT, content BLOB, keywords TEXT)
+            """)
+            cursor.execute("INSERT INTO documents SELECT * FROM documents_new")
+            cursor.execute("DROP TABLE documents_new")
+            conn.commit()
+            assert not document_store.has_autoincrement(cursor)
+            conn.close()
+
+            Indexer().upgrade_index()
+            conn = database.get_db_connection()
+            try:
+                assert document_store.has_autoincrement(conn.cursor())
+            finally:
+                conn.close()
+            # doc_id 不变，搜索结果仍然对应原文件
+            assert doc_ids() == before
+            from app.services.search_engine import SearchEngine
+            results = SearchEngine().search('adverse events', limit=10)
+            assert sorted(res['file_path'] for res in results) == sorted(before)
+        finally:
+            database.DB_PATH = original_path
+            shards.invalidate_shards()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import tempfile
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core import database
+from app.services import shards
+from app.services.indexer import Indexer
+from app.services.search_engine import SearchEngine
+from app.services.near_duplicates import minhash_signature, similarity, DUPLICATE_THRESHOLD
+
+REPORT = " ".join(
+    f"Section {i}: the adverse event rate in arm {i % 3} was reviewed by the safety committee "
+    f"and the listing was regenerated with dataset version {i}."
+    for i in range(40)
+)
+
+
+def write(path, text, modified):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.utime(path, (modified, modified))
+
+
+def test_signature_similarity():
+    edited = REPORT.replace("Section 7:", "Section 7 (revised):")
+    assert similarity(minhash_signature(REPORT), minhash_signature(edited)) >= DUPLICATE_THRESHOLD
+    unrelated = minhash_signature("Quarterly budget planning notes for the facilities team, " * 20)
+    assert similarity(minhash_signature(REPORT), unrelated) < DUPLICATE_THRESHOLD
+    assert minhash_signature("...") is None
+
+
+def test_collapses_versions_to_newest():
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, 'data', 'search_index.db')
+        os.makedirs(os.path.dirname(database.DB_PATH))
+        shards.invalidate_shards()
+        docs = os.path.join(directory, 'docs')
+        now = time.time()
+        v1 = os.path.join(docs, 'drafts', 'safety_report_v1.txt')
+        v2 = os.path.join(docs, 'final', 'safety_report_v2_final.txt')
+        other = os.path.join(docs, 'final', 'site_visit_notes.txt')
+        write(v1, REPORT, now - 3600)
+        write(v2, REPORT.replace("Section 7:", "Section 7 (revised):"), now)
+        write(other, "Site visit notes: the adverse event log was checked at the clinic. " * 5, now - 60)
+        try:
+            database.init_db()
+            Indexer().index_folder(docs)
+            engine = SearchEngine()
+
+            results = list(engine.iter_search('adverse event'))
+            assert sorted(res['file_path'] for res in results) == sorted([v1, v2, other])
+            assert all('similar_versions' not in res for res in results)
+
+            # 两个版本折叠为最新修改的一个，并列出另一个版本；无关文件不受影响
+            results = list(engine.iter_search('adverse event', collapse=True))
+            assert sorted(res['file_path'] for res in results) == sorted([v2, other])
+            report, = [res for res in results if res['file_path'] == v2]
+            assert report['similar_versions'] == 1
+            assert [version['file_path'] for version in report['versions']] == [v1]
+            notes, = [res for res in results if res['file_path'] == other]
+            assert notes['similar_versions'] == 0 and notes['versions'] == []
+
+            # 代表版本只在搜索范围内选取
+            scoped = list(engine.iter_search('adverse event', paths=[os.path.join(docs, 'drafts')], collapse=True))
+            assert [(res['file_path'], res['similar_versions']) for res in scoped] == [(v1, 0)]
+        finally:
+            # 等待搜索线程关闭连接后再删除临时目录
+            time.sleep(0.1)
+            database.DB_PATH = original_path
+            shards.invalidate_shards()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
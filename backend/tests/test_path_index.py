@@ -0,0 +1,120 @@
+import os
+import re
+import sys
+import time
+import random
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.services import path_index
+from app.services.path_index import PathIndex, _basename, _glob_to_regex
+from app.services.pinyin_index import pinyin_initials
+
+PARTS = ['adsl', 'adae', 't_demog', 'l_ae', 'efficacy', 'final', 'v2', '报告', '样本量', 'x']
+EXTENSIONS = ['.sas', '.rtf', '.xpt', '.log', '']
+QUERIES = [
+    'adsl', 'ADSL', 'ae', 'adsl final', 'efficacy v2', 'demog_', '.sas', 'bg', 'ybl', '样本', 'ybl adsl',
+    '*.sas', 'adsl*', 't_*.rtf', 'adsl??.xpt', '[at]*', '*final*', 'study1/', 'study1/ adae', '/b/', 'zzz',
+]
+
+
+def make_paths(count, seed=0):
+    rng = random.Random(seed)
+    paths = set()
+    while len(paths) < count:
+        name = '_'.join(rng.choice(PARTS) for _ in range(rng.randint(1, 3))) + str(rng.randint(0, 30)) + rng.choice(EXTENSIONS)
+        paths.add(f"/data/{rng.choice(['study1', 'study2', 'study10'])}/{rng.choice(['a', 'b'])}/{name}")
+    return sorted(paths)
+
+
+def expected(paths, query):
+    """逐条比较的参考实现"""
+    result = set()
+    for path in paths:
+        name = _basename(path).lower()
+        initials = pinyin_initials(name) if re.search(r'[一-鿿]', name) else None
+        ok = True
+        for word in query.lower().split():
+            text = path.lower() if re.search(r'[\\/]', word) else name
+            texts = [text] if text is not name or initials is None else [text, initials]
+            if re.search(r'[*?\[]', word):
+                ok = any(re.fullmatch(_glob_to_regex(word), t, re.DOTALL) for t in texts)
+            else:
+                ok = any(word in t for t in texts)
+            if not ok:
+                break
+        if ok:
+            result.add(path)
+    return result
+
+
+def found(index, query):
+    return {res['file_path'] for res in index.search(query, limit=100000)['results']}
+
+
+def check_queries(index, paths):
+    for query in QUERIES:
+        assert found(index, query) == expected(paths, query), query
+
+
+def test_trigram_candidates_match_scan():
+    original = path_index.TRIGRAM_BLOCK_LINES
+    # 小块，覆盖跨块的倒排表
+    path_index.TRIGRAM_BLOCK_LINES = 37
+    try:
+        paths = make_paths(400)
+        index = PathIndex(paths)
+        assert index._segment.grams is not None
+        check_queries(index, paths)
+    finally:
+        path_index.TRIGRAM_BLOCK_LINES = original
+
+
+def test_scan_without_numpy():
+    original = path_index.NUMPY_AVAILABLE
+    path_index.NUMPY_AVAILABLE = False
+    try:
+        paths = make_paths(200)
+        index = PathIndex(paths)
+        assert index._segment.grams is None
+        check_queries(index, paths)
+    finally:
+        path_index.NUMPY_AVAILABLE = original
+
+
+def test_ranks_exact_and_prefix_names_first():
+    index = PathIndex(['/x/long/dir/adsl.sas', '/x/adsl.sas', '/x/t_adsl.sas', '/x/adsl_v2.sas', '/x/adsl'])
+    titles = [res['file_path'] for res in index.search('adsl')['results']]
+    assert titles == ['/x/adsl', '/x/adsl.sas', '/x/long/dir/adsl.sas', '/x/adsl_v2.sas', '/x/t_adsl.sas']
+
+
+def test_tail_and_background_rebuild():
+    original = path_index.MAX_PENDING_FILES
+    path_index.MAX_PENDING_FILES = 10
+    try:
+        paths = make_paths(300, seed=1)
+        index = PathIndex(paths[:100])
+        for path in paths[100:]:
+            index.add(path)
+        for path in paths[:50]:
+            index.remove(path)
+        live = paths[50:]
+        # 尾部的文件逐条匹配；重新拼接在后台进行，期间结果不变
+        check_queries(index, live)
+        deadline = time.monotonic() + 5
+        while index._rebuilding:
+            assert time.monotonic() < deadline, "path index rebuild did not finish"
+            time.sleep(0.01)
+        assert index._segment.count == len(live) and index._removed == 0
+        check_queries(index, live)
+    finally:
+        path_index.MAX_PENDING_FILES = original
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
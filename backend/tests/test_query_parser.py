@@ -0,0 +1,87 @@
+import os
+import sys
+import sqlite3
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.services.query_parser import parse_query, compile_query, QueryParseError
+from app.services.cjk_bigram import to_bigram_text
+
+DOCUMENTS = [
+    "Subjects were assigned by randomization and stratification by site.",
+    "Randomization is described in section 4. The protocol also covers blinding, dosing, "
+    "visit windows and the statistical analysis plan. Stratification factors are listed in section 9.",
+    "样本量计算 基于主要终点",
+]
+
+
+def smoke_index():
+    """与正式索引相同分词器的内存索引: search_index (trigram) 和 bigram_index"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE VIRTUAL TABLE search_index USING fts5(title, content, keywords, tokenize='trigram')")
+    conn.execute("CREATE VIRTUAL TABLE bigram_index USING fts5(title, content, keywords, tokenize='unicode61')")
+    for rowid, text in enumerate(DOCUMENTS, 1):
+        conn.execute("INSERT INTO search_index (rowid, title, content, keywords) VALUES (?, ?, ?, '')",
+                     (rowid, f"doc{rowid}", text))
+        conn.execute("INSERT INTO bigram_index (rowid, title, content, keywords) VALUES (?, ?, ?, '')",
+                     (rowid, f"doc{rowid}", to_bigram_text(text)))
+    return conn
+
+
+def matches(conn, query, target='search_index'):
+    expr = compile_query(parse_query(query), target)
+    return [row[0] for row in conn.execute(f"SELECT rowid FROM {target} WHERE {target} MATCH ? ORDER BY rowid", (expr,))]
+
+
+def test_compiles_terms_and_prefix():
+    assert compile_query(parse_query('adverse event')) == '("adverse"* AND "event"*)'
+    assert compile_query(parse_query('random*')) == '"random"*'
+    assert compile_query(parse_query('"hazard ratio"')) == '"hazard ratio"'
+    assert compile_query(parse_query('random*'), 'bigram_index') == '"random"*'
+
+
+def test_compiles_not_and_fields():
+    assert compile_query(parse_query('placebo NOT dose')) == '("placebo"* NOT "dose"*)'
+    assert compile_query(parse_query('title:report content:"adverse event"')) == \
+        '({title} : ("report"*) AND {content} : ("adverse event"))'
+    conn = smoke_index()
+    assert matches(conn, 'randomization NOT blinding') == [1]
+    assert matches(conn, 'title:doc2 randomization') == [2]
+
+
+def test_near_prefix_terms():
+    assert compile_query(parse_query('random* NEAR/3 stratification')).startswith('NEAR("random" "stratification"')
+    assert compile_query(parse_query('random* NEAR/3 stratification'), 'bigram_index') == \
+        'NEAR("random"* "stratification", 3)'
+    conn = smoke_index()
+    assert matches(conn, 'random* NEAR/3 stratification') == [1]
+    assert matches(conn, 'random* NEAR/3 stratification', 'bigram_index') == [1]
+
+
+def test_near_distance_in_words():
+    conn = smoke_index()
+    # 两个词之间只隔一个 "and"
+    assert matches(conn, 'randomization NEAR/1 stratification') == [1]
+    assert matches(conn, 'randomization NEAR/1 stratification', 'bigram_index') == [1]
+    # 相隔二十多个词的文档不匹配
+    assert matches(conn, 'randomization NEAR/3 stratification') == [1]
+    assert matches(conn, 'randomization NEAR stratification') == [1]
+    # 三个短语: 中间的短语也计入距离
+    assert matches(conn, 'assigned NEAR/2 randomization NEAR/2 stratification') == [1]
+
+
+def test_near_rejects_groups():
+    try:
+        parse_query('(a OR b) NEAR c')
+        raise AssertionError("expected a parse error")
+    except QueryParseError:
+        pass
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
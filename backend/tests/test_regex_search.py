@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core import database
+from app.services import shards, regex_search
+from app.services.indexer import Indexer
+from app.services.search_engine import SearchEngine
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_verifies_in_spawned_workers():
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        # 工作进程使用本进程中设置的库路径，而不是模块默认值
+        database.DB_PATH = os.path.join(directory, 'search_index.db')
+        shards.invalidate_shards()
+        docs = os.path.join(directory, 'docs')
+        write(os.path.join(docs, 'adsl.sas'), "%macro derive_adsl;\n  data adsl;\n%mend;")
+        write(os.path.join(docs, 'adae.sas'), "%macro derive_adae;\n  data adae;\n%mend;")
+        write(os.path.join(docs, 'notes.txt'), "macro notes without a definition")
+        try:
+            database.init_db()
+            Indexer().index_folder(docs)
+            regex_search.start_regex_pool()
+            pool = regex_search._get_pool()
+            assert pool is not None and pool._mp_context.get_start_method() == 'spawn'
+
+            results = list(SearchEngine().iter_regex_search(r'%macro\s+derive_\w+'))
+            assert sorted(os.path.basename(res['file_path']) for res in results) == ['adae.sas', 'adsl.sas']
+            assert all(res['snippets'][0]['line'] == 1 for res in results)
+        finally:
+            regex_search.shutdown_regex_pool()
+            database.DB_PATH = original_path
+            shards.invalidate_shards()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
@@ -0,0 +1,85 @@
+import os
+import sys
+import random
+import tempfile
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core import database
+from app.services import shards, semantic_index
+from app.services.indexer import Indexer
+from app.services.search_engine import SearchEngine, RRF_K
+from app.services.ranking import get_ranking_profile
+
+TOPICS = [
+    "adverse event reporting serious adverse event narrative",
+    "side effect safety profile tolerability reporting",
+    "randomization stratification block size allocation",
+    "pharmacokinetic concentration clearance half life",
+]
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def expected_order(conn, index, query):
+    """完整读取两路排名后的 RRF 顺序"""
+    engine = SearchEngine()
+    query_tree, _ = engine._prepare(query, 'semantic', None)
+    ranked_sql, params = engine._trigram_ranked_sql(query_tree, None, get_ranking_profile(None))
+    fts = [row['rowid'] for row in conn.execute(ranked_sql, tuple(params))]
+    fused = {}
+    for rank, rowid in enumerate(fts):
+        fused[rowid] = fused.get(rowid, 0.0) + 1.0 / (RRF_K + rank + 1)
+    for rank, (doc_id, _, _) in enumerate(index.search(query, 100000)):
+        fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused, key=lambda rowid: (-fused[rowid], rowid))
+
+
+def test_hybrid_results_page_past_candidate_window():
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, 'search_index.db')
+        shards.invalidate_shards()
+        rng = random.Random(1)
+        docs = os.path.join(directory, 'docs')
+        for i in range(1200):
+            words = TOPICS[i % len(TOPICS)].split()
+            text = ' '.join(rng.choice(words) for _ in range(40))
+            write(os.path.join(docs, f"doc_{i:04d}.txt"), f"Section {i}. {text}.")
+        try:
+            database.init_db()
+            Indexer().index_folder(docs)
+            conn = database.get_db_connection()
+            try:
+                index = semantic_index.SemanticIndex.build(conn)
+                semantic_index._semantic_index = index
+                expected = expected_order(conn, index, 'reporting')
+                paths = {row[0]: row[1] for row in conn.execute("SELECT doc_id, file_path FROM documents")}
+            finally:
+                conn.close()
+            # 两路各有数百篇命中，超过一次读取的候选数
+            assert len(expected) > 400
+
+            results = list(SearchEngine().iter_search('reporting', precision='semantic', batch_size=20))
+            assert [res['file_path'] for res in results] == [paths[rowid] for rowid in expected]
+            assert [res['rank'] for res in results] == sorted(res['rank'] for res in results)
+            # 分页读取到最后一页
+            page = SearchEngine().search('reporting', limit=50, precision='semantic', offset=len(expected) - 10)
+            assert [res['file_path'] for res in page] == [paths[rowid] for rowid in expected[-10:]]
+        finally:
+            semantic_index._semantic_index = None
+            database.DB_PATH = original_path
+            shards.invalidate_shards()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+from itertools import islice
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core import database
+from app.services import shards
+from app.services.shards import merge_ranked, databases_in_scope
+from app.services.indexer import Indexer
+from app.services.search_engine import SearchEngine
+
+
+class CountingStream:
+    """按 rank 升序产出结果的迭代器，记录读取了多少条、在哪个线程创建、是否已关闭"""
+
+    def __init__(self, ranks):
+        self.ranks = ranks
+        self.pulled = 0
+        self.thread = None
+        self.closed = threading.Event()
+
+    def __call__(self):
+        self.thread = threading.current_thread()
+        return self._iterate()
+
+    def _iterate(self):
+        try:
+            for rank in self.ranks:
+                self.pulled += 1
+                yield {'rank': rank, 'stream': self}
+        finally:
+            self.closed.set()
+
+
+def test_merges_streams_by_rank():
+    a = CountingStream([-9, -7, -3, -1])
+    b = CountingStream([-8, -6, -5])
+    c = CountingStream([])
+    merged = list(merge_ranked([a, b, c], batch_size=2))
+    assert [res['rank'] for res in merged] == [-9, -8, -7, -6, -5, -3, -1]
+    # 结果迭代器在各自的专用线程中创建
+    assert a.thread.name.startswith('shard-search') and a.thread is not b.thread
+
+
+def test_reads_lazily_and_closes_early():
+    a = CountingStream(list(range(100)))
+    b = CountingStream(list(range(50, 150)))
+    merged = merge_ranked([a, b], batch_size=2)
+    assert [res['rank'] for res in islice(merged, 3)] == [0, 1, 2]
+    # a 先读 2 条，用完后翻倍读 4 条；b 只读了首批
+    assert (a.pulled, b.pulled) == (6, 2)
+    merged.close()
+    # 提前结束时各个流都在自己的线程中关闭
+    assert a.closed.wait(2) and b.closed.wait(2)
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_shard_scoping_and_fan_out():
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, 'data', 'search_index.db')
+        os.makedirs(os.path.dirname(database.DB_PATH))
+        shards.invalidate_shards()
+        docs = os.path.join(directory, 'docs')
+        for study in ('study1', 'study2', 'study10', 'other'):
+            for i in range(3):
+                write(os.path.join(docs, study, f'{study}_{i}.txt'),
+                      f"{study} report {i}: adverse event summary" + " table" * (i + 1))
+        try:
+            database.init_db()
+            Indexer().index_folder(docs)
+            engine = SearchEngine()
+            unsharded = sorted(res['file_path'] for res in engine.search('adverse event', limit=100))
+            assert len(unsharded) == 12
+
+            study1, study10 = os.path.join(docs, 'study1'), os.path.join(docs, 'study10')
+            Indexer().build_shard(study1)
+            Indexer().build_shard(os.path.join(docs, 'study2'))
+            assert shards.document_count() == 12
+            assert shards.document_count([None]) == 6
+
+            study1_db = shards.get_shard(study1).db_path
+            study2_db = shards.get_shard(os.path.join(docs, 'study2')).db_path
+            # 分片内的范围只查询该分片；study10 不在 study1 分片内，但它的路径以 study1 开头
+            assert databases_in_scope([os.path.join(study1, 'sub')]) == [study1_db]
+            assert databases_in_scope([study1]) == [study1_db]
+            assert databases_in_scope([study10]) == [None]
+            assert set(databases_in_scope([docs])) == {None, study1_db, study2_db}
+            assert databases_in_scope([os.path.join(docs, 'study')])[0] is None
+
+            # 跨分片搜索的结果集与未分片时相同，并按 rank 排序
+            results = engine.search('adverse event', limit=100)
+            assert sorted(res['file_path'] for res in results) == unsharded
+            assert [res['rank'] for res in results] == sorted(res['rank'] for res in results)
+            scoped = engine.search('adverse event', limit=100, paths=[study1])
+            assert sorted(res['file_path'] for res in scoped) == [p for p in unsharded if p.startswith(study1 + os.sep)]
+
+            # 卸载的分片不参与搜索，范围在其中时没有可查询的库
+            shards.set_attached(study1, False)
+            assert databases_in_scope([study1]) == []
+            assert databases_in_scope([docs]) == [None, study2_db]
+            assert len(engine.search('adverse event', limit=100)) == 9
+            shards.set_attached(study1, True)
+            assert len(engine.search('adverse event', limit=100)) == 12
+
+            # 删除分片只删除文件
+            assert Indexer().remove_path(study1) == 3
+            assert shards.get_shard(study1) is None and not os.path.exists(study1_db)
+            assert len(engine.search('adverse event', limit=100)) == 9
+            # study10 与 study1 只是名称前缀相同，不受影响
+            assert len(engine.search('adverse event', limit=100, paths=[study10])) == 3
+        finally:
+            # 等待搜索线程关闭连接后再删除临时目录
+            time.sleep(0.1)
+            database.DB_PATH = original_path
+            shards.invalidate_shards()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
@@ -0,0 +1,46 @@
+import os
+import sys
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.services.snippets import SnippetBuilder, extract_locations, MAX_SCANNED_MATCHES
+
+
+def test_windows_and_locations_from_stored_offsets():
+    content = ("[Page:1] intro text. " + "filler " * 40 +
+               "[Page:2] adverse event one, adverse event two. " + "filler " * 40 +
+               "[Page:3] one adverse event here.")
+    locations = extract_locations(content)
+    assert [label for _, label in locations] == ['Page:1', 'Page:2', 'Page:3']
+    info = SnippetBuilder(['adverse event']).build(content, locations)
+    assert info['hit_count'] == 3
+    assert info['locations'] == ['Page:2', 'Page:3']
+    # 命中多的窗口在前，位置来自已存储的偏移
+    first, second = info['snippets']
+    assert first['hit_count'] == 2 and first['location']['page'] == '2'
+    assert second['hit_count'] == 1 and second['location']['page'] == '3'
+    assert first['text'].count('<b>adverse event</b>') == 2
+
+
+def test_stops_scanning_after_max_matches():
+    content = "hit " * (MAX_SCANNED_MATCHES * 3)
+    info = SnippetBuilder(['hit']).build(content)
+    assert info['hit_count'] == MAX_SCANNED_MATCHES
+    last_match = max(e for snippet in info['snippets'] for _, e in snippet['matches'])
+    assert last_match <= MAX_SCANNED_MATCHES * 4
+
+
+def test_fallback_without_matches():
+    info = SnippetBuilder(['missing']).build("[Page:4] some text " * 3, [(0, 'Page:4')], fallback_offset=9)
+    assert info['hit_count'] == 0
+    snippet, = info['snippets']
+    assert snippet['start'] == 9 and snippet['location']['page'] == '4'
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import tempfile
+
+# Add backend to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core import database
+from app.services import shards, vocabulary
+from app.services.vocabulary import Vocabulary, damerau_levenshtein
+from app.services.fuzzy_matcher import FuzzySearchEngine
+
+
+VOCAB = Vocabulary({
+    'randomization': 40, 'stratification': 25, 'placebo': 30, 'dataset': 12,
+    'adverse': 50, 'adsl': 8, 'adae': 9, 'adcm': 9, 'proc': 60,
+})
+
+
+def test_damerau_levenshtein():
+    assert damerau_levenshtein('placebo', 'placebo', 2) == 0
+    # 相邻交换算一处编辑
+    assert damerau_levenshtein('palcebo', 'placebo', 2) == 1
+    assert damerau_levenshtein('placeob', 'placebo', 2) == 1
+    assert damerau_levenshtein('plcebo', 'placebo', 2) == 1
+    # 超出上限时提前返回 max_distance + 1
+    assert damerau_levenshtein('randomization', 'stratification', 2) == 3
+
+
+def test_corrects_transpositions_and_typos():
+    assert VOCAB.corrections('palcebo') == ['placebo']
+    assert VOCAB.corrections('datsaet') == ['dataset']
+    # 长词允许两处编辑，删除变体只取前缀也能找到
+    assert VOCAB.corrections('randomizaiton') == ['randomization']
+    assert VOCAB.corrections('stratifcaton') == ['stratification']
+    # 短词只允许一处编辑
+    assert VOCAB.corrections('plcbo') == []
+    assert VOCAB.corrections('adxx') == []
+
+
+def test_skips_known_prefix_cjk_and_short_terms():
+    assert VOCAB.corrections('placebo') == []
+    # 未输完的词是已知词的前缀，不算拼错
+    assert VOCAB.corrections('rando') == []
+    # 中文和少于 3 个字符的词不纠错
+    assert VOCAB.corrections('随机化') == []
+    assert VOCAB.corrections('ae') == []
+    assert VOCAB.corrections('p1') == []
+
+
+def test_ranks_by_distance_then_frequency():
+    # 距离相同时文档频率高的在前，频率也相同时按字母顺序
+    assert [term for term, _, _ in VOCAB.lookup('adsm')] == ['adcm', 'adsl']
+    assert [term for term, _, _ in VOCAB.lookup('adce')] == ['adae', 'adcm']
+    assert VOCAB.corrections('adcx', limit=1) == ['adcm']
+    results = VOCAB.lookup('adse')
+    assert results == sorted(results, key=lambda r: (r[1], -r[2], r[0]))
+    assert [term for term, _, _ in results][:2] == ['adae', 'adsl']
+
+
+def test_expansion_puts_corrections_first():
+    vocabulary._vocabulary = VOCAB
+    try:
+        expanded = FuzzySearchEngine().expand_query('Palcebo')
+        assert expanded[:2] == ['palcebo', 'placebo']
+    finally:
+        vocabulary._vocabulary = None
+
+
+def add_document(rowid, text):
+    conn = database.get_db_connection()
+    try:
+        conn.execute("INSERT INTO bigram_index (rowid, file_path, title, content, keywords) VALUES (?, '', '', ?, '')",
+                     (rowid, text))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def wait_for_reload(timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while vocabulary._reloading:
+        assert time.monotonic() < deadline, "vocabulary reload did not finish"
+        time.sleep(0.01)
+
+
+def test_reload_serves_previous_snapshot():
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, 'search_index.db')
+        shards.invalidate_shards()
+        vocabulary._vocabulary = None
+        try:
+            database.init_db()
+            add_document(1, "randomization stratification")
+            first = vocabulary.get_vocabulary()
+            assert 'randomization' in first and 'blinding' not in first
+
+            add_document(2, "blinding")
+            # 索引变化后不在调用方线程重新加载: 立即返回旧词表
+            loaded = vocabulary._load_vocabulary
+            vocabulary._load_vocabulary = lambda: (time.sleep(0.3), loaded())[1]
+            try:
+                vocabulary.invalidate_vocabulary()
+                vocabulary.invalidate_vocabulary()
+                start = time.perf_counter()
+                assert vocabulary.get_vocabulary() is first
+                assert time.perf_counter() - start < 0.1
+                wait_for_reload()
+            finally:
+                vocabulary._load_vocabulary = loaded
+
+            second = vocabulary.get_vocabulary()
+            assert 'blinding' in second
+            assert second.generation > first.generation
+        finally:
+            wait_for_reload()
+            vocabulary._vocabulary = None
+            database.DB_PATH = original_path
+            shards.invalidate_shards()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  [OK] {name}")
@@ -7,21 +7,68 @@ const api = axios.create({
   timeout: 300000, // 5分钟超时，支持大文件夹索引
 });
 
+export interface SnippetLocation {
+  label: string;
+  page?: string;
+  slide?: string;
+  sheet?: string;
+  row?: string;
+}
+
+export interface SearchSnippet {
+  text: string;
+  start: number;
+  end: number;
+  matches: [number, number][];
+  hit_count: number;
+  location: SnippetLocation | null;
+  line?: number;
+}
+
 export interface SearchResult {
   file_path: string;
   title: string;
   highlight: string;
   rank: number;
+  snippets?: SearchSnippet[];
+  hit_count?: number;
+  hit_locations?: string[];
   match_type?: string;
   location_info?: string;
   source_query?: string;
   is_expanded?: boolean;
+  similar_versions?: number;  // 折叠的近重复版本数（collapse=true 时）
+  versions?: { file_path: string; last_modified: number | null }[];
+}
+
+export interface FacetValue<T = string> {
+  value: T;
+  count: number;
+}
+
+// 分面统计：文件类型、所属根目录、修改年份
+export interface SearchFacets {
+  file_type: FacetValue[];
+  root: FacetValue[];
+  year: FacetValue<number>[];
+}
+
+// 过滤条件（已选分面、修改时间、文件大小），下推到服务端
+export interface SearchFilters {
+  file_types?: string[];
+  folders?: string[];
+  years?: number[];
+  modified_after?: string;  // YYYY-MM-DD
+  modified_before?: string;
+  min_size?: number;  // 字节
+  max_size?: number;
 }
 
 export interface SearchResponse {
   results: SearchResult[];
   total_count: number;
   has_more: boolean;
+  facets?: SearchFacets;
 }
 
 export interface IndexResponse {
@@ -47,10 +94,12 @@ export const searchFiles = async (
   limit: number = 50,
   precision: string = 'medium',
   paths?: string[],
-  offset: number = 0
+  offset: number = 0,
+  filters: SearchFilters = {},
+  collapse: boolean = false
 ): Promise<SearchResponse> => {
   const response = await api.get<SearchResponse>('/search', {
-    params: { q: query, limit, offset, precision, paths },
+    params: { q: query, limit, offset, precision, paths, collapse, ...filters },
     paramsSerializer: {
       indexes: null // serialize arrays as paths=a&paths=b instead of paths[]=a
     }
@@ -58,6 +107,186 @@ export const searchFiles = async (
   return response.data;
 };
 
+export interface FilenameSearchResponse {
+  results: { file_path: string; title: string }[];
+  total_count: number;
+  has_more: boolean;
+  elapsed_ms: number;
+}
+
+// 文件名搜索：只匹配文件名/路径，支持通配符和拼音首字母
+export const searchFilenames = async (
+  query: string,
+  limit: number = 200,
+  paths?: string[]
+): Promise<FilenameSearchResponse> => {
+  const response = await api.get<FilenameSearchResponse>('/search/filenames', {
+    params: { q: query, limit, paths },
+    paramsSerializer: {
+      indexes: null
+    }
+  });
+  return response.data;
+};
+
+export interface SearchStreamSummary {
+  total_count: number;
+  has_more: boolean;
+  elapsed_ms: number;
+  first_result_ms: number | null;
+  cancelled?: string | null;
+  facets?: SearchFacets;
+}
+
+let activeSearchController: AbortController | null = null;
+
+// 读取 NDJSON 搜索流：结果逐条回调 onResult，返回最后的汇总帧
+// 同一搜索框中新的搜索会中止上一次仍在进行的流式搜索
+const readSearchStream = async <T extends SearchStreamSummary>(
+  path: string,
+  params: URLSearchParams,
+  onResult: (result: SearchResult) => void
+): Promise<T> => {
+  // 服务端按 group 取消被取代的旧搜索
+  params.append('group', 'searchbar');
+
+  activeSearchController?.abort();
+  const controller = new AbortController();
+  activeSearchController = controller;
+
+  let summary = { total_count: 0, has_more: false, elapsed_ms: 0, first_result_ms: null } as T;
+  let response: Response;
+  try {
+    response = await fetch(`${API_BASE_URL}${path}?${params.toString()}`, { signal: controller.signal });
+  } catch (error) {
+    if (controller.signal.aborted) return { ...summary, cancelled: 'superseded' };
+    throw error;
+  }
+  if (!response.ok || !response.body) {
+    let detail = `HTTP ${response.status}`;
+    try {
+      detail = (await response.json()).detail || detail;
+    } catch {
+      // 非 JSON 错误体，保留状态码
+    }
+    throw new Error(detail);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    let chunk: ReadableStreamReadResult<Uint8Array>;
+    try {
+      chunk = await reader.read();
+    } catch (error) {
+      if (controller.signal.aborted) return { ...summary, cancelled: 'superseded' };
+      throw error;
+    }
+    const { done, value } = chunk;
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() || '';
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const frame = JSON.parse(line);
+      if (frame.type === 'result') {
+        onResult(frame.result);
+      } else if (frame.type === 'summary') {
+        summary = frame;
+      }
+    }
+  }
+  if (activeSearchController === controller) activeSearchController = null;
+  return summary;
+};
+
+// 流式搜索：结果逐条到达时回调 onResult，结束时返回汇总信息
+export const searchFilesStream = async (
+  query: string,
+  onResult: (result: SearchResult) => void,
+  limit: number = 50,
+  precision: string = 'medium',
+  paths?: string[],
+  offset: number = 0,
+  filters: SearchFilters = {},
+  withFacets: boolean = false,
+  collapse: boolean = false
+): Promise<SearchStreamSummary> => {
+  const params = new URLSearchParams({
+    q: query,
+    limit: String(limit),
+    offset: String(offset),
+    precision,
+    facets: String(withFacets),
+    collapse: String(collapse),
+  });
+  (paths || []).forEach(p => params.append('paths', p));
+  (filters.file_types || []).forEach(t => params.append('file_types', t));
+  (filters.folders || []).forEach(f => params.append('folders', f));
+  (filters.years || []).forEach(y => params.append('years', String(y)));
+  if (filters.modified_after) params.append('modified_after', filters.modified_after);
+  if (filters.modified_before) params.append('modified_before', filters.modified_before);
+  if (filters.min_size != null) params.append('min_size', String(filters.min_size));
+  if (filters.max_size != null) params.append('max_size', String(filters.max_size));
+  return readSearchStream<SearchStreamSummary>('/search/stream', params, onResult);
+};
+
+export interface RegexSearchSummary extends SearchStreamSummary {
+  prefilter: string | null;
+  scanned: number;
+  truncated: boolean;
+}
+
+// 正则搜索：流式返回命中文档，摘要中带行号；无法预过滤时 truncated 表示扫描因超时提前结束
+export const searchRegexStream = async (
+  pattern: string,
+  onResult: (result: SearchResult) => void,
+  limit: number = 50,
+  paths?: string[],
+  caseSensitive: boolean = false
+): Promise<RegexSearchSummary> => {
+  const params = new URLSearchParams({
+    pattern,
+    limit: String(limit),
+    case_sensitive: String(caseSensitive),
+  });
+  (paths || []).forEach(p => params.append('paths', p));
+  return readSearchStream<RegexSearchSummary>('/search/regex', params, onResult);
+};
+
+export interface SimilarDocument {
+  file_path: string;
+  title: string;
+  file_type: string | null;
+  last_modified: number | null;
+  file_size: number | null;
+  similarity: number;
+}
+
+export interface SimilarDocumentsResponse {
+  file_path: string;
+  results: SimilarDocument[];
+  elapsed_ms: number;
+}
+
+// 相似文档：按索引时预计算的文档签名向量查找（其它版本、相关 TFL 等）
+export const findSimilarFiles = async (
+  filePath: string,
+  limit: number = 10,
+  paths?: string[]
+): Promise<SimilarDocumentsResponse> => {
+  const response = await api.get<SimilarDocumentsResponse>('/search/similar', {
+    params: { file_path: filePath, limit, paths },
+    paramsSerializer: {
+      indexes: null
+    }
+  });
+  return response.data;
+};
+
 export const indexFolder = async (folderPath: string): Promise<IndexResponse> => {
   const response = await api.post<IndexResponse>('/index/folder', {
     folder_path: folderPath,
@@ -131,9 +360,60 @@ export const explainCode = async (codeSnippet: string, context: string, config:
   return response.data;
 };
 
+export interface AIExplainStreamSummary {
+  elapsed_ms: number;
+  first_token_ms: number | null;
+}
+
+// 流式解释代码：文本片段到达时回调 onDelta，结束时返回耗时；服务端的错误帧抛出为 Error
+export const explainCodeStream = async (
+  codeSnippet: string,
+  context: string,
+  config: AIConfig,
+  onDelta: (text: string) => void,
+  signal?: AbortSignal
+): Promise<AIExplainStreamSummary> => {
+  const response = await fetch(`${API_BASE_URL}/ai/explain/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ code_snippet: codeSnippet, context, config }),
+    signal,
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`HTTP ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let summary: AIExplainStreamSummary = { elapsed_ms: 0, first_token_ms: null };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() || '';
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const frame = JSON.parse(line);
+      if (frame.type === 'delta') {
+        onDelta(frame.text);
+      } else if (frame.type === 'error') {
+        throw new Error(frame.message);
+      } else if (frame.type === 'done') {
+        summary = frame;
+      }
+    }
+  }
+  return summary;
+};
+
 export interface AIExpandResponse {
   original: string;
   expanded: string[];
+  cached?: boolean;
+  source?: 'thesaurus' | 'ai';  // thesaurus: 离线领域词库命中，未调用 AI
 }
 
 export const expandQueryWithAI = async (query: string, config: AIConfig, prompt?: string): Promise<AIExpandResponse> => {
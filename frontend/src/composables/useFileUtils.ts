@@ -75,7 +75,8 @@ export const formatLocation = (location: string | null): string => {
         'Col': '列',
         'Slide': '幻灯片',
         'Para': '段落',
-        'Table': '表格'
+        'Table': '表格',
+        'Line': '行号'
     }
 
     return `${typeMap[type] || type}: ${value}`